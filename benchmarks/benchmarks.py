@@ -0,0 +1,205 @@
+# -*coding: UTF-8 -*-
+#
+# Benchmarks of pyargo, in the airspeed velocity (asv) format
+#
+# time_* methods are timed, peakmem_* methods give the peak memory and track_* methods return
+# a throughput. Inputs are synthetic files (see pyargo.synthetic) written once per class by
+# setup_cache. Sizes are multiplied by the PYARGO_BENCH_SCALE environment variable (default: 1),
+# eg: PYARGO_BENCH_SCALE=30 for an index of the size of the Argo archive.
+# Run with asv from the repository root (see asv.conf.json), or without it with: python benchmarks/run.py
+#
+__author__ = 'guillaumemaze'
+
+import os
+import sys
+import time
+from functools import partial
+from pyargo import index, history, synthetic
+
+SCALE = float(os.environ.get('PYARGO_BENCH_SCALE', 1))
+IFILE = "argo_profile_detailled_index.txt"
+
+def _scaled(sizes):
+    return [max(1, int(n * SCALE)) for n in sizes]
+
+def _throughput(func, n):
+    t0 = time.time()
+    func()
+    return n / max(time.time() - t0, 1e-9)
+
+def _n_history(droot, row):
+    ds = history.open_history(os.path.join(droot, row['file']))
+    try:
+        return len(ds['N_HISTORY'])
+    finally:
+        ds.close()
+
+class IndexRead(object):
+    """Parse the detailed index text file"""
+    params = _scaled([10000, 100000])
+    param_names = ['rows']
+    timeout = 1200
+
+    def setup_cache(self):
+        droot = os.path.abspath('index_read')
+        os.makedirs(droot)
+        for n in self.params:
+            synthetic.index_file(os.path.join(droot, 'index_%i.txt' % n), n)
+        return droot
+
+    def setup(self, droot, n):
+        self.fname = os.path.join(droot, 'index_%i.txt' % n)
+
+    def time_read(self, droot, n):
+        index.read(self.fname)
+
+    def time_read_filtered(self, droot, n):
+        index.read(self.fname, columns=['file', 'date'], box=[-60., 0., 0., 60.], dates=['2005-01-01', '2015-01-01'])
+
+    def time_read_compact(self, droot, n):
+        index.read(self.fname, compact=True)
+
+    def peakmem_read(self, droot, n):
+        index.read(self.fname)
+
+    def peakmem_read_compact(self, droot, n):
+        index.read(self.fname, compact=True)
+
+    def track_read_throughput(self, droot, n):
+        return _throughput(lambda: index.read(self.fname), n)
+    track_read_throughput.unit = 'rows/s'
+
+class IndexLoad(object):
+    """Load the detailed index from its columnar cache"""
+    params = _scaled([10000, 100000])
+    param_names = ['rows']
+    timeout = 1200
+
+    def setup_cache(self):
+        droot = os.path.abspath('index_load')
+        for n in self.params:
+            d = os.path.join(droot, str(n))
+            os.makedirs(d)
+            synthetic.index_file(os.path.join(d, IFILE), n)
+            index.load(d, IFILE, cachedir=d)
+        return droot
+
+    def setup(self, droot, n):
+        self.droot = os.path.join(droot, str(n))
+
+    def time_load(self, droot, n):
+        index.load(self.droot, IFILE, cachedir=self.droot)
+
+    def time_load_columns(self, droot, n):
+        index.load(self.droot, IFILE, cachedir=self.droot, columns=['file', 'date', 'latitude', 'longitude'])
+
+    def time_load_compact(self, droot, n):
+        index.load(self.droot, IFILE, cachedir=self.droot, compact=True)
+
+    def peakmem_load(self, droot, n):
+        index.load(self.droot, IFILE, cachedir=self.droot, mmap=False)
+
+    def peakmem_load_compact(self, droot, n):
+        index.load(self.droot, IFILE, cachedir=self.droot, compact=True)
+
+    def track_load_throughput(self, droot, n):
+        return _throughput(lambda: index.load(self.droot, IFILE, cachedir=self.droot), n)
+    track_load_throughput.unit = 'rows/s'
+
+class ParTraverse(object):
+    """Open profile files of the index in parallel"""
+    params = [_scaled([200]), ['thread', 'process']]
+    param_names = ['files', 'backend']
+    timeout = 1200
+
+    def setup_cache(self):
+        droot = os.path.abspath('par_traverse')
+        for n in self.params[0]:
+            synthetic.gdac(os.path.join(droot, str(n)), n_files=n, n_history=20)
+        return droot
+
+    def setup(self, droot, n, backend):
+        self.droot = os.path.join(droot, str(n))
+        self.ai = index.read(os.path.join(self.droot, IFILE), columns=['file'])
+
+    def _run(self, backend):
+        index.par_traverse(self.ai, partial(_n_history, self.droot), num_cores=4, backend=backend)
+
+    def time_par_traverse(self, droot, n, backend):
+        self._run(backend)
+
+    def track_par_traverse_throughput(self, droot, n, backend):
+        return _throughput(lambda: self._run(backend), n)
+    track_par_traverse_throughput.unit = 'files/s'
+
+class DecodeQctest(object):
+    """Decode HISTORY_QCTEST hexadecimal values"""
+    params = [_scaled([100000]), [0., 0.1]]
+    param_names = ['values', 'corrupt']
+
+    def setup(self, n, corrupt):
+        qctest = synthetic.history_entries(n_prof=max(1, n // 10), corrupt=corrupt)['HISTORY_QCTEST'].ravel()
+        self.qctests = qctest[qctest != ''].astype('U')
+
+    def time_decodeqctest(self, n, corrupt):
+        for q in self.qctests:
+            try:
+                history.decodeqctest(q, hexa=True)
+            except ValueError:
+                pass
+
+    def time_decodeqctests(self, n, corrupt):
+        history.decodeqctests(self.qctests)
+
+    def peakmem_decodeqctests(self, n, corrupt):
+        history.decodeqctests(self.qctests)
+
+    def track_decodeqctests_throughput(self, n, corrupt):
+        return _throughput(lambda: history.decodeqctests(self.qctests), len(self.qctests))
+    track_decodeqctests_throughput.unit = 'values/s'
+
+class PrintHistory(object):
+    """Decode and print the history of mono and multi-profile files"""
+    params = [[1, 50], [20]]
+    param_names = ['n_prof', 'n_history']
+
+    def setup_cache(self):
+        droot = os.path.abspath('print_history')
+        os.makedirs(droot)
+        for n_prof in self.params[0]:
+            for n_history in self.params[1]:
+                synthetic.profile_file(os.path.join(droot, '%i_%i.nc' % (n_prof, n_history)), n_prof=n_prof,
+                                       n_history=n_history, corrupt=0.01)
+        return droot
+
+    def setup(self, droot, n_prof, n_history):
+        self.fname = os.path.join(droot, '%i_%i.nc' % (n_prof, n_history))
+        self.ds = history.open_history(self.fname)
+        self.df = history.to_frame(self.ds)
+        self.devnull = open(os.devnull, 'w')
+
+    def teardown(self, droot, n_prof, n_history):
+        self.ds.close()
+        self.devnull.close()
+
+    def time_open_history(self, droot, n_prof, n_history):
+        history.open_history(self.fname).close()
+
+    def time_to_frame(self, droot, n_prof, n_history):
+        history.to_frame(self.ds)
+
+    def time_print_history(self, droot, n_prof, n_history):
+        stdout, sys.stdout = sys.stdout, self.devnull
+        try:
+            for i_prof in range(n_prof):
+                history.print_history(self.ds, i_prof, verb=1, df=self.df)
+        finally:
+            sys.stdout = stdout
+
+    def time_format_profiles(self, droot, n_prof, n_history):
+        for i_prof, text in history.format_profiles(self.ds, verb=1, df=self.df):
+            pass
+
+    def track_print_history_throughput(self, droot, n_prof, n_history):
+        return _throughput(lambda: self.time_print_history(droot, n_prof, n_history), n_prof * n_history)
+    track_print_history_throughput.unit = 'entries/s'
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*coding: UTF-8 -*-
+#
+# Run the benchmarks of benchmarks.py without asv
+#
+# Each benchmark is run in this process for every combination of its parameters: time_* methods
+# report the best wall time of --repeat runs, peakmem_* methods the peak memory allocated during
+# the call (with tracemalloc, or the process maximum resident size if not available) and track_*
+# methods the returned throughput.
+#
+__author__ = 'guillaumemaze'
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import inspect
+import tempfile
+import itertools
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import benchmarks
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+    import resource
+
+def _peakmem(func):
+    """Peak memory (bytes) allocated while calling func"""
+    if tracemalloc is None:
+        func()
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def _timeit(func, repeat):
+    best = None
+    for i in range(repeat):
+        t0 = time.time()
+        func()
+        t = time.time() - t0
+        best = t if best is None else min(best, t)
+    return best
+
+def _combinations(cls):
+    params = getattr(cls, 'params', None)
+    if params is None:
+        return [()]
+    if getattr(cls, 'param_names', None) is not None and len(cls.param_names) == 1:
+        params = [params]
+    return list(itertools.product(*params))
+
+def _format(kind, value, unit):
+    if kind == 'time':
+        return "%.4g s" % value
+    if kind == 'peakmem':
+        return "%.1f MB" % (value / 1024. ** 2)
+    return "%.4g %s" % (value, unit)
+
+def run(pattern='.', repeat=3, verb=True):
+    """Run the benchmarks with a name matching a regular expression, return a list of results"""
+    results = []
+    for cname, cls in inspect.getmembers(benchmarks, inspect.isclass):
+        if cls.__module__ != benchmarks.__name__:
+            continue
+        names = [m for m in sorted(dir(cls)) if re.match(r'(time|peakmem|track)_', m)
+                 and re.search(pattern, "%s.%s" % (cname, m))]
+        if not names:
+            continue
+        bench = cls()
+        cache = (bench.setup_cache(),) if hasattr(bench, 'setup_cache') else ()
+        for args in _combinations(cls):
+            args = cache + tuple(args)
+            for name in names:
+                if hasattr(bench, 'setup'):
+                    bench.setup(*args)
+                try:
+                    kind = name.split('_')[0]
+                    func = getattr(bench, name)
+                    if kind == 'time':
+                        value = _timeit(lambda: func(*args), repeat)
+                    elif kind == 'peakmem':
+                        value = _peakmem(lambda: func(*args))
+                    else:
+                        value = func(*args)
+                finally:
+                    if hasattr(bench, 'teardown'):
+                        bench.teardown(*args)
+                params = dict(zip(getattr(cls, 'param_names', []), args[len(cache):]))
+                unit = getattr(func, 'unit', {'time': 's', 'peakmem': 'bytes'}.get(kind))
+                results.append({'benchmark': "%s.%s" % (cname, name), 'params': params, 'value': value,
+                                'unit': unit})
+                if verb:
+                    print("%-50s %-30s %s" % ("%s.%s" % (cname, name),
+                                              ", ".join("%s=%s" % (k, params[k]) for k in sorted(params)),
+                                              _format(kind, value, unit)))
+                    sys.stdout.flush()
+    return results
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Run pyargo benchmarks without asv. '
+                                                 'Set PYARGO_BENCH_SCALE to scale the inputs.')
+    parser.add_argument("--bench", "-b", type=str, default='.', help='Regular expression of benchmarks to run')
+    parser.add_argument("--repeat", type=int, default=3, help='Number of runs of time_* benchmarks (default: 3)')
+    parser.add_argument("--json", type=str, default=None, help='Save results into a JSON file')
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.json) if args.json else None
+    cwd, tmp = os.getcwd(), tempfile.mkdtemp(prefix='pyargo-bench-')
+    os.chdir(tmp)
+    try:
+        results = run(args.bench, repeat=args.repeat)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmp)
+    if output:
+        with open(output, 'w') as f:
+            json.dump({'scale': benchmarks.SCALE, 'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       'results': results}, f, indent=1)
@@ -0,0 +1,18 @@
+# -*coding: UTF-8 -*-
+__author__ = 'guillaumemaze'
+
+from setuptools import setup
+
+setup(name='pyargo',
+      version='0.1.0',
+      description='Read, index and analyse the history of Argo profile files',
+      author='Guillaume Maze',
+      package_dir={'': 'src'},
+      packages=['pyargo'],
+      install_requires=['numpy', 'pandas', 'xarray'],
+      extras_require={'netcdf4': ['netCDF4'],
+                      'h5netcdf': ['h5netcdf'],
+                      'arrow': ['pyarrow']},
+      entry_points={'console_scripts': ['show_argohistory = pyargo.cli:show_history',
+                                        'extract_argohistory = pyargo.cli:extract_history',
+                                        'serve_argoindex = pyargo.cli:serve_index']})
@@ -1,6 +1,44 @@
 # -*coding: UTF-8 -*-
+#
+# Submodules are imported on first access (eg: pyargo.ref only imports reftable), so that scripts and
+# tools that only need a small part of the package do not pay for pandas, xarray and netCDF4 at startup.
+# Python versions without module __getattr__ (< 3.7) import all submodules at once.
+#
 __author__ = 'guillaumemaze'
 
-import index as detailedindex
-import history
-import reftable as ref
\ No newline at end of file
+import sys
+import importlib
+
+# Attribute name: submodule name
+_SUBMODULES = {'detailedindex': 'index',
+               'history': 'history',
+               'ref': 'reftable',
+               'qcindex': 'qcindex',
+               'spatial': 'spatial',
+               'extract': 'extract',
+               'cache': 'cache',
+               'latency': 'latency',
+               'fetch': 'fetch',
+               'ragged': 'ragged',
+               'server': 'server',
+               'client': 'client',
+               'synthetic': 'synthetic',
+               'stats': 'stats',
+               'cli': 'cli'}
+
+def _load(name):
+    module = importlib.import_module('.' + _SUBMODULES[name], __name__)
+    globals()[name] = module
+    return module
+
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        if name in _SUBMODULES:
+            return _load(name)
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+    def __dir__():
+        return sorted(set(globals()) | set(_SUBMODULES))
+else:
+    for _name in sorted(_SUBMODULES):
+        _load(_name)
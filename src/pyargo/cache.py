@@ -0,0 +1,128 @@
+# -*coding: UTF-8 -*-
+#
+# Provide a persistent cache of the decoded history of profile files
+#
+# Decoded history Dataframes (see history.to_frame and history.profile_frame) are stored in a
+# SQLite database, keyed by the file path (and slice of profiles) and checked against the file
+# size and modification time. The database size is bounded: least recently used entries are
+# evicted first.
+#
+__author__ = 'guillaumemaze'
+
+import os
+import time
+import pickle
+import sqlite3
+from . import history
+from . import stats
+
+DEFAULT_STORE = os.path.join(os.path.expanduser('~'), '.pyargo', 'history.sqlite')
+DEFAULT_MAX_SIZE = 512 * 1024 ** 2  # bytes
+
+def _connect(store):
+    """Open the cache database, creating it if necessary"""
+    d = os.path.dirname(os.path.abspath(store))
+    if not os.path.isdir(d):
+        os.makedirs(d)
+    db = sqlite3.connect(store, timeout=30)
+    db.execute("CREATE TABLE IF NOT EXISTS history "
+               "(path TEXT PRIMARY KEY, size INTEGER, mtime REAL, nbytes INTEGER, atime REAL, data BLOB)")
+    db.execute("CREATE INDEX IF NOT EXISTS history_atime ON history (atime)")
+    return db
+
+def _identity(fname, profiles=None):
+    st = os.stat(fname)
+    path = os.path.abspath(fname)
+    if profiles is not None:
+        path = "%s[%s:%s]" % (path, profiles.start or 0, '' if profiles.stop is None else profiles.stop)
+    return path, st.st_size, st.st_mtime
+
+def get(fname, store=DEFAULT_STORE, profiles=None):
+    """
+        Return the cached (profile_frame, to_frame) Dataframes of a file (or of a slice of its profiles),
+        or None if not cached or if the file changed
+    """
+    path, size, mtime = _identity(fname, profiles)
+    db = _connect(store)
+    try:
+        row = db.execute("SELECT data FROM history WHERE path=? AND size=? AND mtime=?",
+                         (path, size, mtime)).fetchone()
+        if row is None:
+            stats.count('cache.miss')
+            return None
+        try:
+            value = pickle.loads(bytes(row[0]))
+        except Exception:
+            value = None
+        if not isinstance(value, tuple):
+            # Entry written by an incompatible version of pyargo or of the libraries:
+            stats.count('cache.miss')
+            return None
+        stats.count('cache.hit')
+        stats.count('cache.bytes_read', len(row[0]))
+        with db:
+            db.execute("UPDATE history SET atime=? WHERE path=?", (time.time(), path))
+        return value
+    finally:
+        db.close()
+
+def put(fname, value, store=DEFAULT_STORE, max_size=DEFAULT_MAX_SIZE, profiles=None):
+    """Store the (profile_frame, to_frame) Dataframes of a file in the cache, evict old entries above max_size bytes"""
+    path, size, mtime = _identity(fname, profiles)
+    data = pickle.dumps(tuple(value), protocol=pickle.HIGHEST_PROTOCOL)
+    db = _connect(store)
+    try:
+        with db:
+            db.execute("INSERT OR REPLACE INTO history VALUES (?, ?, ?, ?, ?, ?)",
+                       (path, size, mtime, len(data), time.time(), sqlite3.Binary(data)))
+        _evict(db, max_size)
+    finally:
+        db.close()
+
+def _evict(db, max_size):
+    """Remove least recently used entries until the cache holds less than max_size bytes"""
+    total = db.execute("SELECT COALESCE(SUM(nbytes), 0) FROM history").fetchone()[0]
+    if total <= max_size:
+        return
+    drop = []
+    for path, nbytes in db.execute("SELECT path, nbytes FROM history ORDER BY atime"):
+        if total <= max_size:
+            break
+        drop.append((path,))
+        total -= nbytes
+    with db:
+        db.executemany("DELETE FROM history WHERE path=?", drop)
+
+def clear(store=DEFAULT_STORE):
+    """Remove all entries from the cache"""
+    db = _connect(store)
+    try:
+        with db:
+            db.execute("DELETE FROM history")
+        db.execute("VACUUM")
+    finally:
+        db.close()
+
+def profiles_history(fname, store=DEFAULT_STORE, max_size=DEFAULT_MAX_SIZE, profiles=None):
+    """
+        Profiles and history Dataframes of a profile file (see history.profile_frame and history.to_frame),
+        from the cache if possible, for history.format_profiles
+
+        profiles: only decode this slice(start, stop) of profiles (see history.open_history)
+        On a miss, the file is decoded and the result is added to the cache.
+    """
+    with stats.stage('cache.get'):
+        value = get(fname, store=store, profiles=profiles)
+    if value is None:
+        ds = history.open_history(fname, profiles=profiles)
+        try:
+            value = (history.profile_frame(ds), history.to_frame(ds))
+        finally:
+            ds.close()
+        with stats.stage('cache.put'):
+            put(fname, value, store=store, max_size=max_size, profiles=profiles)
+    return value
+
+def file_history(fname, store=DEFAULT_STORE, max_size=DEFAULT_MAX_SIZE, profiles=None):
+    """History Dataframe of a profile file (see history.to_frame), from the cache if possible"""
+    return profiles_history(fname, store=store, max_size=max_size, profiles=profiles)[1]
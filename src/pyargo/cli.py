@@ -0,0 +1,219 @@
+# -*coding: UTF-8 -*-
+#
+# Command line tools of pyargo (console entry points of setup.py)
+#
+#     show_argohistory: print (or export) the history of Argo profile files
+#     extract_argohistory: extract the history of all profiles of an index into one store
+#     serve_argoindex: serve index, spatial and history queries over a local HTTP API
+#
+# Only argparse is imported to parse the command line: pandas, xarray and netCDF4 are imported by the
+# submodules a command actually uses, so that --help, argument errors and small jobs start fast.
+#
+__author__ = 'guillaumemaze'
+
+import os
+import sys
+import glob
+import argparse
+import traceback
+from . import stats
+
+def _stats_option(parser):
+    parser.add_argument("--stats", type=str, nargs='?', const='-', default=None,
+                        help='Report timers and counters of processing stages on stderr, or into a JSON file')
+
+def _cache_store(cache):
+    """Path of the decoded history cache of the --cache option ('' for the default one)"""
+    if cache == '':
+        from . import cache as hcache
+        return hcache.DEFAULT_STORE
+    return cache
+
+def text_history(fname, verb=0, profiles=None, cache=None):
+    """Text view of the history of all profiles of a file, or of a slice of its profiles
+
+        cache: path of a decoded history cache database to use (see cache.profiles_history)
+    """
+    from . import history
+    if cache is not None:
+        from . import cache as hcache
+        pf, df = hcache.profiles_history(fname, store=cache, profiles=profiles)
+        return "".join(text + "\n\n" for i_prof, text in history.format_profiles(pf, verb=verb, df=df))
+    ds = history.open_history(fname, profiles=profiles)
+    try:
+        return "".join(text + "\n\n" for i_prof, text in history.format_profiles(ds, verb=verb))
+    finally:
+        ds.close()
+
+def work(args):
+    """Process a file, or a slice of its profiles, in a worker, return (file, output, error, statistics)"""
+    fname, fmt, verb, collect, profiles, cache = args
+    if collect:
+        stats.reset()
+    try:
+        if fmt == 'text':
+            result, error = text_history(fname, verb=verb, profiles=profiles, cache=cache), None
+        else:
+            from . import extract
+            result, error = extract.file_history(fname, profiles=profiles, cache=cache), None
+    except Exception:
+        result, error = None, traceback.format_exc()
+    return fname, result, error, stats.report() if collect else None
+
+def iter_tasks(files, fmt, verb, collect, chunk, cache=None):
+    """Tasks of work: one per file, or one per chunk of profiles for files with more than chunk profiles
+
+        Chunks bound the memory used for multi-profile files (*_prof.nc) and let workers share their
+        profiles. Other files hold a few profiles only and are not opened here to count them.
+    """
+    from . import history
+    for fname in files:
+        try:
+            multi = chunk > 0 and os.path.basename(fname).endswith('_prof.nc')
+            n_prof = history.count_profiles(fname) if multi else 0
+        except Exception:
+            n_prof = 0  # The error is reported when processing the file
+        if n_prof <= chunk:
+            yield (fname, fmt, verb, collect, None, cache)
+        else:
+            for start in range(0, n_prof, chunk):
+                yield (fname, fmt, verb, collect, slice(start, start + chunk), cache)
+
+def list_files(args):
+    """List the files to process from command line arguments"""
+    files = []
+    for pattern in args.ncfile:
+        matches = sorted(glob.glob(pattern))
+        files.extend(matches if matches else [pattern])
+    if args.index is not None:
+        from . import index as detailedindex
+        droot = args.droot if args.droot is not None else os.path.dirname(args.index)
+        ai = detailedindex.read(args.index, columns=['file'], dac=args.dac)
+        files.extend(os.path.join(droot, f) for f in ai['file'])
+    return files
+
+def show_history(argv=None):
+    """Print Argo profile HISTORY, return the exit status"""
+    parser = argparse.ArgumentParser(prog='show_argohistory', description='Print Argo profile HISTORY')
+    parser.add_argument('ncfile', metavar='ncfile', type=str, nargs='*', help='Netcdf files (or glob patterns) to scan')
+    parser.add_argument("--index", type=str, default=None, help='Scan all files of an Argo detailed index file')
+    parser.add_argument("--droot", type=str, default=None, help='Root directory of index files (default: index directory)')
+    parser.add_argument("--dac", type=str, nargs='+', default=None, help='Only scan these DACs of the index')
+    parser.add_argument("--format", "-f", type=str, default='text', choices=['text', 'jsonl', 'csv', 'parquet'],
+                        help='Output format (default: text)')
+    parser.add_argument("--output", "-o", type=str, default=None, help='Output file (default: stdout)')
+    parser.add_argument("--verbose", "-v", action='count', default=0, help='Detailed text view')
+    parser.add_argument("--ncpu", type=int, default=1, help='Number of workers (default: 1)')
+    parser.add_argument("--chunk", type=int, default=500,
+                        help='Number of profiles of multi-profile files processed at once, 0 for whole files '
+                             '(default: 500)')
+    parser.add_argument("--cache", type=str, nargs='?', const='', default=None,
+                        help='Use a cache of decoded history, only decoding new and modified files '
+                             '(default cache: ~/.pyargo/history.sqlite)')
+    _stats_option(parser)
+    args = parser.parse_args(argv)
+    if args.stats is not None:
+        stats.enable()
+
+    files = list_files(args)
+    if not files:
+        parser.error("No file to scan")
+    if args.format == 'parquet' and args.output is None:
+        parser.error("Parquet format requires an --output file")
+
+    out = sys.stdout if args.output is None or args.format == 'parquet' else open(args.output, 'w')
+    collect = args.stats is not None and args.ncpu > 1
+    tasks = iter_tasks(files, args.format, min(args.verbose, 1), collect, args.chunk, _cache_store(args.cache))
+    if args.ncpu > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(args.ncpu)
+        results = pool.imap(work, tasks, chunksize=1 if args.chunk > 0 else 4)
+    else:
+        pool = None
+        results = (work(t) for t in tasks)
+
+    frames, failed, header = [], 0, True
+    for fname, result, error, worker_stats in results:
+        if worker_stats is not None:
+            stats.merge(worker_stats)
+        if error is not None:
+            sys.stderr.write("Error with %s:\n%s\n" % (fname, error))
+            failed += 1
+        elif args.format == 'text':
+            out.write(result)
+        elif args.format == 'jsonl':
+            if len(result):
+                out.write(result.to_json(orient='records', lines=True, date_format='iso').rstrip('\n') + '\n')
+        elif args.format == 'csv':
+            result.to_csv(out, index=False, header=header)
+            header = False
+        else:
+            frames.append(result)
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+    if args.format == 'parquet':
+        import pandas as pd
+        from . import extract
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=extract.COLUMNS)
+        df.to_parquet(args.output, index=False)
+    if out is not sys.stdout:
+        out.close()
+    if args.stats is not None:
+        stats.write(args.stats)
+    return 1 if failed else 0
+
+def extract_history(argv=None):
+    """Extract the HISTORY of all Argo profiles of an index into one store, return the exit status"""
+    parser = argparse.ArgumentParser(prog='extract_argohistory',
+                                     description='Extract the HISTORY of all Argo profiles of an index into one '
+                                                 'store. Run again to complete an interrupted extraction.')
+    parser.add_argument('droot', type=str, help='Root directory of the Argo profile files and index')
+    parser.add_argument('store', type=str, help='Output store directory')
+    parser.add_argument("--index", type=str, default="argo_profile_detailled_index.txt", help='Index file name in droot')
+    parser.add_argument("--dac", type=str, nargs='+', default=None, help='Only extract these DACs')
+    parser.add_argument("--ncpu", type=int, default=None, help='Number of workers (default: number of cores)')
+    parser.add_argument("--batch", type=int, default=100000, help='Number of history entries per part of the store')
+    _stats_option(parser)
+    args = parser.parse_args(argv)
+    if args.stats is not None:
+        stats.enable()
+
+    from . import index as detailedindex
+    from . import extract
+    ai = detailedindex.read(os.path.join(args.droot, args.index), columns=['file'], dac=args.dac)
+    errors = extract.extract(ai, args.droot, args.store, batch=args.batch,
+                             num_cores=args.ncpu or 'ncpu', progress=True)
+    for fname in errors.index:
+        sys.stderr.write("Failed to extract %s:\n%s\n" % (fname, errors[fname]))
+    if args.stats is not None:
+        stats.write(args.stats)
+    return 1 if len(errors) else 0
+
+def serve_index(argv=None):
+    """Load an Argo index once and serve queries until interrupted, return the exit status"""
+    parser = argparse.ArgumentParser(prog='serve_argoindex',
+                                     description='Load an Argo index once and serve index, spatial and history '
+                                                 'queries over a local HTTP API (see pyargo.client)')
+    parser.add_argument('droot', type=str, help='Root directory of the Argo profile files and index')
+    parser.add_argument("--index", type=str, default="argo_profile_detailled_index.txt", help='Index file name in droot')
+    parser.add_argument("--cachedir", type=str, default='.', help='Index cache directory (default: .)')
+    parser.add_argument("--store", type=str, default=None, help='Ragged history store (default: decode profile files)')
+    parser.add_argument("--host", type=str, default='127.0.0.1', help='Address to listen on')
+    parser.add_argument("--port", type=int, default=8765, help='Port to listen on')
+    parser.add_argument("--res", type=float, default=1., help='Resolution of the spatial index (degrees)')
+    parser.add_argument("--cache", type=str, default='',
+                        help='Cache of decoded history (default: ~/.pyargo/history.sqlite)')
+    parser.add_argument("--no-cache", action='store_true', help='Decode the history of profile files on each query')
+    parser.add_argument("--verbose", "-v", action='store_true', help='Log queries')
+    args = parser.parse_args(argv)
+
+    from . import server
+    try:
+        server.serve(args.droot, args.index, cachedir=args.cachedir, store=args.store, host=args.host,
+                     port=args.port, res=args.res, verb=args.verbose,
+                     cache=None if args.no_cache else _cache_store(args.cache))
+    except KeyboardInterrupt:
+        pass
+    return 0
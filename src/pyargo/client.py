@@ -0,0 +1,80 @@
+# -*coding: UTF-8 -*-
+#
+# Query an Argo index server (see server)
+#
+__author__ = 'guillaumemaze'
+
+import json
+import numpy as np
+try:
+    from urllib.request import urlopen
+    from urllib.error import HTTPError
+    from urllib.parse import urlencode
+except ImportError:
+    from urllib2 import urlopen, HTTPError
+    from urllib import urlencode
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# Defined here (and used by server) so that clients do not import the server, pandas and the index
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_URL = 'http://%s:%i' % (DEFAULT_HOST, DEFAULT_PORT)
+
+class QueryError(Exception):
+    """Raised when the server can not answer a query"""
+    pass
+
+def _params(**kwargs):
+    """Query string of parameters, lists are comma separated and qc is a dictionary of flags"""
+    params = []
+    for name in sorted(kwargs):
+        value = kwargs[name]
+        if value is None:
+            continue
+        if name == 'qc':
+            for col in sorted(value):
+                params.append(('qc', '%s:%s' % (col, ','.join(str(f) for f in np.atleast_1d(value[col])))))
+        elif isinstance(value, (list, tuple, np.ndarray)):
+            params.append((name, ','.join(str(v) for v in value)))
+        else:
+            params.append((name, str(value)))
+    return urlencode(params)
+
+def query(name, url=DEFAULT_URL, timeout=600, **kwargs):
+    """Send a query to the server, return a Dataframe (or a dictionary for 'info')"""
+    try:
+        resp = urlopen("%s/%s?%s" % (url.rstrip('/'), name, _params(**kwargs)), timeout=timeout)
+    except HTTPError as error:
+        raise QueryError(error.read().decode('utf-8', 'replace'))
+    try:
+        body = resp.read()
+        if resp.info().get('Content-Type') == 'application/json':
+            return json.loads(body.decode('utf-8'))
+        if pa is None:
+            raise ImportError("pyarrow is required to read the tables of index queries")
+        return pa.ipc.open_stream(pa.py_buffer(body)).read_pandas()
+    finally:
+        resp.close()
+
+def select(url=DEFAULT_URL, **kwargs):
+    """Index rows matching predicates, see index.iter_read for box, dates, dac, profiler_type, qc and columns"""
+    return query('select', url=url, **kwargs)
+
+def radius(lon, lat, radius, dates=None, columns=None, url=DEFAULT_URL):
+    """Index rows of profiles within radius km of a point, sorted by 'distance'"""
+    return query('radius', url=url, lon=lon, lat=lat, radius=radius, dates=dates, columns=columns)
+
+def nearest(lon, lat, k=1, dates=None, columns=None, url=DEFAULT_URL):
+    """Index rows of the k profiles nearest to a point, sorted by 'distance'"""
+    return query('nearest', url=url, lon=lon, lat=lat, k=k, dates=dates, columns=columns)
+
+def history(wmo=None, file=None, url=DEFAULT_URL):
+    """History entries of a float or of a profile file, like extract.read"""
+    return query('history', url=url, wmo=wmo, file=file)
+
+def info(url=DEFAULT_URL):
+    """Number of profiles, columns and history sources of the server"""
+    return query('info', url=url)
@@ -0,0 +1,68 @@
+# -*coding: UTF-8 -*-
+#
+# Provide a fast parser of Argo dates
+#
+# Argo dates are fixed width YYYYMMDDHHMISS strings, in netcdf character arrays
+# (HISTORY_DATE, DATE_CREATION, DATE_UPDATE) and in index files (date, date_update, ...).
+#
+__author__ = 'guillaumemaze'
+
+import numpy as np
+
+WIDTH = 14
+
+def _codes(a):
+    """Return the characters codes of an array of dates as a (..., width) integer array, with width >= 14"""
+    a = np.asarray(a)
+    if a.dtype.kind == 'S' and a.dtype.itemsize == 1 and a.ndim > 0 and a.shape[-1] == WIDTH:
+        # Netcdf character array:
+        a = np.ascontiguousarray(a).view('S%i' % WIDTH)[..., 0]
+    if a.dtype.kind == 'O':
+        try:
+            a = a.astype('S')
+        except UnicodeEncodeError:
+            a = a.astype('U')
+    elif a.dtype.kind not in 'SU':
+        a = a.astype('S')
+    if a.dtype.kind == 'U':
+        width = max(a.dtype.itemsize // 4, WIDTH)
+        a = np.ascontiguousarray(a.astype('U%i' % width))
+        return a.view(np.uint32).reshape(a.shape + (width,)), a.shape
+    width = max(a.dtype.itemsize, WIDTH)
+    a = np.ascontiguousarray(a.astype('S%i' % width))
+    return a.view(np.uint8).reshape(a.shape + (width,)), a.shape
+
+def parse(a):
+    """
+        Convert an array of YYYYMMDDHHMISS dates to datetime64[s]
+
+        a can be an array of bytes or strings, an object array (eg: a Pandas column), or a netcdf character
+        array with a last dimension of length 14. Blank or invalid entries (wrong width, non digits,
+        impossible dates, or outside of the datetime64[ns] range) are NaT.
+    """
+    codes, shape = _codes(a)
+    codes = codes.reshape(-1, codes.shape[-1])
+    d = codes[:, :WIDTH].astype(np.int64) - ord('0')
+    valid = ((d >= 0) & (d <= 9)).all(axis=1)
+    # Characters beyond the 14th must be blank:
+    valid &= ((codes[:, WIDTH:] == 0) | (codes[:, WIDTH:] == ord(' '))).all(axis=1)
+    d = np.where(valid[:, np.newaxis], d, 0)
+
+    def field(start, width):
+        v = np.zeros(len(d), dtype=np.int64)
+        for i in range(start, start + width):
+            v = v * 10 + d[:, i]
+        return v
+    Y, M, D = field(0, 4), field(4, 2), field(6, 2)
+    h, mi, s = field(8, 2), field(10, 2), field(12, 2)
+
+    valid &= (Y >= 1678) & (Y <= 2261) & (M >= 1) & (M <= 12)
+    M = np.where(valid, M, 1)
+    Y = np.where(valid, Y, 1970)
+    month = ((Y - 1970) * 12 + M - 1).astype('datetime64[M]')
+    ndays = ((month + 1).astype('datetime64[D]') - month.astype('datetime64[D]')).astype(np.int64)
+    valid &= (D >= 1) & (D <= ndays) & (h < 24) & (mi < 60) & (s < 60)
+
+    t = month.astype('datetime64[s]') + ((D - 1) * 86400 + h * 3600 + mi * 60 + s).astype('timedelta64[s]')
+    t[~valid] = np.datetime64('NaT')
+    return t.reshape(shape)
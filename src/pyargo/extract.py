@@ -0,0 +1,157 @@
+# -*coding: UTF-8 -*-
+#
+# Extract the history of many Argo profile files into one consolidated store
+#
+# The store is a directory of Parquet files (part-XXXXX.parquet), each with the history
+# entries of a batch of profile files, keyed by 'file', 'N_PROF' and 'N_HISTORY'.
+# Every part comes with the list of the profile files it covers (_part-XXXXX.files),
+# so that an interrupted extraction can be restarted where it stopped.
+# The listing is the commit record of a part: it is written last, parts without a listing
+# (left by an interruption) are ignored and deleted on restart, and only the rows of the
+# files of its listing are read from a part.
+#
+__author__ = 'guillaumemaze'
+
+import os
+import glob
+from functools import partial
+import pandas as pd
+from . import history
+from . import cache as hcache
+from . import index as detailedindex
+
+COLUMNS = ['file', 'N_PROF', 'N_HISTORY', 'JULD', 'DATE_CREATION', 'DATE_UPDATE'] + \
+          history.HISTORY_STRINGS + ['HISTORY_DATE'] + history.HISTORY_FLOATS
+
+def file_history(fname, droot='', profiles=None, cache=None):
+    """Decode the history of one profile file into a Dataframe with a 'file' column
+
+        profiles: only decode this slice(start, stop) of profiles (see history.open_history)
+        cache: path of a decoded history cache database to use (see cache.file_history)
+    """
+    if cache is not None:
+        df = history.drop_empty_entries(hcache.file_history(os.path.join(droot, fname), store=cache,
+                                                            profiles=profiles))
+    else:
+        ds = history.open_history(os.path.join(droot, fname), profiles=profiles)
+        try:
+            df = history.to_frame(ds, drop_empty=True)
+        finally:
+            ds.close()
+    df.insert(0, 'file', fname)
+    return df[COLUMNS]
+
+def _row_history(droot, row):
+    return file_history(row['file'], droot)
+
+def _listing(part):
+    """Listing file of a part"""
+    return os.path.join(os.path.dirname(part), '_' + os.path.basename(part)[:-len('.parquet')] + '.files')
+
+def _read_listing(listing):
+    with open(listing) as f:
+        return [line.rstrip('\n') for line in f]
+
+def _parts(store):
+    """Committed parts of a store, ie with a listing"""
+    return [p for p in sorted(glob.glob(os.path.join(store, 'part-*.parquet'))) if os.path.isfile(_listing(p))]
+
+def _clean(store):
+    """Delete parts without listing and temporary files left by an interrupted extraction"""
+    for f in glob.glob(os.path.join(store, '*.tmp')) + glob.glob(os.path.join(store, 'part-*.parquet')):
+        if f.endswith('.tmp') or not os.path.isfile(_listing(f)):
+            os.remove(f)
+
+def done_files(store):
+    """Set of profile files already extracted into a store"""
+    done = set()
+    for p in _parts(store):
+        done.update(_read_listing(_listing(p)))
+    return done
+
+def _write_part(store, frames, files):
+    """Write a batch of history Dataframes as the next part of the store, its listing last"""
+    n = len(_parts(store))
+    name = os.path.join(store, 'part-%05i' % n)
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=COLUMNS)
+    df.to_parquet(name + '.parquet.tmp', index=False)
+    os.rename(name + '.parquet.tmp', name + '.parquet')
+    listing = os.path.join(store, '_part-%05i.files' % n)
+    with open(listing + '.tmp', 'w') as f:
+        f.write(''.join(fname + '\n' for fname in files))
+    os.rename(listing + '.tmp', listing)
+
+def extract(ai, droot, store, batch=100000, num_cores='ncpu', chunksize=16, backend='process', progress=False):
+    """
+        Extract the history of all profile files of an index Dataframe into a store
+
+        Files are opened and decoded in parallel with index.iter_traverse, results are appended to the store
+        by parts of about batch history entries. Files already in the store are skipped, so that the same
+        command can be run again to complete an interrupted extraction.
+        Return a Series with the traceback of the files that could not be extracted.
+    """
+    if not os.path.isdir(store):
+        os.makedirs(store)
+    _clean(store)
+    done = done_files(store)
+    todo = ai[~ai['file'].isin(done)]
+
+    frames, files, nrows, errors = [], [], 0, {}
+    for i, df, error in detailedindex.iter_traverse(todo, partial(_row_history, droot), num_cores=num_cores,
+                                                    chunksize=chunksize, backend=backend, progress=progress):
+        if error is not None:
+            errors[todo.loc[i, 'file']] = error
+            continue
+        frames.append(df)
+        files.append(todo.loc[i, 'file'])
+        nrows += len(df)
+        if nrows >= batch:
+            _write_part(store, frames, files)
+            frames, files, nrows = [], [], 0
+    if files:
+        _write_part(store, frames, files)
+    return pd.Series(errors, dtype=object)
+
+def remove(store, files):
+    """Remove the history entries of some profile files from a store, so that they can be extracted again
+
+        The listing of a part is rewritten before the part itself: if interrupted in between, the rows
+        left in the part are not read since their files are no longer listed.
+    """
+    files = set(files)
+    for part in _parts(store):
+        listing = _listing(part)
+        covered = _read_listing(listing)
+        if not files.intersection(covered):
+            continue
+        with open(listing + '.tmp', 'w') as f:
+            f.write(''.join(fname + '\n' for fname in covered if fname not in files))
+        os.rename(listing + '.tmp', listing)
+        df = pd.read_parquet(part)
+        df = df[~df['file'].isin(files)]
+        df.to_parquet(part + '.tmp', index=False)
+        os.rename(part + '.tmp', part)
+
+def update(store, droot, added, modified, removed, **kwargs):
+    """
+        Update a store with the changes of an index (see index.refresh)
+
+        History of modified and removed files is removed from the store, and history of added and
+        modified files is extracted. Other arguments are passed to extract.
+    """
+    remove(store, list(modified['file']) + list(removed['file']))
+    return extract(pd.concat([added, modified]), droot, store, **kwargs)
+
+def _read_part(part, columns=None):
+    """Rows of a part for the files of its listing"""
+    names = None if columns is None else list(columns) + (['file'] if 'file' not in columns else [])
+    df = pd.read_parquet(part, columns=names)
+    df = df[df['file'].isin(_read_listing(_listing(part)))]
+    return df if columns is None else df[list(columns)]
+
+def read(store, columns=None):
+    """Read the history entries of a store, only the given columns if provided"""
+    parts = _parts(store)
+    if not parts:
+        return pd.DataFrame(columns=columns or COLUMNS)
+    return pd.concat([_read_part(p, columns=columns) for p in parts], ignore_index=True)
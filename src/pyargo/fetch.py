@@ -0,0 +1,282 @@
+# -*coding: UTF-8 -*-
+#
+# Fetch Argo profile files from a GDAC (or any HTTP mirror)
+#
+# Files of index rows are downloaded concurrently by a pool of threads, each thread keeping its
+# HTTP connections open between requests. Downloads are retried with an exponential backoff.
+#
+# Downloaded files are kept in a content-addressed local cache: objects/<sha1[:2]>/<sha1>, with
+# a SQLite table mapping each file URL (and 'date_update' of the index row, if any) to its content.
+# The cache size is bounded: least recently used files are evicted first.
+#
+__author__ = 'guillaumemaze'
+
+import os
+import time
+import shutil
+import sqlite3
+import hashlib
+import threading
+from functools import partial
+import pandas as pd
+from . import index as detailedindex
+from . import stats
+try:
+    import http.client as httplib
+    from urllib.parse import urlsplit, urljoin, quote
+except ImportError:
+    import httplib
+    from urlparse import urlsplit, urljoin
+    from urllib import quote
+
+DEFAULT_HOST = 'https://data-argo.ifremer.fr'
+DEFAULT_CACHE = os.path.join(os.path.expanduser('~'), '.pyargo', 'gdac')
+DEFAULT_MAX_SIZE = 8 * 1024 ** 3  # bytes
+BLOCKSIZE = 1 << 16
+
+class FetchError(Exception):
+    """Raised when a file can not be downloaded"""
+    pass
+
+_local = threading.local()
+
+def url(fname, host=DEFAULT_HOST):
+    """URL of a profile file (path relative to the GDAC 'dac' directory, as in the index 'file' column)"""
+    return "%s/dac/%s" % (host.rstrip('/'), quote(fname))
+
+def _connection(scheme, netloc, timeout):
+    """HTTP connection of the current thread to a server, opened on first use"""
+    if not hasattr(_local, 'connections'):
+        _local.connections = {}
+    key = (scheme, netloc)
+    if key not in _local.connections:
+        if scheme == 'https':
+            _local.connections[key] = httplib.HTTPSConnection(netloc, timeout=timeout)
+        else:
+            _local.connections[key] = httplib.HTTPConnection(netloc, timeout=timeout)
+    return _local.connections[key]
+
+def _drop_connection(scheme, netloc):
+    conn = getattr(_local, 'connections', {}).pop((scheme, netloc), None)
+    if conn is not None:
+        conn.close()
+
+def _get(link, dest, timeout=60, redirects=5):
+    """
+        Download a URL into a file over the thread connections, return the sha1 and size of the content
+
+        Raise FetchError for HTTP errors (with a 'retry' attribute for 5xx and 429 errors),
+        and socket errors for connection problems.
+    """
+    for i in range(redirects + 1):
+        stats.count('fetch.requests')
+        parts = urlsplit(link)
+        path = parts.path + ('?' + parts.query if parts.query else '')
+        conn = _connection(parts.scheme, parts.netloc, timeout)
+        try:
+            conn.request('GET', path or '/')
+            resp = conn.getresponse()
+            if resp.status in (301, 302, 303, 307, 308):
+                resp.read()
+                link = urljoin(link, resp.getheader('Location'))
+                continue
+            if resp.status != 200:
+                resp.read()
+                error = FetchError("HTTP error %i for %s" % (resp.status, link))
+                error.retry = resp.status >= 500 or resp.status == 429
+                raise error
+            sha1, size = hashlib.sha1(), 0
+            with open(dest, 'wb') as f:
+                for block in iter(partial(resp.read, BLOCKSIZE), b''):
+                    sha1.update(block)
+                    f.write(block)
+                    size += len(block)
+            return sha1.hexdigest(), size
+        except FetchError:
+            raise
+        except Exception:
+            # Connection may be in a bad state, open a new one on the next request:
+            _drop_connection(parts.scheme, parts.netloc)
+            raise
+    raise FetchError("Too many redirections for %s" % link)
+
+def download(link, cachedir=DEFAULT_CACHE, retries=3, backoff=1., timeout=60):
+    """
+        Download a URL into the objects of a cache directory, return its sha1 and size
+
+        Connection errors and HTTP 5xx/429 errors are retried up to retries times, after waiting
+        backoff, 2*backoff, 4*backoff, ... seconds. The cache database is not updated (see fetch).
+    """
+    tmp = os.path.join(cachedir, 'tmp', '%i-%i' % (os.getpid(), threading.current_thread().ident))
+    for attempt in range(retries + 1):
+        try:
+            sha1, size = _get(link, tmp, timeout=timeout)
+            break
+        except Exception as error:
+            if attempt == retries or not getattr(error, 'retry', not isinstance(error, FetchError)):
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise
+            stats.count('fetch.retry')
+            time.sleep(backoff * 2 ** attempt)
+    stats.count('fetch.bytes_downloaded', size)
+    obj = _object(cachedir, sha1)
+    if not os.path.isdir(os.path.dirname(obj)):
+        try:
+            os.makedirs(os.path.dirname(obj))
+        except OSError:
+            # Created by another thread
+            pass
+    if os.path.exists(obj):
+        os.remove(tmp)
+    else:
+        os.rename(tmp, obj)
+    return sha1, size
+
+def _object(cachedir, sha1):
+    return os.path.join(cachedir, 'objects', sha1[:2], sha1)
+
+def _connect(cachedir):
+    """Open the cache database, creating the cache directory if necessary"""
+    for d in [cachedir, os.path.join(cachedir, 'tmp')]:
+        if not os.path.isdir(d):
+            os.makedirs(d)
+    db = sqlite3.connect(os.path.join(cachedir, 'refs.sqlite'), timeout=30)
+    db.execute("CREATE TABLE IF NOT EXISTS refs "
+               "(url TEXT PRIMARY KEY, version TEXT, sha1 TEXT, size INTEGER, atime REAL)")
+    db.execute("CREATE INDEX IF NOT EXISTS refs_atime ON refs (atime)")
+    return db
+
+def _evict(db, cachedir, max_size, keep=()):
+    """
+        Remove least recently used files until the cache objects take less than max_size bytes
+
+        Files of the URLs in keep (eg: requested by the current fetch) are never removed, so the cache
+        may stay larger than max_size when they do not fit.
+    """
+    sizes = dict(db.execute("SELECT sha1, MAX(size) FROM refs GROUP BY sha1").fetchall())
+    total = sum(sizes.values())
+    if total <= max_size:
+        return
+    keep = set(keep)
+    refs = dict((sha1, 0) for sha1 in sizes)
+    for (sha1,) in db.execute("SELECT sha1 FROM refs"):
+        refs[sha1] += 1
+    drop = []
+    for link, sha1 in db.execute("SELECT url, sha1 FROM refs ORDER BY atime").fetchall():
+        if total <= max_size:
+            break
+        if link in keep:
+            continue
+        drop.append((link,))
+        refs[sha1] -= 1
+        if refs[sha1] == 0:
+            total -= sizes[sha1]
+            obj = _object(cachedir, sha1)
+            if os.path.exists(obj):
+                os.remove(obj)
+    stats.count('fetch.evicted', len(drop))
+    with db:
+        db.executemany("DELETE FROM refs WHERE url=?", drop)
+
+def _version(row):
+    return str(row['date_update']) if 'date_update' in row else ''
+
+def _fetch_row(options, row):
+    return download(url(row['file'], options['host']), options['cachedir'], retries=options['retries'],
+                    backoff=options['backoff'], timeout=options['timeout'])
+
+def iter_fetch(ai, host=DEFAULT_HOST, cachedir=DEFAULT_CACHE, max_size=DEFAULT_MAX_SIZE, num_workers=8,
+               retries=3, backoff=1., timeout=60, progress=False):
+    """
+        Fetch the profile files of index rows into a local cache, and yield (index, path, error) tuples
+
+        Files already in the cache (with the same 'date_update' if the index has this column) are not
+        downloaded again. Other files are downloaded by num_workers threads, which is also the maximum
+        number of requests in flight. path is the local path of the file content in the cache, or
+        None if it could not be downloaded, in which case error is the traceback.
+        Least recently used files of previous calls are evicted to keep the cache under max_size bytes,
+        files of the index rows are kept even if they do not fit.
+        See download for retries and backoff, and index.iter_traverse for progress.
+    """
+    db = _connect(cachedir)
+    try:
+        todo, hits, links = [], [], set()
+        for i, row in ai.iterrows():
+            link, version = url(row['file'], host), _version(row)
+            links.add(link)
+            hit = db.execute("SELECT sha1 FROM refs WHERE url=? AND version=?", (link, version)).fetchone()
+            if hit is not None and os.path.exists(_object(cachedir, hit[0])):
+                hits.append((i, link, _object(cachedir, hit[0])))
+            else:
+                todo.append(i)
+        now = time.time()
+        with db:
+            db.executemany("UPDATE refs SET atime=? WHERE url=?", [(now, link) for i, link, path in hits])
+        stats.count('fetch.hit', len(hits))
+        stats.count('fetch.miss', len(todo))
+        # Make room before downloading, without removing the files of this call:
+        _evict(db, cachedir, max_size, keep=links)
+        for i, link, path in hits:
+            yield i, path, None
+
+        options = {'host': host, 'cachedir': cachedir, 'retries': retries, 'backoff': backoff, 'timeout': timeout}
+        rows = ai.loc[todo]
+        for i, result, error in detailedindex.iter_traverse(rows, partial(_fetch_row, options),
+                                                            num_cores=num_workers, chunksize=1,
+                                                            backend='thread', progress=progress):
+            if error is not None:
+                yield i, None, error
+                continue
+            sha1, size = result
+            row = rows.loc[i]
+            with db:
+                db.execute("INSERT OR REPLACE INTO refs VALUES (?, ?, ?, ?, ?)",
+                           (url(row['file'], host), _version(row), sha1, size, time.time()))
+            yield i, _object(cachedir, sha1), None
+        _evict(db, cachedir, max_size, keep=links)
+    finally:
+        db.close()
+
+def fetch(ai, **kwargs):
+    """
+        Fetch the profile files of index rows into a local cache
+
+        Return the local paths and the errors:
+            - paths is a Series with the cache path of the fetched files, in the order of the index
+            - errors is a Series with the traceback of files that could not be downloaded
+        See iter_fetch for the options. Paths may be evicted by a later fetch of other files.
+    """
+    paths, errors = {}, {}
+    for i, path, error in iter_fetch(ai, **kwargs):
+        if error is None:
+            paths[i] = path
+        else:
+            errors[i] = error
+    order = [i for i in ai.index if i in paths]
+    return pd.Series([paths[i] for i in order], index=order, dtype=object), pd.Series(errors, dtype=object)
+
+def sync(ai, droot, **kwargs):
+    """
+        Fetch the profile files of index rows and install them under droot, with the GDAC layout
+
+        Files are hard linked from the cache when possible, copied otherwise, so that droot can be used
+        by all other functions. Return the errors Series of fetch.
+    """
+    paths, errors = fetch(ai, **kwargs)
+    for i, path in paths.items():
+        dest = os.path.join(droot, ai.loc[i, 'file'])
+        if not os.path.isdir(os.path.dirname(dest)):
+            os.makedirs(os.path.dirname(dest))
+        if os.path.exists(dest):
+            os.remove(dest)
+        try:
+            os.link(path, dest)
+        except (OSError, AttributeError):
+            shutil.copyfile(path, dest)
+    return errors
+
+def clear(cachedir=DEFAULT_CACHE):
+    """Remove all files from the cache"""
+    if os.path.isdir(cachedir):
+        shutil.rmtree(cachedir)
@@ -2,11 +2,20 @@
 __author__ = 'guillaumemaze'
 
 import numpy as np
-import xarray as xr
 import pandas as pd
 import sys
 from . import reftable as ref
+from . import dates
+from . import stats
 import warnings
+try:
+    import netCDF4
+except ImportError:
+    netCDF4 = None
+try:
+    import h5netcdf
+except ImportError:
+    h5netcdf = None
 
 def decodeqctest(qctest, hexa=False):
     """Identify the QC test numbers from a QCTEST value
@@ -28,290 +37,481 @@ def decodeqctest(qctest, hexa=False):
     while i <= qctest:
         if i & qctest:
             powers.append(i)
-            ids.append(np.int(np.log2(i)))
+            ids.append(int(np.log2(i)))
         i <<= 1
     # return powers
     return ids
 
-def delta_format(DT):
-    sgn = '+'
-    if DT<np.timedelta64(0):
-        sgn = '-'
-        DT=-DT
-    days = DT.astype('timedelta64[D]').astype(np.int64) # gives: array([2, 2, 4, 2], dtype=int32)
-    hours = DT.astype('timedelta64[h]').astype(np.int64)%24
-    minutes = DT.astype('timedelta64[s]').astype(np.int64)%60
-    # if days > 0 and hours > 0:
-    #     return "{0:.0f} d, {1:.0f} h".format(days, hours)
-    # elif days > 0:
-    #     return "{0:.0f} d".format(days)
-    # else:
-    #     return "{0:.0f} h".format(hours)
-    if days > 0 and hours > 0 and minutes > 0:
-        return "{3}{0:.0f} Days {1:.0f}H{2:.2d}".format(days, hours, minutes, sgn)
-    if hours > 0 and minutes > 0:
-        return "{2}{0:.0f}H{1:.2d}".format(hours, minutes, sgn)
-    elif hours > 0:
-        return "{1}{0:.0f}H00".format(hours, sgn)
-    else:
-        return "{1}{0:.0f} Mins".format(minutes, sgn)
+_HEXDIGITS = np.full(256, -1, dtype=np.int16)
+for _i, _c in enumerate('0123456789abcdef'):
+    _HEXDIGITS[ord(_c)] = _i
+    _HEXDIGITS[ord(_c.upper())] = _i
+
+def _unprefix(value):
+    """Remove the '+' sign and '0x' prefix that int(value, 16) accepts"""
+    if value[:1] == b'+':
+        value = value[1:]
+    if value[:2].lower() == b'0x':
+        value = value[2:]
+    return value
+
+def decodeqctests(qctests, packed=False):
+    """Decode an array of hexadecimal QCTEST values into a bit matrix
+
+        Return a masked boolean array of shape qctests.shape + (64,), where [..., i] is True if
+        test number i is set. With packed=True, return the masked uint64 values instead.
+        Values are read like decodeqctest(value, hexa=True) does (surrounding spaces, '+' sign and
+        '0x' prefix are allowed), but empty values decode to 0 (no test) and malformed values are masked.
+
+        Example:
+            decodeqctests(['1B2', 'A0', 'zz'], packed=True) = [434, 160, --]
+    """
+    a = np.asarray(qctests)
+    if a.dtype.kind == 'O':
+        a = a.astype('U')
+    if a.dtype.kind == 'U':
+        a = np.char.encode(a, 'ascii', 'replace')
+    a = np.atleast_1d(np.char.strip(a.astype('S')))
+    prefixed = np.char.startswith(a, b'+') | np.char.startswith(np.char.lower(a), b'0x')
+    if prefixed.any():
+        a = a.copy()
+        a[prefixed] = [_unprefix(v) for v in a[prefixed]]
+    bad = (np.char.str_len(a) > 16) | (prefixed & (np.char.str_len(a) == 0))
+    a = np.char.rjust(a, 16, b'0').astype('S16')
+
+    digits = _HEXDIGITS[np.frombuffer(a.tobytes(), dtype=np.uint8)].reshape(-1, 16)
+    bad |= (digits < 0).any(axis=1).reshape(a.shape)
+    digits[digits < 0] = 0
+    shifts = np.arange(60, -1, -4, dtype=np.uint64)
+    values = np.bitwise_or.reduce(digits.astype(np.uint64) << shifts, axis=1).reshape(np.shape(qctests))
+    bad = bad.reshape(values.shape)
+    if packed:
+        return np.ma.MaskedArray(values, mask=bad)
+
+    bits = ((values[..., np.newaxis] >> np.arange(64, dtype=np.uint64)) & np.uint64(1)).astype(bool)
+    return np.ma.MaskedArray(bits, mask=np.repeat(bad[..., np.newaxis], 64, axis=-1))
 
 def delta_format(DT):
-    sgn = '+'
-    if DT<np.timedelta64(0):
-        sgn = '-'
-        DT=-DT
-    # months = DT.astype('timedelta64[M]').astype(np.int64)
-    # days = DT.astype('timedelta64[D]').astype(np.int64)
-    # hours = DT.astype('timedelta64[h]').astype(np.int64)%24
-    # minutes = DT.astype('timedelta64[s]').astype(np.int64)%60
-    #
-    # months = DT.astype('timedelta64[M]')
-    # days = DT.astype('timedelta64[D]')
-    # hours = DT.astype('timedelta64[h]')
-
-    years = 0
-    months = 0
-    days = 0
-    hours = 0
-    minutes = np.timedelta64(DT, 'm').astype(np.float64)
-    if minutes > 59:
-        hours = np.timedelta64(DT, 'h').astype(np.float64)
-        minutes = np.timedelta64(DT, 'm').astype(np.float64)%60
-        if hours > 23:
-            days = np.timedelta64(DT, 'D').astype(np.float64)
-            hours = np.timedelta64(DT, 'h').astype(np.float64)%24
-            if days > 30:
-                days = np.timedelta64(DT, 'D').astype(np.float64)%30
-                months = np.timedelta64(DT, 'D').astype(np.float64)/30
-                if months > 11:
-                    months = np.timedelta64(DT, 'D').astype(np.float64)/30%12
-                    years = np.timedelta64(DT, 'D').astype(np.float64)/30/12
-
-    if years >0 and months > 0 and days > 0 and hours > 0 and minutes > 0:
-        S = "{3}{5:.0f} Years {4:.0f} Months {0:.0f} Days {1:.0f}H{2:2.0f}".format(days, hours, minutes, sgn, months, years)
-    elif months >0 and days > 0 and hours > 0 and minutes > 0:
-        S = "{3}{4:.0f} Months {0:.0f} Days {1:.0f}H{2:2.0f}".format(days, hours, minutes, sgn, months)
-    elif days > 0 and hours > 0 and minutes > 0:
-        S = "{3}{0:.0f} Days {1:.0f}H{2:2.0f}".format(days, hours, minutes, sgn)
-    elif hours > 0 and minutes > 0:
-        S = "{2}{0:.0f}H{1:2.0f}".format(hours, minutes, sgn)
-    elif hours > 0:
-        S = "{1}{0:.0f}H00".format(hours, sgn)
-    else:
-        S = "{1}{0:.0f} Mins".format(minutes, sgn)
-
-    return S
-
-def print_history(ds, i_prof, verb=0):
-    """ Print the history of a profile from a xarray dataset"""
-    def str_date(d):
-        """Create our string representatiob of a numpy.datetime64 value"""
-        return pd.to_datetime(str(d)).strftime('%Y-%m-%d %H:%M:%S')
-    def cleanpstr(s):
-        """Clean up a string contained in to a numpy array"""
-        return s.astype(str).values.tostring().strip()
-
-    def print_one_entry_old(ds, i_prof, nh):
-        """Print data for one history entry"""
-        msg = "%1s | %20s | %16s:\n"
-        if nh==0:
-            sys.stdout.write(msg % ('#', 'DATE', 'DATE vs CREATION'))
-
-        HISTORY_DATE = np.datetime64(pd.to_datetime(ds['HISTORY_DATE'].sel(N_HISTORY=nh))[i_prof])  # YYYYMMDDHHMISS
-        if nh > 0:
-            HISTORY_DATE_prev = np.datetime64(pd.to_datetime(ds['HISTORY_DATE'].sel(N_HISTORY=nh - 1))[i_prof])
-        DT = HISTORY_DATE - np.datetime64(pd.to_datetime(str(ds['DATE_CREATION'].values)))
-
-        HISTORY_STEP = ds['HISTORY_STEP'].sel(N_HISTORY=nh).isel(N_PROF=i_prof)  # From Table 12
-        HISTORY_ACTION = ds['HISTORY_ACTION'].sel(N_HISTORY=nh).isel(N_PROF=i_prof)  # From Table 7
-
-        HISTORY_QCTEST_hex = ds['HISTORY_QCTEST'].sel(N_HISTORY=nh).isel(N_PROF=i_prof)  # From Table 11
-        HISTORY_QCTEST_hex = HISTORY_QCTEST_hex.astype(str).values.tostring().strip()
-        if not HISTORY_QCTEST_hex:
-            HISTORY_QCTEST_int = '-'
-            HISTORY_QCTEST_IDs = [0]
-        else:
-            try:
-                HISTORY_QCTEST_int = int(HISTORY_QCTEST_hex, 16)
-                HISTORY_QCTEST_IDs = decodeqctest(HISTORY_QCTEST_int)
-            except:
-                print("Unexpected error:", sys.exc_info()[0])
-                raise
-
-        HISTORY_PARAMETER = ds['HISTORY_PARAMETER'].sel(N_HISTORY=nh).isel(N_PROF=i_prof)  # From Table 3
-        HISTORY_START_PRES = ds['HISTORY_START_PRES'].sel(N_HISTORY=nh).isel(N_PROF=i_prof)  #
-        HISTORY_STOP_PRES = ds['HISTORY_STOP_PRES'].sel(N_HISTORY=nh).isel(N_PROF=i_prof)  #
-        HISTORY_PREVIOUS_VALUE = ds['HISTORY_PREVIOUS_VALUE'].sel(N_HISTORY=nh).isel(N_PROF=i_prof)  # Parameter/Flag previous value before action
-
-        HISTORY_SOFTWARE = ds['HISTORY_SOFTWARE'].sel(N_HISTORY=nh).isel(N_PROF=i_prof)  #
-        HISTORY_SOFTWARE_RELEASE = ds['HISTORY_SOFTWARE_RELEASE'].sel(N_HISTORY=nh).isel(N_PROF=i_prof)  #
-        HISTORY_REFERENCE = ds['HISTORY_REFERENCE'].sel(N_HISTORY=nh).isel(N_PROF=i_prof)  #
-        HISTORY_INSTITUTION = ds['HISTORY_INSTITUTION'].sel(N_HISTORY=nh).isel(N_PROF=i_prof)  # From Table 4
-
-        # DT = HISTORY_DATE - ds['JULD'].values[0]
-        # print delta_format(DT)
-        # print DT/np.timedelta64(1, 'D')
-        # print nh.values, HISTORY_DATE.values, HISTORY_STEP.values, HISTORY_ACTION.values, HISTORY_QCTEST_hex.values
-        # print nh.values, HISTORY_DATE.values, HISTORY_STEP.values, HISTORY_ACTION.values, HISTORY_QCTEST_hex.values, HISTORY_QCTEST_int, HISTORY_QCTEST_IDs
-        # if ((nh > 0) and (HISTORY_DATE != HISTORY_DATE_prev)):
-        #     print "\n"
-        # print nh.values, HISTORY_DATE, HISTORY_STEP.values, HISTORY_SOFTWARE.values, HISTORY_ACTION.values, HISTORY_QCTEST_hex, HISTORY_QCTEST_IDs
-        # print ref.table7(HISTORY_ACTION)
-        # sys.stdout.write(msg % (nh.values, str_date(HISTORY_DATE), delta_format(DT), HISTORY_STEP.values, str(HISTORY_ACTION.values).strip()))
-        # sys.stdout.write(msg % (nh.values, str_date(HISTORY_DATE), delta_format(DT), ref.table12(HISTORY_STEP), ref.table7(HISTORY_ACTION)))
-        # print nh.values, HISTORY_DATE, delta_format(
-        #     DT), HISTORY_STEP.values, HISTORY_SOFTWARE.values, HISTORY_ACTION.values, HISTORY_QCTEST_hex, HISTORY_QCTEST_IDs
-            # DT), HISTORY_STEP.values, HISTORY_SOFTWARE.values, ref.table7(HISTORY_ACTION.values), HISTORY_QCTEST_hex, HISTORY_QCTEST_IDs
-        # print nh.values, DT/np.timedelta64(1, 'D'), HISTORY_STEP.values, HISTORY_SOFTWARE.values, HISTORY_ACTION.values, HISTORY_QCTEST_hex, HISTORY_QCTEST_IDs
-        # print "\t", HISTORY_PARAMETER.values, HISTORY_START_PRES.values, "-", HISTORY_STOP_PRES.values, " Previous QC: ", HISTORY_PREVIOUS_VALUE.values, " / ", HISTORY_REFERENCE.values
-
-        sys.stdout.write(msg % (nh.values, str_date(HISTORY_DATE), delta_format(DT)))
-        sys.stdout.write("%35s %10s: %8s > %s\n" % (" ", "STEP", HISTORY_STEP.values, ref.table12(HISTORY_STEP)))
-        sys.stdout.write("%35s %10s: %8s > %s\n" % (" ", "ACTION", HISTORY_ACTION.values, ref.table7(HISTORY_ACTION)))
-        if HISTORY_QCTEST_IDs and HISTORY_QCTEST_IDs[0] != 0:
-            sys.stdout.write("%35s %10s: %8s > %s\n" % (" ", "QCTEST", HISTORY_QCTEST_hex, ', '.join('{:0.0f}'.format(i) for i in HISTORY_QCTEST_IDs) ))
-        else:
-            sys.stdout.write("%35s %10s: %8s\n" % (" ", "QCTEST", HISTORY_QCTEST_hex ))
-        if not cleanpstr(HISTORY_REFERENCE):
-            sys.stdout.write("%35s %10s: %4s[%s]\n" % (" ", "SOFTWARE", cleanpstr(HISTORY_SOFTWARE), cleanpstr(HISTORY_SOFTWARE_RELEASE)))
+    """Readable string of a timedelta, eg: '+1 Days 17H 9', '-3H00', '+5 Mins' or 'NaT'
+
+        DT can also be an array of timedeltas, an array of strings is then returned.
+    """
+    scalar = np.ndim(DT) == 0
+    DT = np.ravel(np.asarray(DT, dtype='timedelta64[ns]'))
+    nat = np.isnat(DT)
+    ns = np.where(nat, 0, DT.astype(np.int64))
+    a = np.abs(ns)
+    M = (a // (60 * 10 ** 9)).astype(np.float64)
+    H = (a // (3600 * 10 ** 9)).astype(np.float64)
+    D = (a // (86400 * 10 ** 9)).astype(np.float64)
+    has_h = M > 59
+    has_d = has_h & (H > 23)
+    has_m = has_d & (D > 30)
+    has_y = has_m & (D / 30 > 11)
+    minutes = np.where(has_h, M % 60, M)
+    hours = np.where(has_d, H % 24, np.where(has_h, H, 0))
+    days = np.where(has_m, D % 30, np.where(has_d, D, 0))
+    months = np.where(has_y, D / 30 % 12, np.where(has_m, D / 30, 0))
+    years = np.where(has_y, D / 30 / 12, 0)
+    out = np.empty(DT.shape, dtype=object)
+    for k in range(len(DT)):
+        if nat[k]:
+            out[k] = "NaT"
+            continue
+        sgn, y, mo, d, h, mi = '-' if ns[k] < 0 else '+', years[k], months[k], days[k], hours[k], minutes[k]
+        if y > 0 and mo > 0 and d > 0 and h > 0 and mi > 0:
+            out[k] = "{3}{5:.0f} Years {4:.0f} Months {0:.0f} Days {1:.0f}H{2:2.0f}".format(d, h, mi, sgn, mo, y)
+        elif mo > 0 and d > 0 and h > 0 and mi > 0:
+            out[k] = "{3}{4:.0f} Months {0:.0f} Days {1:.0f}H{2:2.0f}".format(d, h, mi, sgn, mo)
+        elif d > 0 and h > 0 and mi > 0:
+            out[k] = "{3}{0:.0f} Days {1:.0f}H{2:2.0f}".format(d, h, mi, sgn)
+        elif h > 0 and mi > 0:
+            out[k] = "{2}{0:.0f}H{1:2.0f}".format(h, mi, sgn)
+        elif h > 0:
+            out[k] = "{1}{0:.0f}H00".format(h, sgn)
         else:
-            sys.stdout.write("%35s %10s: %4s[%s] > %s\n" % (" ", "SOFTWARE", cleanpstr(HISTORY_SOFTWARE), cleanpstr(HISTORY_SOFTWARE_RELEASE), cleanpstr(HISTORY_REFERENCE)))
-        sys.stdout.write("%35s %10s: %8s\n" % (" ", "PARAMETER", cleanpstr(HISTORY_PARAMETER)))
-
-    def print_one_entry(ds, i_prof, nh, verb=0):
-        """Print data for one history entry"""
-        # msg = "%1s | %20s | %16s:\n"
-        # if nh==0:
-        #     sys.stdout.write(msg % ('#', 'DATE', 'DATE vs CREATION'))
-
-        HISTORY_DATE = np.datetime64(pd.to_datetime(ds['HISTORY_DATE'].sel(N_HISTORY=nh))[i_prof])  # YYYYMMDDHHMISS
-        if nh > 0:
-            HISTORY_DATE_prev = np.datetime64(pd.to_datetime(ds['HISTORY_DATE'].sel(N_HISTORY=nh - 1))[i_prof])
-        DT = HISTORY_DATE - np.datetime64(pd.to_datetime(str(ds['DATE_CREATION'].values)))
-        DTm = HISTORY_DATE - ds['JULD'].isel(N_PROF=i_prof).values
-
-        HISTORY_STEP = ds['HISTORY_STEP'].sel(N_HISTORY=nh).isel(N_PROF=i_prof)  # From Table 12
-        HISTORY_ACTION = ds['HISTORY_ACTION'].sel(N_HISTORY=nh).isel(N_PROF=i_prof)  # From Table 7
-
-        HISTORY_QCTEST_hex = ds['HISTORY_QCTEST'].sel(N_HISTORY=nh).isel(N_PROF=i_prof)  # From Table 11
-        HISTORY_QCTEST_hex = HISTORY_QCTEST_hex.astype(str).values.tostring().strip()
-        if not HISTORY_QCTEST_hex:
-            HISTORY_QCTEST_int = '-'
-            HISTORY_QCTEST_IDs = [0]
+            out[k] = "{1}{0:.0f} Mins".format(mi, sgn)
+    return out[0] if scalar else out
+
+HISTORY_STRINGS = ['HISTORY_INSTITUTION', 'HISTORY_STEP', 'HISTORY_SOFTWARE', 'HISTORY_SOFTWARE_RELEASE',
+                   'HISTORY_REFERENCE', 'HISTORY_ACTION', 'HISTORY_PARAMETER', 'HISTORY_QCTEST']
+HISTORY_FLOATS = ['HISTORY_START_PRES', 'HISTORY_STOP_PRES', 'HISTORY_PREVIOUS_VALUE']
+
+def _strip(a):
+    """Decode and strip an array of fixed width strings"""
+    if a.dtype.kind == 'S':
+        a = np.char.decode(a, 'ascii', 'replace')
+    return np.char.strip(a.astype('U'))
+
+def _parse_dates(a):
+    """Convert an array of YYYYMMDDHHMISS strings to a flat datetime64[ns] array, invalid entries are NaT"""
+    with stats.stage('dates.parse'):
+        return np.ravel(dates.parse(a)).astype('datetime64[ns]')
+
+def _decode_qctests(qctests):
+    """Decode an array of hexadecimal QCTEST strings into lists of test ids
+
+        Empty strings give an empty list and malformed values give None.
+    """
+    with stats.stage('history.qctest'):
+        codes, inv = np.unique(qctests, return_inverse=True)
+        bits = decodeqctests(codes)
+        bad = np.ma.getmaskarray(bits).any(axis=1)
+        ids = [None if bad[k] else np.nonzero(bits.data[k])[0].tolist() for k in range(len(codes))]
+        return pd.Series(ids, dtype=object).values[inv]
+
+def to_frame(ds, drop_empty=False):
+    """Decode the history of all profiles from a xarray dataset into a tidy Pandas Dataframe
+
+        There is one row per (N_PROF, N_HISTORY) entry. String variables are stripped, dates are
+        parsed to datetime64 and QCTEST hexadecimal values are decoded into lists of test ids
+        (empty list if no test, None if the value cannot be decoded).
+        Set drop_empty=True to remove entries with no information (padding of N_HISTORY).
+    """
+    with stats.stage('history.to_frame'):
+        return _to_frame(ds, drop_empty)
+
+def _to_frame(ds, drop_empty):
+    n_prof = len(ds['N_PROF'])
+    n_hist = len(ds['N_HISTORY'])
+
+    def flat(name):
+        da = ds[name]
+        return np.transpose(da.values, [da.dims.index('N_PROF'), da.dims.index('N_HISTORY')]).ravel()
+
+    file_dates = _parse_dates(np.array([ds['DATE_CREATION'].values, ds['DATE_UPDATE'].values]))
+    data = {'N_PROF': np.repeat(ds['N_PROF'].values, n_hist),
+            'N_HISTORY': np.tile(np.arange(n_hist), n_prof),
+            'JULD': np.repeat(ds['JULD'].values, n_hist),
+            'DATE_CREATION': np.repeat(file_dates[0], n_prof * n_hist),
+            'DATE_UPDATE': np.repeat(file_dates[1], n_prof * n_hist),
+            'HISTORY_DATE': _parse_dates(flat('HISTORY_DATE'))}
+    for name in HISTORY_STRINGS:
+        data[name] = _strip(flat(name)).astype(object)
+    for name in HISTORY_FLOATS:
+        data[name] = flat(name)
+    data['HISTORY_QCTEST_IDS'] = _decode_qctests(data['HISTORY_QCTEST'])
+    df = pd.DataFrame(data, columns=['N_PROF', 'N_HISTORY', 'JULD', 'DATE_CREATION', 'DATE_UPDATE'] +
+                      HISTORY_STRINGS + ['HISTORY_DATE'] + HISTORY_FLOATS + ['HISTORY_QCTEST_IDS'])
+
+    return drop_empty_entries(df) if drop_empty else df
+
+def drop_empty_entries(df):
+    """Remove entries with no information (padding of N_HISTORY) from a to_frame Dataframe"""
+    keep = (df[HISTORY_STRINGS] != '').any(axis=1).values | df['HISTORY_DATE'].notnull().values
+    return df[keep].reset_index(drop=True)
+
+def profile_frame(ds):
+    """Dataframe of the profiles of a xarray dataset, with the N_PROF, JULD, DATE_CREATION and DATE_UPDATE columns
+
+        This is what format_profiles needs besides the history entries, see cache.profiles_history.
+    """
+    n_prof = len(ds['N_PROF'])
+    C, U = _parse_dates(np.array([ds['DATE_CREATION'].values, ds['DATE_UPDATE'].values]))
+    return pd.DataFrame({'N_PROF': ds['N_PROF'].values, 'JULD': ds['JULD'].values,
+                         'DATE_CREATION': np.repeat(C, n_prof), 'DATE_UPDATE': np.repeat(U, n_prof)},
+                        columns=['N_PROF', 'JULD', 'DATE_CREATION', 'DATE_UPDATE'])
+
+HISTORY_VARIABLES = HISTORY_STRINGS + ['HISTORY_DATE'] + HISTORY_FLOATS
+PROFILE_VARIABLES = ['JULD', 'DATE_CREATION', 'DATE_UPDATE']
+_JULD_REFERENCE = np.datetime64('1950-01-01T00:00:00', 'ns')
+
+def _is_hdf5(fname):
+    """True if a file is HDF5 based (netCDF4 format), False for netCDF3 files (the Argo profile files)"""
+    with open(fname, 'rb') as f:
+        return f.read(4) == b'\x89HDF'
+
+def _engine(engine, fname):
+    """Default engine to read a profile file: netcdf4 if available, h5netcdf for netCDF4/HDF5 files only,
+    or xarray (with the scipy backend for netCDF3 files)"""
+    if engine is None:
+        if netCDF4 is not None:
+            engine = 'netcdf4'
+        elif h5netcdf is not None and _is_hdf5(fname):
+            engine = 'h5netcdf'
         else:
-            try:
-                HISTORY_QCTEST_int = int(HISTORY_QCTEST_hex, 16)
-                HISTORY_QCTEST_IDs = decodeqctest(HISTORY_QCTEST_int)
-            except:
-                # print("'%s'"%HISTORY_QCTEST_hex)
-                # warnings.warn("Unexpected error when decoding QCTEST !", SyntaxWarning)
-                # print("Unexpected error when decoding QCTEST:", sys.exc_info()[0])
-                # raise
-                HISTORY_QCTEST_int = 'ERROR'
-                HISTORY_QCTEST_IDs = [9999]
-
-        HISTORY_PARAMETER = ds['HISTORY_PARAMETER'].sel(N_HISTORY=nh).isel(N_PROF=i_prof)  # From Table 3
-        HISTORY_START_PRES = ds['HISTORY_START_PRES'].sel(N_HISTORY=nh).isel(N_PROF=i_prof)  #
-        HISTORY_STOP_PRES = ds['HISTORY_STOP_PRES'].sel(N_HISTORY=nh).isel(N_PROF=i_prof)  #
-        HISTORY_PREVIOUS_VALUE = ds['HISTORY_PREVIOUS_VALUE'].sel(N_HISTORY=nh).isel(N_PROF=i_prof)  # Parameter/Flag previous value before action
-
-        HISTORY_SOFTWARE = ds['HISTORY_SOFTWARE'].sel(N_HISTORY=nh).isel(N_PROF=i_prof)  #
-        HISTORY_SOFTWARE_RELEASE = ds['HISTORY_SOFTWARE_RELEASE'].sel(N_HISTORY=nh).isel(N_PROF=i_prof)  #
-        HISTORY_REFERENCE = ds['HISTORY_REFERENCE'].sel(N_HISTORY=nh).isel(N_PROF=i_prof)  #
-        HISTORY_INSTITUTION = ds['HISTORY_INSTITUTION'].sel(N_HISTORY=nh).isel(N_PROF=i_prof)  # From Table 4
-
-        if verb==1:
-            blk = "".join([" "] * 4)
-            empty_STEP = not cleanpstr(HISTORY_STEP)
-            sys.stdout.write(
-                "%1s | %4s: '%8s' > %s\n" % (nh.values, "STEP", cleanpstr(HISTORY_STEP), ref.table12(HISTORY_STEP)))
-            # sys.stdout.write("%s %12s: '%19s' > %s since creation\n" % (blk, "DATE", str_date(HISTORY_DATE), delta_format(DT)))
-            sys.stdout.write("%s %12s: '%19s' > %s since creation, %s since measurement\n" % (
-            blk, "DATE", str_date(HISTORY_DATE), delta_format(DT), delta_format(DTm)))
-            sys.stdout.write("%s %12s: '%s' > %s\n" % (
-            blk, "INSTITUTION", cleanpstr(HISTORY_INSTITUTION), ref.table4(HISTORY_INSTITUTION)))
-
-            if not cleanpstr(HISTORY_REFERENCE):
-                sys.stdout.write(
-                    "%s %12s: '%s', release '%s'\n" % (
-                    blk, "SOFTWARE", cleanpstr(HISTORY_SOFTWARE), cleanpstr(HISTORY_SOFTWARE_RELEASE)))
+            engine = 'xarray'
+    return engine
+
+def _read_raw(fname, names, engine, profiles=None):
+    """Read variables without any decoding, return a dictionary of (dims, values, attributes)
+
+        profiles: only read this slice of the N_PROF dimension
+    """
+    if engine == 'netcdf4':
+        f = netCDF4.Dataset(fname)
+        f.set_auto_maskandscale(False)
+        if hasattr(f, 'set_auto_chartostring'):
+            f.set_auto_chartostring(False)
+        attrs = lambda v: dict((k, v.getncattr(k)) for k in v.ncattrs())
+    elif engine == 'h5netcdf':
+        f = h5netcdf.File(fname, 'r')
+        attrs = lambda v: dict(v.attrs)
+    else:
+        raise ValueError("Unknown engine '%s'" % engine)
+    stats.count('files_opened')
+    try:
+        raw = {}
+        for name in names:
+            if name in f.variables:
+                v = f.variables[name]
+                dims = tuple(v.dimensions)
+                key = tuple(profiles if d == 'N_PROF' and profiles is not None else slice(None) for d in dims)
+                raw[name] = (dims, np.asarray(v[key] if dims else v[...]), attrs(v))
+                stats.count('bytes_read', raw[name][1].nbytes)
+        return raw
+    finally:
+        f.close()
+
+def _decode_raw(name, dims, values, attrs):
+    """Cheap decoding of a raw variable: characters arrays joined, fill values masked, JULD to datetime64"""
+    if values.dtype.kind == 'S' and values.dtype.itemsize == 1 and values.ndim > 0:
+        n = values.shape[-1]
+        values = np.ascontiguousarray(values).view('S%i' % n).reshape(values.shape[:-1])
+        return dims[:-1], values
+    if values.dtype.kind == 'f' and '_FillValue' in attrs:
+        values = np.where(values == np.asarray(attrs['_FillValue']).ravel()[0], np.nan, values)
+    if name == 'JULD':
+        values = _from_julian(values)
+    return dims, values
+
+def _from_julian(values, unit='ns'):
+    """Convert days since 1950-01-01 to datetime64[ns] rounded to the unit ('ns' or 's'), NaN are NaT
+
+        Dates with a resolution of one second (eg: YYYYMMDDHHMISS strings) are not exact in float64 days
+        (errors up to a few hundreds of nanoseconds): they are rounded back with unit='s'.
+    """
+    ns = np.round(values * 86400e9) if unit == 'ns' else np.round(values * 86400.) * 1e9
+    values = _JULD_REFERENCE + np.where(np.isnan(ns), 0, ns).astype('timedelta64[ns]')
+    values[np.isnan(ns)] = np.datetime64('NaT')
+    return values
+
+def open_history(fname, variables=None, engine=None, profiles=None):
+    """Open only the variables required to decode the history of a profile file
+
+        Return a xarray dataset with the HISTORY_*, JULD, DATE_CREATION and DATE_UPDATE variables (and the
+        optional list of extra variables), decoded like xarray.open_dataset would do but much faster:
+        variables are read raw and only characters arrays, fill values and JULD are decoded.
+        engine: 'netcdf4', 'h5netcdf' (netCDF4/HDF5 files only) or 'xarray' (default: see _engine).
+        profiles: slice(start, stop) of profiles to read, to process files with many profiles (eg: merged
+        *_prof.nc files) by chunks. The N_PROF coordinate of the dataset then holds the profile numbers in the file.
+    """
+    import xarray as xr  # Slow to import, and not needed by to_frame or read_ragged
+    if profiles is not None and (profiles.step not in (None, 1) or (profiles.start or 0) < 0
+                                 or (profiles.stop is not None and profiles.stop < 0)):
+        raise ValueError("profiles must be a slice(start, stop) of positive profile numbers")
+    names = HISTORY_VARIABLES + PROFILE_VARIABLES + list(variables or [])
+    engine = _engine(engine, fname)
+    if engine == 'xarray':
+        stats.count('files_opened')
+        with stats.stage('history.open'), xr.open_dataset(fname) as ds:
+            ds = ds[[name for name in names if name in ds.variables]]
+            if profiles is not None:
+                ds = ds.isel(N_PROF=profiles)
+            ds = ds.load()
+            stats.count('bytes_read', ds.nbytes)
+    else:
+        with stats.stage('history.open'):
+            raw = _read_raw(fname, names, engine, profiles=profiles)
+        with stats.stage('history.decode'):
+            ds = xr.Dataset(dict((name, _decode_raw(name, *raw[name])) for name in raw))
+    if profiles is not None:
+        ds = ds.assign_coords(N_PROF=(profiles.start or 0) + np.arange(ds.sizes['N_PROF']))
+    return ds
+
+def count_profiles(fname, engine=None):
+    """Number of profiles (length of the N_PROF dimension) of a profile file, only its header is read"""
+    engine = _engine(engine, fname)
+    stats.count('files_opened')
+    if engine == 'netcdf4':
+        with netCDF4.Dataset(fname) as f:
+            return len(f.dimensions['N_PROF'])
+    elif engine == 'h5netcdf':
+        with h5netcdf.File(fname, 'r') as f:
+            return f.variables['JULD'].shape[0]
+    import xarray as xr
+    with xr.open_dataset(fname) as ds:
+        return ds.sizes['N_PROF']
+
+RAGGED_COLUMNS = ['file', 'N_PROF', 'N_HISTORY'] + PROFILE_VARIABLES + HISTORY_VARIABLES
+
+def read_ragged(store, wmo=None, file=None):
+    """Read history entries from a ragged store (see ragged.build) into a Dataframe like extract.read
+
+        wmo: only read the history of this float
+        file: only read the history of the profiles of this file (path relative to the GDAC 'dac' directory)
+        Only one slice of each variable of the store is read.
+    """
+    if netCDF4 is None:
+        raise ImportError("netCDF4 is required to read ragged history stores")
+    stats.count('files_opened')
+    f = netCDF4.Dataset(store)
+    f.set_auto_maskandscale(False)
+    try:
+        v = f.variables
+        p0, p1 = 0, len(f.dimensions['N_PROF'])
+        if file is not None and wmo is None and len(file.split('/')) > 2 and file.split('/')[1].isdigit():
+            # Profiles of a file are in the slice of its float:
+            wmo = file.split('/')[1]
+        if wmo is not None:
+            k = np.nonzero(v['FLOAT_WMO'][:] == int(wmo))[0]
+            p0 = int(v['FLOAT_OFFSET'][k[0]]) if len(k) else 0
+            p1 = p0 + int(v['FLOAT_SIZE'][k[0]]) if len(k) else 0
+        if file is not None:
+            k = np.nonzero(v['FILE'][p0:p1] == file)[0]
+            p0, p1 = (p0 + k[0], p0 + k[-1] + 1) if len(k) else (0, 0)
+
+        sizes = v['ROW_SIZE'][p0:p1]
+        e0 = int(v['ROW_OFFSET'][p0]) if p1 > p0 else 0
+        e1 = e0 + int(sizes.sum())
+        data = {'file': np.repeat(v['FILE'][p0:p1].astype(object), sizes),
+                'N_PROF': np.repeat(v['FILE_N_PROF'][p0:p1].astype(np.int64), sizes),
+                'N_HISTORY': v['N_HISTORY'][e0:e1].astype(np.int64),
+                'HISTORY_DATE': _from_julian(v['HISTORY_DATE'][e0:e1], unit='s')}
+        for name in PROFILE_VARIABLES:
+            # Only JULD has a resolution finer than one second:
+            data[name] = np.repeat(_from_julian(v[name][p0:p1], unit='ns' if name == 'JULD' else 's'), sizes)
+        for name in HISTORY_STRINGS:
+            data[name] = v[name][e0:e1].astype(object)
+        for name in HISTORY_FLOATS:
+            data[name] = v[name][e0:e1]
+        return pd.DataFrame(data, columns=RAGGED_COLUMNS)
+    finally:
+        f.close()
+
+def _str_date(d):
+    """Create our string representation of a numpy.datetime64 value"""
+    if pd.isnull(d):
+        return 'NaT'
+    return pd.to_datetime(d).strftime('%Y-%m-%d %H:%M:%S')
+
+def _format_header(i_prof, M, C, U):
+    """Format the dates summary of a profile"""
+    lines = ["    PROFILE NUMBER: %i" % (i_prof),
+             "  MEASUREMENT DATE: %s ('JULD')" % (_str_date(M)),
+             "FILE CREATION DATE: %s, %s since measurement ('DATE_CREATION')" % (_str_date(C), delta_format(C - M)),
+             "  FILE UPDATE DATE: %s, %s since creation ('DATE_UPDATE')" % (_str_date(U), delta_format(U - C)),
+             "         HISTORY:"]
+    return "\n".join(lines) + "\n"
+
+def _str_dates(values):
+    """Vectorized _str_date of a datetime64 array"""
+    values = np.asarray(values, dtype='datetime64[s]')
+    s = np.char.replace(np.datetime_as_string(values, unit='s'), 'T', ' ')
+    s[np.isnat(values)] = 'NaT'
+    return s
+
+def _entry_columns(df):
+    """Arrays of the columns of a to_frame Dataframe, with code descriptions, formatted dates and time lags"""
+    cols = dict((name, df[name].values) for name in df.columns)
+    with stats.stage('reftable.decode'):
+        for name, table in [('HISTORY_INSTITUTION', 4), ('HISTORY_ACTION', 7), ('HISTORY_STEP', 12)]:
+            cols[name + '_DESC'] = np.asarray(ref.decode(cols[name], table))
+    cols['HISTORY_DATE_STR'] = _str_dates(cols['HISTORY_DATE'])
+    cols['DT'] = delta_format((df['HISTORY_DATE'] - df['DATE_CREATION']).values)
+    cols['DTm'] = delta_format((df['HISTORY_DATE'] - df['JULD']).values)
+    return cols
+
+def format_history(df, i_prof, verb=0):
+    """Format the history entries of one profile from a Dataframe returned by to_frame"""
+    return _format_entries(_entry_columns(df[df['N_PROF'] == i_prof]), verb=verb)
+
+def _format_entries(cols, verb=0):
+    """Format history entries from the arrays returned by _entry_columns"""
+    blk = "".join([" "] * 4)
+    out = []
+    for k, nh in enumerate(cols['N_HISTORY']):
+        r = dict((name, cols[name][k]) for name in cols)
+        if verb == 1:
+            out.append("%1s | %4s: '%8s' > %s\n" % (nh, "STEP", r['HISTORY_STEP'], r['HISTORY_STEP_DESC']))
+            out.append("%s %12s: '%19s' > %s since creation, %s since measurement\n" % (
+                blk, "DATE", r['HISTORY_DATE_STR'], r['DT'], r['DTm']))
+            out.append("%s %12s: '%s' > %s\n" % (
+                blk, "INSTITUTION", r['HISTORY_INSTITUTION'], r['HISTORY_INSTITUTION_DESC']))
+            if not r['HISTORY_REFERENCE']:
+                out.append("%s %12s: '%s', release '%s'\n" % (
+                    blk, "SOFTWARE", r['HISTORY_SOFTWARE'], r['HISTORY_SOFTWARE_RELEASE']))
             else:
-                sys.stdout.write(
-                    "%s %12s: '%s', release '%s', reference '%s'\n" % (blk, "SOFTWARE", cleanpstr(HISTORY_SOFTWARE),
-                                                                       cleanpstr(HISTORY_SOFTWARE_RELEASE),
-                                                                       cleanpstr(HISTORY_REFERENCE)))
-
-            empty_ACTION = not HISTORY_ACTION.values
-            empty_QCTEST = not (HISTORY_QCTEST_IDs and HISTORY_QCTEST_IDs[0] != 0)
-            empty_QCchge = not str(HISTORY_PREVIOUS_VALUE.values)
-            empty_PARAM = not cleanpstr(HISTORY_PARAMETER)
-            empty_START = not str(HISTORY_START_PRES)
-
-            if not empty_ACTION:
-                sys.stdout.write(
-                    "%s %12s: '%4s' > %s\n" % (blk, "ACTION", HISTORY_ACTION.values, ref.table7(HISTORY_ACTION)))
-
-            if not empty_QCTEST:
-                if HISTORY_QCTEST_IDs[0] != 9999:
-                    sys.stdout.write(
-                        "%s %12s: '%s' > %s\n" % (
-                        blk, "QCTEST", HISTORY_QCTEST_hex, ', '.join('{:0.0f}'.format(i) for i in HISTORY_QCTEST_IDs)))
+                out.append("%s %12s: '%s', release '%s', reference '%s'\n" % (
+                    blk, "SOFTWARE", r['HISTORY_SOFTWARE'], r['HISTORY_SOFTWARE_RELEASE'], r['HISTORY_REFERENCE']))
+
+            ids = r['HISTORY_QCTEST_IDS']
+            missing = {'STEP': not r['HISTORY_STEP'],
+                       'ACTION': not r['HISTORY_ACTION'],
+                       # As decoded: no test (eg: '0000') is missing, a decoding error (None) is reported
+                       'QCTEST': ids is not None and not (len(ids) and ids[0] != 0),
+                       'PARAM': not r['HISTORY_PARAMETER'],
+                       'START_PRES': pd.isnull(r['HISTORY_START_PRES']),
+                       'PREVIOUS_VALUE': pd.isnull(r['HISTORY_PREVIOUS_VALUE'])}
+
+            if not missing['ACTION']:
+                out.append("%s %12s: '%4s' > %s\n" % (blk, "ACTION", r['HISTORY_ACTION'], r['HISTORY_ACTION_DESC']))
+            if not missing['QCTEST']:
+                if ids is not None:
+                    out.append("%s %12s: '%s' > %s\n" % (
+                        blk, "QCTEST", r['HISTORY_QCTEST'], ', '.join('{:0.0f}'.format(i) for i in ids)))
                 else:
-                    sys.stdout.write(
-                        # "%s %12s: %s\n" % (blk, "QCTEST", "<< Unexpected error when decoding QCTEST ! >>"))
-                        "%s %12s: %s\n" % (blk, "QCTEST",
-                                           ("<< Unexpected error when decoding QCTEST='%s' ! >>")%(str(HISTORY_QCTEST_hex))))
-
-            if not empty_PARAM:
-                sys.stdout.write("%s %12s: '%s'\n" % (blk, "PARAMETER", cleanpstr(HISTORY_PARAMETER)))
-
-            if not empty_START:
-                sys.stdout.write(
-                    "%s %12s: From '%0.1f' to '%0.1f'\n" % (blk, "PRES", HISTORY_START_PRES, HISTORY_STOP_PRES))
-            if not empty_QCchge:
-                sys.stdout.write(
-                    "%s %12s\n%s %12s: '%4s'\n" % (blk, "PREVIOUS", blk, "VALUE", str(HISTORY_PREVIOUS_VALUE.values)))
-
-            missing_list = []
-            if empty_STEP:
-                missing_list.append("STEP")
-            if empty_ACTION:
-                missing_list.append("ACTION")
-            if empty_QCTEST:
-                missing_list.append("QCTEST")
-            if empty_PARAM:
-                missing_list.append("PARAM")
-            if empty_START:
-                missing_list.append("START_PRES")
-            if empty_QCchge:
-                missing_list.append("PREVIOUS_VALUE")
+                    out.append("%s %12s: %s\n" % (
+                        blk, "QCTEST", "<< Unexpected error when decoding QCTEST='%s' ! >>" % (r['HISTORY_QCTEST'])))
+            if not missing['PARAM']:
+                out.append("%s %12s: '%s'\n" % (blk, "PARAMETER", r['HISTORY_PARAMETER']))
+            if not missing['START_PRES']:
+                out.append("%s %12s: From '%0.1f' to '%0.1f'\n" % (
+                    blk, "PRES", r['HISTORY_START_PRES'], r['HISTORY_STOP_PRES']))
+            if not missing['PREVIOUS_VALUE']:
+                out.append("%s %12s\n%s %12s: '%4s'\n" % (blk, "PREVIOUS", blk, "VALUE", r['HISTORY_PREVIOUS_VALUE']))
+
+            missing_list = [k for k in ['STEP', 'ACTION', 'QCTEST', 'PARAM', 'START_PRES', 'PREVIOUS_VALUE'] if missing[k]]
             if len(missing_list):
-                sys.stdout.write("%s %12s: %s\n" % (blk, "Missing", ", ".join(missing_list)))
-
-        elif verb==0:
-            blk = "".join([" "] * 4)
-            # sys.stdout.write(
-            #     "%1s | %4s: '%8s' > %s, %s since creation, %s since measurement\n" % (nh.values, "STEP",
-            #     cleanpstr(HISTORY_STEP), str_date(HISTORY_DATE), delta_format(DT), delta_format(DTm)))
-            # sys.stdout.write(
-            #     "%s > %s\n" % (blk, ref.table12(HISTORY_STEP)))
-            sys.stdout.write(
-                "%1s | %19s | %s \n" % (nh.values, str_date(HISTORY_DATE), ref.table12(HISTORY_STEP) ))
-    #
-    M = ds['JULD'].isel(N_PROF=i_prof).values
-    C = np.datetime64(pd.to_datetime(str(ds['DATE_CREATION'].values)))
-    DT = C - M
-    U = np.datetime64(pd.to_datetime(str(ds['DATE_UPDATE'].values)))
-    DTu = U - C
-    print "    PROFILE NUMBER: %i" % (i_prof)
-    print "  MEASUREMENT DATE: %s ('JULD')" % (str_date(M))
-    print "FILE CREATION DATE: %s, %s since measurement ('DATE_CREATION')" % (str_date(C), delta_format(DT))
-    print "  FILE UPDATE DATE: %s, %s since creation ('DATE_UPDATE')" % (str_date(U), delta_format(DTu))
-
-    print "         HISTORY:"
-    for nh in ds['N_HISTORY']:
-        print_one_entry(ds, i_prof, nh, verb=verb)
+                out.append("%s %12s: %s\n" % (blk, "Missing", ", ".join(missing_list)))
+
+        elif verb == 0:
+            out.append("%1s | %19s | %s \n" % (nh, r['HISTORY_DATE_STR'], r['HISTORY_STEP_DESC']))
+    return "".join(out)
+
+def format_profile(ds, i_prof, verb=0, df=None):
+    """Format the dates summary and history of a profile from a xarray dataset
+
+        i_prof is the profile number in the file (see the N_PROF coordinate of open_history with profiles).
+        df is the Dataframe returned by to_frame(ds), it is computed if not provided.
+        To format all profiles of a dataset, use format_profiles.
+    """
+    if df is None:
+        df = to_frame(ds)
+    with stats.stage('history.format'):
+        M = ds['JULD'].values[np.searchsorted(ds['N_PROF'].values, i_prof)]
+        C = _parse_dates(ds['DATE_CREATION'].values)[0]
+        U = _parse_dates(ds['DATE_UPDATE'].values)[0]
+        return _format_header(i_prof, M, C, U) + format_history(df, i_prof, verb=verb)
+
+def format_profiles(ds, verb=0, df=None):
+    """Format the dates summary and history of all profiles of a xarray dataset, yield (i_prof, text)
+
+        File level dates and reference tables are decoded once for all profiles, and the history entries
+        of each profile are a slice of the to_frame Dataframe (computed if df is not provided): this is
+        the fast path for multi-profile files (merged *_prof.nc, BGC BR/BD files).
+        ds can also be the profile_frame of the dataset, df is then required (see cache.profiles_history).
+    """
+    if df is None:
+        df = to_frame(ds)
+    with stats.stage('history.format'):
+        pf = ds if isinstance(ds, pd.DataFrame) else profile_frame(ds)
+        profiles = pf['N_PROF'].values
+        M, C, U = pf['JULD'].values, pf['DATE_CREATION'].values, pf['DATE_UPDATE'].values
+        cols = _entry_columns(df)
+        start = np.searchsorted(cols['N_PROF'], profiles, side='left')
+        stop = np.searchsorted(cols['N_PROF'], profiles, side='right')
+    for k, i_prof in enumerate(profiles):
+        with stats.stage('history.format'):
+            entries = dict((name, v[start[k]:stop[k]]) for name, v in cols.items())
+            text = _format_header(i_prof, M[k], C[k], U[k]) + _format_entries(entries, verb=verb)
+        yield int(i_prof), text
+
+def print_history(ds, i_prof, verb=0, df=None):
+    """ Print the history of a profile from a xarray dataset (see format_profile)"""
+    text = format_profile(ds, i_prof, verb=verb, df=df)
+    with stats.stage('history.write'):
+        sys.stdout.write(text)
 
 # ncdhistory aoml/1900143/profiles/D1900143_300.nc
 # ncdhistory aoml/1900143/profiles/D1900143_065.nc
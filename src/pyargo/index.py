@@ -5,74 +5,620 @@
 __author__ = 'guillaumemaze'
 
 import os
+import json
+import shutil
+import hashlib
 import pandas as pd
 import numpy as np
+import sys
+import traceback
 import multiprocessing
+from multiprocessing.pool import ThreadPool
 from functools import partial
+from .dates import parse as parse_dates, _codes as char_codes
+from . import stats
 
-def read(index_file):
+COLUMNS = ['file', 'date', 'latitude', 'longitude', 'ocean', 'profiler_type', 'institution', 'date_update',
+           'profile_temp_qc', 'profile_psal_qc', 'profile_doxy_qc',
+           'ad_psal_adjustment_mean', 'ad_psal_adjustment_deviation',
+           'gdac_date_creation', 'gdac_date_update', 'n_levels']
+DATES = ['date', 'date_update', 'gdac_date_creation', 'gdac_date_update']
+DTYPES = {'latitude': np.float32, 'longitude': np.float32,
+          'profiler_type': str,
+          'profile_temp_qc': str, 'profile_psal_qc': str, 'profile_doxy_qc': str,
+          'ad_psal_adjustment_mean': np.float32, 'ad_psal_adjustment_deviation': np.float32,
+          'n_levels': int}
+
+FILE_PATTERN = r'^(?P<dac>[^/]+)/(?P<wmo>\d+)/profiles/(?P<prefix>[A-Z]*)\d+_(?P<cycle>\d+)(?P<direction>D?)\.nc$'
+FILE_COLUMNS = ['dac', 'wmo', 'cycle', 'prefix', 'descending']
+
+def _substrings(codes, start, stop):
+    """Characters codes[i, start[i]:stop[i]] of each row of a characters codes array, left aligned and 0 padded"""
+    width = max(int(np.max(stop - start)), 1) if len(codes) else 1
+    pos = start[:, np.newaxis] + np.arange(width)
+    sub = np.take_along_axis(codes, np.clip(pos, 0, codes.shape[1] - 1), axis=1)
+    sub[pos >= stop[:, np.newaxis]] = 0
+    return sub
+
+def _strings(sub):
+    """Object array of the strings of a characters codes array"""
+    sub = np.ascontiguousarray(sub)
+    kind = 'S' if sub.dtype == np.uint8 else 'U'
+    return sub.view('%s%i' % (kind, sub.shape[1]))[:, 0].astype('U').astype(object)
+
+def _digits(sub, n):
+    """Integer value of the n first characters codes of each row, and whether they are n >= 1 digits"""
+    d = sub.astype(np.int16) - ord('0')
+    inside = np.arange(sub.shape[1]) < n[:, np.newaxis]
+    valid = (n > 0) & (((d >= 0) & (d <= 9)) | ~inside).all(axis=1)
+    value = np.zeros(len(sub), dtype=np.int64)
+    for i in range(sub.shape[1]):
+        value = np.where(inside[:, i], value * 10 + d[:, i], value)
+    return value, valid
+
+def _parse_files(files):
+    """
+        Match profile file paths with FILE_PATTERN on their characters codes (much faster than a regular
+        expression on each path)
+
+        Return the codes, a boolean match array, the (start, stop) bounds of the dac, wmo, prefix, float
+        number, cycle and direction fields of the paths, and the (value, number of digits, first digit code)
+        of the wmo, float number and cycle fields.
+    """
+    codes = char_codes(np.asarray(files, dtype=object))[0]
+    codes = codes.reshape(-1, codes.shape[-1])
+    col = np.arange(codes.shape[1])
+    length = (codes != 0).sum(axis=1)
+    slashes = np.cumsum(codes == ord('/'), axis=1, dtype=np.int16)
+    s1, s2, s3 = [np.argmax(slashes >= k, axis=1) for k in [1, 2, 3]]
+    # File name: upper case prefix, float number, '_', cycle number, optional 'D' and '.nc'
+    name = col > s3[:, np.newaxis]
+    p = np.argmax(name & ((codes < ord('A')) | (codes > ord('Z'))), axis=1)
+    u = np.argmax(name & (codes == ord('_')), axis=1)
+    end = np.maximum(length - 3, 0)
+    descending = codes[np.arange(len(codes)), np.maximum(end - 1, 0)] == ord('D')
+    bounds = {'dac': (np.zeros_like(s1), s1), 'wmo': (s1 + 1, s2), 'prefix': (s3 + 1, p), 'number': (p, u),
+              'cycle': (u + 1, end - descending), 'direction': (end - descending, end)}
+
+    def equals(start, stop, text):
+        ref = np.array([ord(c) for c in text])
+        return (stop - start == len(ref)) & (_substrings(codes, start, start + len(ref)) == ref).all(axis=1)
+    match = (slashes[:, -1] == 3) & (s1 > 0) & (p > s3) & (u > p)
+    match &= equals(s2 + 1, s3, 'profiles') & equals(end, length, '.nc')
+    numbers = {}
+    for field in ['wmo', 'number', 'cycle']:
+        start, stop = bounds[field]
+        sub = _substrings(codes, start, stop)
+        value, valid = _digits(sub, stop - start)
+        match &= valid
+        numbers[field] = value, stop - start, sub[:, 0]
+    return codes, match, bounds, numbers
+
+def _categorical(files):
+    """Unique values of an array of files and the codes to take them back (None when already unique)"""
+    if isinstance(getattr(files, 'dtype', None), pd.CategoricalDtype):
+        files = pd.Categorical(files)
+        return np.asarray(files.categories, dtype=object), files.codes
+    return np.asarray(files, dtype=object), None
+
+def split_file(files):
+    """
+        Split Argo profile file paths into a Dataframe with the dac, wmo, prefix (R, D, BR, BD, ...),
+        cycle number and direction ('D' for descending profiles, '' otherwise) of each file
+
+        Categorical files (eg: loaded from cache with categorical=True) are only parsed once per category.
+    """
+    files, take = _categorical(files)
+    codes, match, bounds = _parse_files(files)[:3]
+    parts = pd.DataFrame(dict((c, np.where(match, _strings(_substrings(codes, *bounds[c])), np.nan))
+                              for c in ['dac', 'wmo', 'prefix', 'cycle', 'direction']),
+                         columns=['dac', 'wmo', 'prefix', 'cycle', 'direction'])
+    return parts if take is None else parts.reindex(take).reset_index(drop=True)
+
+def _compact_files(files):
+    """
+        Compact columns (see FILE_COLUMNS) of an array of profile file paths, or None if some paths would not
+        be rebuilt identically by file_path
+    """
+    files, take = _categorical(files)
+    if take is not None and (take < 0).any():
+        return None
+    codes, match, bounds, numbers = _parse_files(files)
+    wmo, n_wmo, first_wmo = numbers['wmo']
+    cycle, n_cycle, first_cycle = numbers['cycle']
+    # file_path writes the wmo with '%i' (twice) and the cycle number with '%03d':
+    match &= (n_wmo <= 10) & (wmo <= np.iinfo(np.int32).max) & ((n_wmo == 1) | (first_wmo != ord('0')))
+    match &= (numbers['number'][0] == wmo) & (numbers['number'][1] == n_wmo)
+    match &= (n_cycle <= 18) & ((n_cycle == 3) | ((n_cycle > 3) & (first_cycle != ord('0'))))
+    if not match.all():
+        return None
+    take = slice(None) if take is None else take
+    cycle = cycle[take]
+    return {'dac': pd.Categorical(_strings(_substrings(codes, *bounds['dac'])))[take],
+            'wmo': wmo[take].astype(np.int32),
+            'cycle': cycle.astype(_int_dtype(cycle)),
+            'prefix': pd.Categorical(_strings(_substrings(codes, *bounds['prefix'])))[take],
+            'descending': (bounds['direction'][1] > bounds['direction'][0])[take]}
+
+def _int_dtype(v):
+    """Smallest integer type holding all values of an integer array"""
+    lo, hi = (v.min(), v.max()) if len(v) else (0, 0)
+    for t in [np.int8, np.int16, np.int32]:
+        if np.iinfo(t).min <= lo and hi <= np.iinfo(t).max:
+            return t
+    return np.int64
+
+def file_path(ci):
+    """Rebuild the profile file paths of a compact index Dataframe (see to_compact) as a Series of strings"""
+    if 'file' in ci:
+        return ci['file'].astype(object)
+    wmo = ci['wmo'].astype(str)
+    cycle = pd.Series(ci['cycle'].values, index=ci.index).map('{:03d}'.format)
+    direction = pd.Series(np.where(ci['descending'].values, 'D', ''), index=ci.index)
+    return ci['dac'].astype(str) + '/' + wmo + '/profiles/' + ci['prefix'].astype(str) + wmo + '_' + \
+        cycle + direction + '.nc'
+
+def to_compact(ai):
+    """
+        Return a compact copy of an index Dataframe
+
+        The file path is split into categorical dac and prefix (R, D, BR, BD, ...), int32 wmo, integer
+        cycle number and boolean descending columns (see file_path to rebuild it). Paths not following
+        the profile file pattern are kept as a categorical file column instead.
+        String columns (QC flags, institution, ocean, profiler type) become categoricals and integer columns
+        use the smallest suitable type.
+    """
+    data = []
+    for col in ai.columns:
+        v = ai[col].values
+        if col == 'file':
+            split = _compact_files(v)
+            if split is not None:
+                data.extend(pd.Series(split[c], index=ai.index, name=c) for c in FILE_COLUMNS)
+                continue
+            v = pd.Categorical(v)
+        elif v.dtype == object:
+            v = pd.Categorical(v)
+        elif v.dtype.kind in 'iu':
+            v = v.astype(_int_dtype(v))
+        data.append(pd.Series(v, index=ai.index, name=col))
+    if not data:
+        return pd.DataFrame(index=ai.index)
+    # One block per column: a DataFrame of a mixed dictionary of columns consolidates them (slow)
+    return pd.concat(data, axis=1, copy=False)
+
+def from_compact(ci):
+    """Return the usual index Dataframe of a compact index Dataframe (see to_compact)"""
+    ai = pd.DataFrame({'file': file_path(ci).values}, index=ci.index)
+    for col in ci.columns:
+        if col == 'file' or col in FILE_COLUMNS:
+            continue
+        v = ci[col]
+        ai[col] = v.astype(object) if isinstance(v.dtype, pd.CategoricalDtype) else v
+    return ai
+
+def _mask(ai, box=None, dates=None, dac=None, profiler_type=None, qc=None):
+    """Boolean array of the rows of an index Dataframe matching all the given predicates (see iter_read)"""
+    keep = np.ones(len(ai), dtype=bool)
+    if box is not None:
+        lon = ai['longitude'].values
+        lat = ai['latitude'].values
+        if box[0] <= box[1]:
+            keep &= (lon >= box[0]) & (lon <= box[1])
+        else:
+            keep &= (lon >= box[0]) | (lon <= box[1])
+        keep &= (lat >= box[2]) & (lat <= box[3])
+    if dates is not None:
+        d = ai['date']
+        keep &= ((d >= pd.Timestamp(dates[0])) & (d < pd.Timestamp(dates[1]))).values
+    if dac is not None:
+        dacs = ai['dac'] if 'dac' in ai else ai['file'].str.split('/').str[0]
+        keep &= dacs.isin([str(d) for d in np.atleast_1d(dac)]).values
+    if profiler_type is not None:
+        keep &= ai['profiler_type'].isin([str(p) for p in np.atleast_1d(profiler_type)]).values
+    if qc is not None:
+        for col in qc:
+            keep &= ai[col].isin(list(np.atleast_1d(qc[col]))).values
+    return keep
+
+def select(ai, columns=None, **kwargs):
+    """
+        Select the rows of an index Dataframe (usual or compact) matching all the given predicates
+
+        See iter_read for the predicates (box, dates, dac, profiler_type, qc) and columns.
+    """
+    rows = ai[_mask(ai, **kwargs)]
+    return rows if columns is None else rows[list(columns)]
+
+def iter_read(index_file, columns=None, box=None, dates=None, dac=None, profiler_type=None, qc=None,
+              chunksize=100000):
+    """
+        Read the Argo detailed index txt file by chunks and yield the rows matching all the given predicates
+
+        columns: list of columns to return (default: all)
+        box: [lon_min, lon_max, lat_min, lat_max], with lon_min > lon_max for a box crossing the dateline
+        dates: [start, end] window on the profile 'date' (end excluded)
+        dac: one or a list of DAC names (first element of the 'file' path)
+        profiler_type: one or a list of profiler types
+        qc: dictionary of QC columns and accepted flag(s), eg: {'profile_temp_qc': ['A', 'B']}
+
+        Only the requested and predicate columns are parsed, and dates are parsed on matching rows only.
+    """
+    columns = list(COLUMNS) if columns is None else list(columns)
+    needed = set(columns)
+    if box is not None:
+        needed |= set(['longitude', 'latitude'])
+    if dates is not None:
+        needed.add('date')
+    if dac is not None:
+        needed.add('file')
+    if profiler_type is not None:
+        needed.add('profiler_type')
+    if qc is not None:
+        needed |= set(qc.keys())
+    usecols = [c for c in COLUMNS if c in needed]
+    dtype = dict((c, DTYPES.get(c, str)) for c in usecols if c in DTYPES or c in DATES)
+
+    stats.count('files_opened')
+    stats.count('bytes_read', os.path.getsize(index_file))
+    reader = pd.read_csv(index_file, sep=',', index_col=None, header=0, skiprows=8,
+                         usecols=usecols, dtype=dtype, chunksize=chunksize)
+    while True:
+        with stats.stage('index.parse'):
+            chunk = next(reader, None)
+        if chunk is None:
+            break
+        stats.count('index.rows', len(chunk))
+        chunk = chunk[_mask(chunk, box=box, dac=dac, profiler_type=profiler_type, qc=qc)]
+
+        with stats.stage('dates.parse'):
+            for col in DATES:
+                if col in needed:
+                    chunk[col] = parse_dates(chunk[col].values).astype('datetime64[ns]')
+        if dates is not None:
+            chunk = chunk[_mask(chunk, dates=dates)]
+
+        yield chunk[columns]
+
+def _empty(columns):
+    """Empty index Dataframe with the dtypes of the columns as read by iter_read"""
+    def dtype(col):
+        if col in DATES:
+            return 'datetime64[ns]'
+        t = DTYPES.get(col, str)
+        return object if t is str else t
+    return pd.DataFrame(dict((c, np.array([], dtype=dtype(c))) for c in columns), columns=list(columns))
+
+def read(index_file, compact=False, **kwargs):
     """
         Read the Argo detailed index txt file and return it as a Panda Dataframe
+
+        Optional arguments (columns, box, dates, dac, profiler_type, qc, chunksize) are passed to iter_read
+        to only load a subset of the index.
+        Return a compact Dataframe with compact=True (see to_compact).
     """
-    return pd.read_csv(index_file,
-                       sep=',', index_col=None, header=0, skiprows=8,
-                       parse_dates=[1, 7, 13, 14],
-                       dtype={'latitude': np.float32, 'longitude': np.float32,
-                              'profiler_type': np.str,
-                              'profile_temp_qc': np.str, 'profile_psal_qc': np.str, 'profile_doxy_qc': np.str,
-                              'ad_psal_adjustment_mean': np.float32, 'ad_psal_adjustment_deviation': np.float32,
-                              'n_levels': np.int})
+    chunks = list(iter_read(index_file, **kwargs))
+    if chunks:
+        ai = pd.concat(chunks, ignore_index=True)
+    else:
+        ai = _empty(kwargs.get('columns') or COLUMNS)
+    return to_compact(ai) if compact else ai
+
+def _source(index_file, check='mtime'):
+    """Identity of an index file: path, size and modification time, or content hash with check='hash'"""
+    st = os.stat(index_file)
+    source = {'path': os.path.abspath(index_file), 'size': st.st_size}
+    if check == 'hash':
+        md5 = hashlib.md5()
+        with open(index_file, 'rb') as f:
+            for block in iter(partial(f.read, 1 << 20), b''):
+                md5.update(block)
+        source['md5'] = md5.hexdigest()
+    else:
+        source['mtime'] = st.st_mtime
+    return source
+
+def _codes_dtype(n):
+    """Smallest signed integer type to hold categorical codes up to n (and -1 for missing values)"""
+    for t in [np.int8, np.int16, np.int32]:
+        if n < np.iinfo(t).max:
+            return t
+    return np.int64
+
+CACHE_VERSION = 2
+
+def _save_categories(fname, categories):
+    """Save string categories as UTF-8 text, one per line"""
+    with open(fname, 'wb') as f:
+        f.write(''.join(u'%s\n' % c for c in categories).encode('utf-8'))
+
+def _load_categories(fname):
+    with open(fname, 'rb') as f:
+        return np.array(f.read().decode('utf-8').split(u'\n')[:-1], dtype=object)
 
-def load(droot, ifile="argo_profile_detailled_index.txt", verb=False, cache=True, cachedir='.'):
+def to_cache(ai, store, source=None):
     """
-        Load an Argo detailed index file
-        If read for the first time, a copy of the index is saved locally as a hdf5 file from
-        which it is loaded on new calls much faster.
+        Save an index Dataframe into a columnar cache directory
+
+        Each column is saved as a numpy .npy file, string columns as categorical codes (.npy) and categories
+        (UTF-8 text, one per line). source is the identity of the index file (see _source) used to invalidate
+        the cache.
     """
-    pre, ext = os.path.splitext(ifile)
-    index = os.path.expanduser(os.path.join(droot, ifile))
+    tmp = "%s.tmp%i" % (store, os.getpid())
+    if os.path.isdir(tmp):
+        shutil.rmtree(tmp)
+    os.makedirs(tmp)
+    kinds = {}
+    with stats.stage('index.cache_write'):
+        for col in ai.columns:
+            v = ai[col]
+            if v.dtype == object or isinstance(v.dtype, pd.CategoricalDtype):
+                codes, categories = pd.factorize(v)
+                np.save(os.path.join(tmp, col + '.codes.npy'), codes.astype(_codes_dtype(len(categories))))
+                _save_categories(os.path.join(tmp, col + '.categories.txt'), categories)
+                kinds[col] = 'categorical'
+            else:
+                np.save(os.path.join(tmp, col + '.npy'), v.values)
+                kinds[col] = 'array'
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump({'version': CACHE_VERSION, 'source': source, 'nrows': len(ai), 'columns': list(ai.columns),
+                   'kinds': kinds}, f)
+    if os.path.isdir(store):
+        shutil.rmtree(store)
+    os.rename(tmp, store)
+
+def cache_meta(store):
+    """Return the metadata of a cache directory, or None if there is no valid cache"""
+    try:
+        with open(os.path.join(store, 'meta.json')) as f:
+            meta = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    return meta if meta.get('version') == CACHE_VERSION else None
 
+def from_cache(store, columns=None, mmap=True, categorical=False):
+    """
+        Load an index Dataframe from a columnar cache directory
+
+        Only the requested columns are read. Numerical and date columns are memory-mapped with mmap=True: the
+        Dataframe columns are read-only views of the cache files, nothing is read until they are used.
+        String columns are returned as categoricals with categorical=True (fast), as strings otherwise.
+    """
+    meta = cache_meta(store)
+    columns = meta['columns'] if columns is None else list(columns)
+    mode = 'r' if mmap else None
+    data = {}
+
+    def npload(name, mode):
+        stats.count('files_opened')
+        stats.count('bytes_mapped' if mode else 'bytes_read', os.path.getsize(os.path.join(store, name)))
+        return np.asarray(np.load(os.path.join(store, name), mmap_mode=mode))  # ndarray view of the np.memmap
+    with stats.stage('index.cache_read'):
+        for col in columns:
+            if meta['kinds'][col] == 'categorical':
+                codes = npload(col + '.codes.npy', mode)
+                stats.count('files_opened')
+                stats.count('bytes_read', os.path.getsize(os.path.join(store, col + '.categories.txt')))
+                categories = _load_categories(os.path.join(store, col + '.categories.txt'))
+                if categorical:
+                    data[col] = pd.Categorical.from_codes(codes, categories)
+                else:
+                    data[col] = pd.Categorical.from_codes(codes, categories).astype(object)
+            else:
+                data[col] = npload(col + '.npy', mode)
+        # No copy, to keep the memory-mapped arrays (one block per column)
+        return pd.DataFrame(data, columns=columns, copy=False)
+
+def cache_path(droot, ifile="argo_profile_detailled_index.txt", cachedir='.'):
+    """Path of the cache directory of an Argo index file"""
+    pre, ext = os.path.splitext(ifile)
     p = os.path.join(droot, pre)
     p = os.path.normcase(p)
     p = p.replace(os.path.sep, '')
     p = p.replace('-', '')
     p = p.replace('_', '')
-    store = os.path.join(cachedir, p + '.h5')
+    return os.path.join(cachedir, p)
+
+def _compact_columns(compact_columns, columns):
+    """Columns of a compact index holding the given index columns (the file path may be split)"""
+    if columns is None:
+        return list(compact_columns)
+    out = []
+    for col in columns:
+        out.extend(FILE_COLUMNS if col == 'file' and 'file' not in compact_columns else [col])
+    return out
+
+def load(droot, ifile="argo_profile_detailled_index.txt", verb=False, cache=True, cachedir='.',
+         columns=None, check='mtime', mmap=True, categorical=False, compact=False):
+    """
+        Load an Argo detailed index file
+        If read for the first time, a copy of the index is saved locally in a columnar cache directory from
+        which it is loaded on new calls much faster.
+        The cache is rebuilt when the index file size or modification time changed (or content with check='hash').
+        Only the requested columns are loaded from the cache, see from_cache for mmap and categorical.
+        Return a compact Dataframe with compact=True (see to_compact). The compact index is cached as well
+        (in the 'compact' directory of the cache).
+    """
+    index = os.path.expanduser(os.path.join(droot, ifile))
+    store = cache_path(droot, ifile, cachedir)
 
     if cache:
-        # Try to load the index from cache, or compute/save it if not found
-        if os.path.isfile(store):
+        # Try to load the index from cache, or compute/save it if not found or outdated
+        source = _source(index, check)
+        meta = cache_meta(store)
+        if meta is not None and meta['source'] == source:
+            if compact:
+                compact_store = os.path.join(store, 'compact')
+                compact_meta = cache_meta(compact_store)
+                if compact_meta is not None and compact_meta['source'] == source:
+                    if verb:
+                        print("Loading cached compact Argo index:\n%s" % compact_store)
+                    stats.count('index.compact_cache_hit')
+                    return from_cache(compact_store, columns=_compact_columns(compact_meta['columns'], columns),
+                                      mmap=mmap, categorical=True)
             if verb:
-                print ("Loading cached Argo index file:\n%s") % (store)
-            ai = pd.read_hdf(store, 'index')
+                print("Loading cached Argo index file:\n%s" % store)
+            stats.count('index.cache_hit')
+            if not compact:
+                return from_cache(store, columns=columns, mmap=mmap, categorical=categorical)
+            ai = from_cache(store, mmap=mmap, categorical=True)
         else:
             if verb:
-                print ("Loading and Caching Argo index file:\n%s") % (index)
+                print("Loading and Caching Argo index file:\n%s" % index)
+            stats.count('index.cache_miss')
             ai = read(index)
-            ai.to_hdf(store, 'index')
+            to_cache(ai, store, source)
+            if not compact:
+                return ai if columns is None else ai[list(columns)]
+        # Cache all the compact columns, to serve any later selection of columns
+        ci = to_compact(ai)
+        to_cache(ci, os.path.join(store, 'compact'), source)
+        return ci if columns is None else ci[_compact_columns(ci.columns, columns)]
+    if verb:
+        print("Loading Argo index file:\n%s" % index)
+    ai = read(index, columns=columns)
+    return to_compact(ai) if compact else ai
+
+def diff(old, new):
+    """
+        Compare two index Dataframes using the 'file' and 'date_update' columns
+
+        Return the added and modified rows (from new) and the removed rows (from old).
+    """
+    previous = pd.Series(old['date_update'].values, index=old['file'].values)
+    in_old = new['file'].isin(previous.index).values
+    added = new[~in_old]
+    kept = new[in_old]
+    before = previous.reindex(kept['file'].values).values
+    after = kept['date_update'].values
+    changed = (before != after) & ~(pd.isnull(before) & pd.isnull(after))
+    modified = kept[changed]
+    removed = old[~old['file'].isin(new['file']).values]
+    return added, modified, removed
+
+def refresh(droot, ifile="argo_profile_detailled_index.txt", cachedir='.', verb=False, check='mtime'):
+    """
+        Load an Argo detailed index file and tell what changed since it was cached
+
+        Return (ai, added, modified, removed): the index Dataframe and the rows added, modified or removed
+        since the previous cached version (see diff). When the index file changed, it is read in full and the
+        cache is entirely rewritten (not updated in place). Downstream processing can then be done only on the
+        delta, eg:
+            ai, added, modified, removed = refresh(droot)
+            par_traverse(pd.concat([added, modified]), rowfunc)
+            extract.update(store, droot, added, modified, removed)
+    """
+    index = os.path.expanduser(os.path.join(droot, ifile))
+    store = cache_path(droot, ifile, cachedir)
+    meta = cache_meta(store)
+    source = _source(index, check)
+    if meta is not None and meta['source'] == source:
+        if verb:
+            print("Argo index file unchanged:\n%s" % index)
+        ai = from_cache(store)
+        added, modified, removed = ai.iloc[:0], ai.iloc[:0], ai[['file', 'date_update']].iloc[:0]
     else:
+        if meta is None:
+            old = pd.DataFrame({'file': np.array([], dtype=object),
+                                'date_update': np.array([], dtype='datetime64[ns]')})
+        else:
+            # Read in memory, not memory-mapped: the cache files are removed by to_cache below
+            old = from_cache(store, columns=['file', 'date_update'], mmap=False)
         if verb:
-            print ("Loading Argo index file:\n%s") % (index)
+            print("Loading and Caching updated Argo index file:\n%s" % index)
         ai = read(index)
-    return ai
+        to_cache(ai, store, source)
+        added, modified, removed = diff(old, ai)
+    if verb:
+        print("%i added, %i modified and %i removed profiles" % (len(added), len(modified), len(removed)))
+    return ai, added, modified, removed
+
+def _traverse_chunk(args):
+    """
+        Apply a function onto each row of a chunk of the Argo index, capturing errors
+
+        Return the results and, with collect=True, the statistics of the chunk (to be merged by a parent process).
+    """
+    func, chunk, collect = args
+    if collect:
+        stats.reset()
+    out = []
+    for index, row in chunk.iterrows():
+        try:
+            out.append((index, func(row), None))
+        except Exception:
+            out.append((index, None, traceback.format_exc()))
+    return out, stats.report() if collect else None
+
+def _progress(done, total):
+    sys.stderr.write("\r%i/%i rows" % (done, total))
+    if done == total:
+        sys.stderr.write("\n")
 
-def par_traverse(ai, rowfunc, num_cores='ncpu'):
-    """"Apply a function on each of the Argo index rows, in parallel"""
-    if num_cores=='ncpu':
+def iter_traverse(ai, rowfunc, num_cores='ncpu', chunksize=64, backend='process', progress=False):
+    """
+        Apply a function on each of the Argo index rows, in parallel, and yield (index, result, error) tuples
+
+        Rows are sent to workers by chunks of chunksize rows, a new chunk being given to a worker as soon as
+        it is done, and results are yielded as they come (not in the index order).
+        error is None, or the traceback of the exception raised by rowfunc on the row.
+        backend: 'process' (rowfunc must be picklable, ie defined at the module level) or 'thread'.
+        progress: True to report progress on stderr, or a function called with (done, total).
+    """
+    if num_cores == 'ncpu':
         num_cores = multiprocessing.cpu_count()
-    num_partitions = num_cores #number of partitions to split dataframe
-    ai_split = np.array_split(ai, num_partitions)
-
-    def parfun(func, d):
-        """Function to apply "rowfunc" onto each of rows in a chunk d of Argo mono-profile files"""
-        for index, row in d.iterrows():
-            d.ix[index] = func(row)
-        return d
-    chunkfunc = partial(parfun, rowfunc)
-
-    pool = multiprocessing.Pool(num_cores)
-    results = pool.map(chunkfunc, ai_split)
-    ai = pd.concat(results)
-    pool.close()
-    pool.join()
-    return ai
\ No newline at end of file
+    if progress is True:
+        progress = _progress
+    if backend == 'process':
+        pool = multiprocessing.Pool(num_cores)
+    elif backend == 'thread':
+        pool = ThreadPool(num_cores)
+    else:
+        raise ValueError("backend must be 'process' or 'thread'")
+
+    collect = backend == 'process' and stats.enabled()
+    chunks = ((rowfunc, ai.iloc[i:i + chunksize], collect) for i in range(0, len(ai), chunksize))
+    done = 0
+    try:
+        for out, chunk_stats in pool.imap_unordered(_traverse_chunk, chunks):
+            if chunk_stats is not None:
+                stats.merge(chunk_stats)
+            for item in out:
+                yield item
+            done += len(out)
+            if progress:
+                progress(done, len(ai))
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+def par_traverse(ai, rowfunc, num_cores='ncpu', chunksize=64, backend='process', progress=False):
+    """
+        Apply a function on each of the Argo index rows, in parallel
+
+        Return the results and the errors:
+            - results is a Series (or a Dataframe if rowfunc returns Series or dictionaries)
+              with the rowfunc outputs of successful rows, in the order of the index
+            - errors is a Series with the traceback of rows where rowfunc raised an exception
+        The index Dataframe is not modified. See iter_traverse for the other options.
+
+        Warning: par_traverse used to return the index Dataframe with its rows replaced by the rowfunc outputs,
+        existing callers must now unpack the tuple, eg: results, errors = par_traverse(ai, rowfunc)
+    """
+    results, errors = {}, {}
+    for index, result, error in iter_traverse(ai, rowfunc, num_cores=num_cores, chunksize=chunksize,
+                                              backend=backend, progress=progress):
+        if error is None:
+            results[index] = result
+        else:
+            errors[index] = error
+    order = [i for i in ai.index if i in results]
+    values = [results[i] for i in order]
+    if values and all(isinstance(v, (dict, pd.Series)) for v in values):
+        results = pd.DataFrame(values, index=order)
+    else:
+        results = pd.Series(values, index=order, dtype=object if not values else None)
+    failed = [i for i in ai.index if i in errors]
+    errors = pd.Series([errors[i] for i in failed], index=failed, dtype=object)
+    return results, errors
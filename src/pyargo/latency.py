@@ -0,0 +1,112 @@
+# -*coding: UTF-8 -*-
+#
+# Provide time lag analytics of Argo profiles
+#
+# Lags are computed with vectorized operations on a history table (see history.to_frame and
+# extract.read) or on an index Dataframe (see index.read), and can be summarized by DAC,
+# institution or float.
+#
+__author__ = 'guillaumemaze'
+
+import numpy as np
+import pandas as pd
+from . import index as detailedindex
+
+STEPS = ['ARFM', 'ARGQ', 'ARUP', 'ARSQ']
+
+def _keys(df):
+    return [k for k in ['file', 'N_PROF'] if k in df]
+
+def _add_file_keys(lags, files):
+    """Add dac and wmo columns derived from profile file paths"""
+    parts = detailedindex.split_file(files)
+    lags['dac'] = parts['dac'].values
+    lags['wmo'] = parts['wmo'].values
+    return lags
+
+def entry_lags(df):
+    """Lags of each history entry of a history table since the measurement and since the file creation"""
+    return pd.DataFrame({'measurement_to_history': df['HISTORY_DATE'] - df['JULD'],
+                         'creation_to_history': df['HISTORY_DATE'] - df['DATE_CREATION']}, index=df.index)
+
+def profile_lags(df):
+    """
+        Lags of each profile of a history table, one row per profile
+
+        Return the profile dates, the first date of each processing step (ARFM, ARGQ, ARUP, ARSQ, NaT
+        if the step is not in the history), the institution of the first history entry and the lags:
+        measurement to file creation, creation to update, measurement to ARFM, between consecutive
+        steps and measurement to ARSQ (delayed mode QC latency).
+        Profiles of a store (see extract.read) also get dac and wmo columns.
+    """
+    keys = _keys(df)
+    g = df.groupby(keys, sort=False)
+    lags = g[['JULD', 'DATE_CREATION', 'DATE_UPDATE']].first()
+
+    named = df[df['HISTORY_INSTITUTION'] != '']
+    lags['institution'] = named.groupby(keys, sort=False)['HISTORY_INSTITUTION'].first().reindex(lags.index)
+
+    steps = df[df['HISTORY_STEP'].isin(STEPS)]
+    steps = steps.groupby(keys + ['HISTORY_STEP'])['HISTORY_DATE'].min().unstack('HISTORY_STEP')
+    steps = steps.reindex(index=lags.index, columns=STEPS).astype('datetime64[ns]')
+    for step in STEPS:
+        lags[step] = steps[step]
+
+    lags['measurement_to_creation'] = lags['DATE_CREATION'] - lags['JULD']
+    lags['creation_to_update'] = lags['DATE_UPDATE'] - lags['DATE_CREATION']
+    lags['measurement_to_ARFM'] = lags['ARFM'] - lags['JULD']
+    for a, b in zip(STEPS[:-1], STEPS[1:]):
+        lags['%s_to_%s' % (a, b)] = lags[b] - lags[a]
+    lags['measurement_to_ARSQ'] = lags['ARSQ'] - lags['JULD']
+
+    lags = lags.reset_index()
+    if 'file' in keys:
+        _add_file_keys(lags, lags['file'])
+    return lags
+
+def index_lags(ai):
+    """
+        Lags of each profile of an index Dataframe
+
+        Return the dac, wmo and institution of profiles with the lags: measurement to GDAC update,
+        measurement to GDAC file creation and GDAC file creation to GDAC update.
+    """
+    lags = pd.DataFrame({'file': ai['file'].values}, index=ai.index)
+    _add_file_keys(lags, ai['file'])
+    if 'institution' in ai:
+        lags['institution'] = ai['institution'].values
+    lags['measurement_to_update'] = ai['date_update'] - ai['date']
+    if 'gdac_date_creation' in ai:
+        lags['measurement_to_gdac'] = ai['gdac_date_creation'] - ai['date']
+        lags['gdac_creation_to_update'] = ai['gdac_date_update'] - ai['gdac_date_creation']
+    return lags
+
+def summarize(lags, by='dac', columns=None):
+    """
+        Count, mean, median and max of lags grouped by one or more columns (eg: 'dac', 'institution', 'wmo')
+
+        All timedelta columns are summarized if columns is not provided.
+    """
+    if columns is None:
+        columns = [c for c in lags.columns if lags[c].dtype.kind == 'm']
+    return lags.groupby(by)[columns].agg(['count', 'mean', 'median', 'max'])
+
+def humanize(td):
+    """
+        Convert an array of timedeltas to readable strings: '+3 days 04h05', '-04h05', '+5 mins' or 'NaT'
+    """
+    td = np.asarray(td, dtype='timedelta64[ns]')
+    nat = np.isnat(td)
+    sign = np.where(td < np.timedelta64(0, 'ns'), '-', '+')
+    mins = np.where(nat, 0, np.abs(td.view(np.int64)) // (60 * 10 ** 9))
+    days, mins = np.divmod(mins, 1440)
+    hours, mins = np.divmod(mins, 60)
+
+    def pad(v):
+        return np.char.zfill(v.astype('U'), 2)
+    hm = np.char.add(np.char.add(pad(hours), 'h'), pad(mins))
+    out = np.where(days > 0, np.char.add(np.char.add(days.astype('U'), ' days '), hm),
+                   np.where(hours > 0, hm, np.char.add(mins.astype('U'), ' mins')))
+    out = np.char.add(sign, out)
+    out[nat] = 'NaT'
+    return out.astype(object)
@@ -0,0 +1,96 @@
+# -*coding: UTF-8 -*-
+#
+# Provide a bitmap index of the QC tests performed and failed on each profile
+#
+# The index is a Dataframe with one row per profile and two uint64 columns where
+# bit i is set if the QC test number i was performed (QCP) or failed (QCF),
+# according to the HISTORY_ACTION 'QCP$' and 'QCF$' entries of the profile history.
+#
+__author__ = 'guillaumemaze'
+
+import numpy as np
+import pandas as pd
+from functools import partial
+from . import history
+from . import extract
+from . import index as detailedindex
+
+def build(df):
+    """Build the QC tests bitmap index from a history Dataframe (see history.to_frame)
+
+        Rows are grouped by profile, ie by 'file' (if the column is present) and 'N_PROF'.
+        Malformed QCTEST values are ignored and counted in the 'QCERR' column.
+    """
+    keys = [k for k in ['file', 'N_PROF'] if k in df.columns]
+    values = history.decodeqctests(df['HISTORY_QCTEST'].values, packed=True)
+    bad = np.ma.getmaskarray(values)
+    values = values.filled(0)
+    action = df['HISTORY_ACTION'].values
+    zero = np.uint64(0)
+    qcp = np.where(action == 'QCP$', values, zero).astype(np.uint64)
+    qcf = np.where(action == 'QCF$', values, zero).astype(np.uint64)
+
+    # Reduce entries profile by profile with sorted group boundaries:
+    if not len(df):
+        qi = df[keys].copy()
+        for name, dtype in [('QCP', np.uint64), ('QCF', np.uint64), ('QCERR', np.int32)]:
+            qi[name] = np.array([], dtype=dtype)
+        return qi
+    gid = df.groupby(keys, sort=False).ngroup().values
+    order = np.argsort(gid, kind='mergesort')
+    starts = np.r_[0, np.nonzero(np.diff(gid[order]))[0] + 1]
+    qi = df[keys].iloc[order[starts]].reset_index(drop=True)
+    qi['QCP'] = np.bitwise_or.reduceat(qcp[order], starts)
+    qi['QCF'] = np.bitwise_or.reduceat(qcf[order], starts)
+    qi['QCERR'] = np.add.reduceat(bad[order].astype(np.int32), starts)
+    return qi
+
+def _row_qctests(droot, row):
+    return extract.file_history(row['file'], droot)[['file', 'N_PROF', 'HISTORY_ACTION', 'HISTORY_QCTEST']]
+
+def build_from_files(files, droot='', num_cores='ncpu', chunksize=16, backend='process', progress=False):
+    """Build the QC tests bitmap index from a list of Argo profile files
+
+        files can be the 'file' column of an index Dataframe, paths are relative to droot.
+        Files are decoded in parallel with index.par_traverse (see iter_traverse for the options).
+        Raise an IOError with the traceback of the first file that could not be decoded.
+    """
+    ai = pd.DataFrame({'file': np.asarray(files, dtype=object)})
+    frames, errors = detailedindex.par_traverse(ai, partial(_row_qctests, droot), num_cores=num_cores,
+                                                chunksize=chunksize, backend=backend, progress=progress)
+    if len(errors):
+        raise IOError("Could not decode %i file(s), first one is %s:\n%s" % (
+            len(errors), ai.loc[errors.index[0], 'file'], errors.iloc[0]))
+    if not len(frames):
+        return build(pd.DataFrame({'file': [], 'N_PROF': [], 'HISTORY_ACTION': [], 'HISTORY_QCTEST': []}))
+    return build(pd.concat(list(frames), ignore_index=True))
+
+def _select(qi, column, tests, how):
+    mask = np.uint64(0)
+    for t in np.atleast_1d(tests):
+        if not 0 <= t < 64:
+            raise ValueError("QC test numbers must be in [0, 63], got %s" % t)
+        mask |= np.uint64(1) << np.uint64(t)
+    v = qi[column].values.astype(np.uint64) & mask
+    if how == 'any':
+        return qi[v != 0]
+    elif how == 'all':
+        return qi[v == mask]
+    else:
+        raise ValueError("how must be 'any' or 'all'")
+
+def failed(qi, tests, how='any'):
+    """Return profiles of the index where any (or all) of the QC tests failed"""
+    return _select(qi, 'QCF', tests, how)
+
+def performed(qi, tests, how='any'):
+    """Return profiles of the index where any (or all) of the QC tests were performed"""
+    return _select(qi, 'QCP', tests, how)
+
+def save(qi, store):
+    """Save the QC tests bitmap index into a Parquet file (requires pyarrow, see the 'arrow' extra)"""
+    qi.to_parquet(store, index=False)
+
+def load(store):
+    """Load a QC tests bitmap index from a Parquet file"""
+    return pd.read_parquet(store)
@@ -0,0 +1,180 @@
+# -*coding: UTF-8 -*-
+#
+# Consolidate the history of many Argo profile files into one NetCDF4 store
+#
+# History entries are stored as contiguous ragged arrays (CF conventions): the entries of all
+# profiles along a N_ENTRY dimension, with the ROW_OFFSET and ROW_SIZE of each profile along
+# N_PROF. Profiles are sorted by float and file, so that the profiles of a float are contiguous and are
+# indexed along N_FLOAT by FLOAT_OFFSET and FLOAT_SIZE. The history of a profile or of a float is
+# thus read with one slice of each variable (see history.read_ragged).
+#
+__author__ = 'guillaumemaze'
+
+import os
+from functools import partial
+import numpy as np
+import pandas as pd
+from . import history
+from . import extract
+from . import index as detailedindex
+try:
+    import netCDF4
+except ImportError:
+    netCDF4 = None
+
+STRING_WIDTHS = {'HISTORY_INSTITUTION': 4, 'HISTORY_STEP': 4, 'HISTORY_SOFTWARE': 4,
+                 'HISTORY_SOFTWARE_RELEASE': 4, 'HISTORY_REFERENCE': 64, 'HISTORY_ACTION': 4,
+                 'HISTORY_PARAMETER': 64, 'HISTORY_QCTEST': 16, 'FILE': 128}
+CHUNKSIZE = 65536
+
+def _to_julian(values):
+    """Convert datetime64 values to days since 1950-01-01, NaT are NaN"""
+    values = np.asarray(values, dtype='datetime64[ns]')
+    days = (values - history._JULD_REFERENCE).astype(np.int64) / 86400e9
+    days[np.isnat(values)] = np.nan
+    return days
+
+def _to_chars(values, width):
+    """Convert an array of strings to fixed width ascii bytes"""
+    values = np.asarray(values, dtype=object).astype('U')
+    return np.char.encode(values, 'ascii', 'replace').astype('S%i' % width)
+
+def _order(files):
+    """Order of files by float and file name, so that the profiles of a float are contiguous"""
+    wmo = pd.to_numeric(detailedindex.split_file(files)['wmo'], errors='coerce').fillna(-1).values
+    return np.lexsort((np.asarray(files, dtype=object).astype('U'), wmo))
+
+def create(store):
+    """Create an empty ragged history store, return the open netCDF4 Dataset"""
+    if netCDF4 is None:
+        raise ImportError("netCDF4 is required to write ragged history stores")
+    nc = netCDF4.Dataset(store, 'w', format='NETCDF4')
+    nc.title = 'Argo profiles history'
+    nc.featureType = 'profile'
+    for dim in ['N_FLOAT', 'N_PROF', 'N_ENTRY']:
+        nc.createDimension(dim, None)
+    for width in set(STRING_WIDTHS.values()):
+        nc.createDimension('STRING%i' % width, width)
+
+    def var(name, dtype, dim, width=None, **attrs):
+        dims = (dim,) if width is None else (dim, 'STRING%i' % width)
+        chunks = (CHUNKSIZE,) if width is None else (CHUNKSIZE, width)
+        fill = np.nan if dtype.startswith('f') else None
+        v = nc.createVariable(name, 'S1' if width else dtype, dims, zlib=True, complevel=4, shuffle=True,
+                              chunksizes=chunks, fill_value=fill)
+        if width:
+            v._Encoding = 'ascii'
+        for k in attrs:
+            v.setncattr(k, attrs[k])
+        return v
+    julian = {'units': 'days since 1950-01-01 00:00:00 UTC'}
+
+    var('FLOAT_WMO', 'i4', 'N_FLOAT')
+    var('FLOAT_OFFSET', 'i8', 'N_FLOAT', long_name='Index of the first profile of the float')
+    var('FLOAT_SIZE', 'i4', 'N_FLOAT', long_name='Number of profiles of the float')
+
+    var('FILE', 'S1', 'N_PROF', STRING_WIDTHS['FILE'])
+    var('FILE_N_PROF', 'i2', 'N_PROF', long_name='Index of the profile in the file')
+    var('WMO', 'i4', 'N_PROF')
+    for name in history.PROFILE_VARIABLES:
+        var(name, 'f8', 'N_PROF', **julian)
+    var('ROW_OFFSET', 'i8', 'N_PROF', long_name='Index of the first history entry of the profile')
+    var('ROW_SIZE', 'i4', 'N_PROF', sample_dimension='N_ENTRY', long_name='Number of history entries of the profile')
+
+    var('N_HISTORY', 'i2', 'N_ENTRY', long_name='Index of the entry in the profile history')
+    for name in history.HISTORY_STRINGS:
+        var(name, 'S1', 'N_ENTRY', STRING_WIDTHS[name])
+    var('HISTORY_DATE', 'f8', 'N_ENTRY', **julian)
+    for name in history.HISTORY_FLOATS:
+        var(name, 'f4', 'N_ENTRY')
+    return nc
+
+def append(nc, df):
+    """
+        Append history entries to an open store
+
+        df is a history Dataframe with a 'file' column (see extract.file_history and extract.read),
+        sorted by float, file, N_PROF and N_HISTORY, with floats that come after those already in the store.
+    """
+    if not len(df):
+        return
+    p0, e0 = len(nc.dimensions['N_PROF']), len(nc.dimensions['N_ENTRY'])
+    files, n_prof = df['file'].values, df['N_PROF'].values
+    new = np.ones(len(df), dtype=bool)
+    new[1:] = (files[1:] != files[:-1]) | (n_prof[1:] != n_prof[:-1])
+    starts = np.nonzero(new)[0]
+    sizes = np.diff(np.append(starts, len(df)))
+    p1, e1 = p0 + len(starts), e0 + len(df)
+
+    v = nc.variables
+    v['FILE'][p0:p1] = _to_chars(files[starts], STRING_WIDTHS['FILE'])
+    v['FILE_N_PROF'][p0:p1] = n_prof[starts]
+    wmo = pd.to_numeric(detailedindex.split_file(files[starts])['wmo'], errors='coerce')
+    v['WMO'][p0:p1] = wmo.fillna(-1).values.astype(np.int32)
+    for name in history.PROFILE_VARIABLES:
+        v[name][p0:p1] = _to_julian(df[name].values[starts])
+    v['ROW_OFFSET'][p0:p1] = e0 + starts
+    v['ROW_SIZE'][p0:p1] = sizes
+
+    v['N_HISTORY'][e0:e1] = df['N_HISTORY'].values
+    for name in history.HISTORY_STRINGS:
+        v[name][e0:e1] = _to_chars(df[name].values, STRING_WIDTHS[name])
+    v['HISTORY_DATE'][e0:e1] = _to_julian(df['HISTORY_DATE'].values)
+    for name in history.HISTORY_FLOATS:
+        v[name][e0:e1] = df[name].values.astype(np.float32)
+
+def close(nc):
+    """Write the index of floats of a store and close it"""
+    wmo = nc.variables['WMO'][:]
+    new = np.ones(len(wmo), dtype=bool)
+    new[1:] = wmo[1:] != wmo[:-1]
+    starts = np.nonzero(new)[0]
+    ends = np.append(starts[1:], len(wmo))
+    # Profiles of files not following the Argo file name pattern have no float:
+    keep = wmo[starts] >= 0
+    starts, ends = starts[keep], ends[keep]
+    if len(np.unique(wmo[starts])) != len(starts):
+        nc.close()
+        raise ValueError("Profiles of a float are not contiguous, files must be appended in order")
+    v = nc.variables
+    v['FLOAT_WMO'][:len(starts)] = wmo[starts]
+    v['FLOAT_OFFSET'][:len(starts)] = starts
+    v['FLOAT_SIZE'][:len(starts)] = ends - starts
+    nc.close()
+
+def write(df, store):
+    """Write a history Dataframe with a 'file' column (see extract.read) into a new ragged store"""
+    tmp = store + '.tmp'
+    nc = create(tmp)
+    df = df.sort_values(['file', 'N_PROF', 'N_HISTORY'], kind='mergesort')
+    append(nc, df.iloc[_order(df['file'].values)])
+    close(nc)
+    os.rename(tmp, store)
+
+def build(ai, droot, store, batch=10000, num_cores='ncpu', chunksize=16, backend='process', progress=False):
+    """
+        Decode the history of all profile files of an index Dataframe into a new ragged store
+
+        Files are sorted by float and decoded in parallel by batches of batch files (see index.par_traverse),
+        each batch being appended to the store. Return a Series with the traceback of the files that
+        could not be decoded.
+    """
+    ai = ai.iloc[_order(ai['file'].values)]
+    tmp = store + '.tmp'
+    nc = create(tmp)
+    errors = []
+    try:
+        for i in range(0, len(ai), batch):
+            rows = ai.iloc[i:i + batch]
+            results, failed = detailedindex.par_traverse(rows, partial(extract._row_history, droot),
+                                                         num_cores=num_cores, chunksize=chunksize,
+                                                         backend=backend, progress=progress)
+            if len(results):
+                append(nc, pd.concat(list(results.values), ignore_index=True))
+            errors.append(pd.Series(failed.values, index=rows.loc[failed.index, 'file'].values, dtype=object))
+    except Exception:
+        nc.close()
+        raise
+    close(nc)
+    os.rename(tmp, store)
+    return pd.concat(errors) if errors else pd.Series([], dtype=object)
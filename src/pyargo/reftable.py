@@ -1,66 +1,32 @@
 # -*coding: UTF-8 -*-
 __author__ = 'guillaumemaze'
 
-def table4(code):
-    """Reference table 4: history action codes"""
-    if not isinstance(code, str):
-        try:
-            code = code.astype(str).tostring().strip()
-        except:
-            code = code.astype(str).values.tostring().strip()
-
-    if code == 'AO':
-        return "AOML, USA"
-    elif code=="BO":
-        return "BODC, United Kingdom"
-    elif code=="CI":
-        return "Institute of Ocean Sciences, Canada"
-    elif code=="CS":
-        return "CSIRO, Australia"
-    elif code=="GE":
-        return "BSH, Germany"
-    elif code=="GT":
-        return "GTS: used for data coming from WMO GTS network"
-    elif code=="HZ":
-        return "CSIO, China Second Institute of Oceanography"
-    elif code=="IF":
-        return "Ifremer, France"
-    elif code=="IN":
-        return "INCOIS, India"
-    elif code=="JA":
-        return "JMA, Japan"
-    elif code=="JM":
-        return "Jamstec, Japan"
-    elif code=="KM":
-        return "KMA, Korea"
-    elif code=="KO":
-        return "KORDI, Korea"
-    elif code=="MB":
-        return "MBARI, USA"
-    elif code=="ME":
-        return "MEDS, Canada"
-    elif code=="NA":
-        return "NAVO, USA"
-    elif code=="NM":
-        return "NMDIS, China"
-    elif code=="PM":
-        return "PMEL, USA"
-    elif code=="RU":
-        return "Russia"
-    elif code=="SI":
-        return "SIO, Scripps, USA"
-    elif code=="SP":
-        return "Spain"
-    elif code=="UW":
-        return "University of Washington, USA"
-    elif code=="VL":
-        return "Far Eastern Regional Hydrometeorological Research Institute of Vladivostock, Russia"
-    elif code=="WH":
-        return "Woods Hole Oceanographic Institution, USA"
-    elif len(code) == 0:
-        return "Empty string!"
-    else:
-        return "Unknown code for table 4!"
+import numpy as np
+
+TABLE4 = {'AO': "AOML, USA",
+          'BO': "BODC, United Kingdom",
+          'CI': "Institute of Ocean Sciences, Canada",
+          'CS': "CSIRO, Australia",
+          'GE': "BSH, Germany",
+          'GT': "GTS: used for data coming from WMO GTS network",
+          'HZ': "CSIO, China Second Institute of Oceanography",
+          'IF': "Ifremer, France",
+          'IN': "INCOIS, India",
+          'JA': "JMA, Japan",
+          'JM': "Jamstec, Japan",
+          'KM': "KMA, Korea",
+          'KO': "KORDI, Korea",
+          'MB': "MBARI, USA",
+          'ME': "MEDS, Canada",
+          'NA': "NAVO, USA",
+          'NM': "NMDIS, China",
+          'PM': "PMEL, USA",
+          'RU': "Russia",
+          'SI': "SIO, Scripps, USA",
+          'SP': "Spain",
+          'UW': "University of Washington, USA",
+          'VL': "Far Eastern Regional Hydrometeorological Research Institute of Vladivostock, Russia",
+          'WH': "Woods Hole Oceanographic Institution, USA"}
 
 # dac = {'KM':'kma',
 #        'IF':'coriolis',
@@ -74,72 +40,99 @@ def table4(code):
 #        'ME':'meds',
 #        'BO':'bodc'}
 
-def table7(code):
-    """Reference table 7: history action codes"""
-    try:
-        code = code.astype(str).tostring().strip()
-    except:
-        code = code.astype(str).values.tostring().strip()
-
-    if code == 'CF':
-        return "Change a quality flag"
-    elif code=="CR":
-        return "Create record"
-    elif code=="CV":
-        return "Change value"
-    elif code=="DC":
-        return "Station was checked by duplicate checking software"
-    elif code=="ED":
-        return "Edit a parameter value"
-    elif code=="IP":
-        return "This history group operates on the complete input record"
-    elif code=="NG":
-        return "No good trace"
-    elif code=="PE":
-        return "Position error. Profile position has been erroneously encoded. Corrected if possible."
-    elif code=="QC":
-        return "Quality Control"
-    elif code=="QCF$":
-        return "Tests failed"
-    elif code=="QCP$":
-        return "Test performed"
-    elif code=="SV":
-        return "Set a value"
-    elif code=="TE":
-        return "Time error. Profile data/time has been erroneously encoded. correct if possible"
-    elif code=="UP":
-        return "Station passed through the update program"
+TABLE7 = {'CF': "Change a quality flag",
+          'CR': "Create record",
+          'CV': "Change value",
+          'DC': "Station was checked by duplicate checking software",
+          'ED': "Edit a parameter value",
+          'IP': "This history group operates on the complete input record",
+          'NG': "No good trace",
+          'PE': "Position error. Profile position has been erroneously encoded. Corrected if possible.",
+          'QC': "Quality Control",
+          'QCF$': "Tests failed",
+          'QCP$': "Test performed",
+          'SV': "Set a value",
+          'TE': "Time error. Profile data/time has been erroneously encoded. correct if possible",
+          'UP': "Station passed through the update program"}
+
+TABLE12 = {'ARFM': "Convert raw data from telecommunications system to a processing format",
+           'ARGQ': "Automatic QC of data reported in real-time has been performed",
+           'IGO3': "Checking for duplicates has been performed",
+           'ARSQ': "Delayed mode QC has been performed",
+           'ARCA': "Calibration has been performed",
+           'ARUP': "Real-time data have been archived locally and sent to GDACs",
+           'ARDU': "Delayed data have been archived locally and sent to GDACs",
+           'RFMT': "Reformat software to convert hexadecimal format reported by the buoy to our standard format",
+           'COOA': "Coriolis objective analysis performed"}
+
+TABLES = {4: TABLE4, 7: TABLE7, 12: TABLE12}
+REVERSE = dict((t, dict((v, k) for k, v in TABLES[t].items())) for t in TABLES)
+
+def _strip(code):
+    """Return a code as a stripped string from a string, bytes, numpy or xarray value"""
+    if not isinstance(code, (str, bytes)):
+        code = np.asarray(code)
+        if code.dtype.kind == 'S':
+            code = code.tobytes()
+        else:
+            code = ''.join(np.atleast_1d(code).astype(str))
+    if isinstance(code, bytes):
+        code = code.decode('ascii', 'replace')
+    return code.replace('\x00', '').strip()
+
+def _describe(table, code):
+    """Description of a stripped code in a reference table"""
+    if code in TABLES[table]:
+        return TABLES[table][code]
     elif len(code) == 0:
         return "Empty string!"
     else:
-        return "Unknown code for table 7!"
+        return "Unknown code for table %i!" % table
+
+def _map(values, func):
+    """Apply func on the unique values of an array and return the results as a Categorical"""
+    import pandas as pd  # Only imported for arrays, scalar lookups do not need it
+    codes, uniques = pd.factorize(np.ravel(np.asarray(values)))
+    cat_codes, categories = pd.factorize(np.array([func(u) for u in uniques], dtype=object))
+    codes = np.where(codes < 0, -1, cat_codes[codes] if len(cat_codes) else codes)
+    return pd.Categorical.from_codes(codes, categories)
+
+def decode(codes, table):
+    """Map codes to their description in a reference table (4, 7 or 12)
+
+        codes can be a scalar, or a numpy/xarray array or Pandas Series of codes. Arrays are mapped as a whole,
+        looking up each unique code only once, and returned as a flat Pandas Categorical (a categorical Series
+        with the same index for a Series input). Missing values (None, NaN) are mapped to NaN.
+    """
+    if np.ndim(codes) == 0:
+        return _describe(table, _strip(codes))
+    import pandas as pd
+    cat = _map(codes, lambda c: _describe(table, _strip(c)))
+    if isinstance(codes, pd.Series):
+        return pd.Series(cat, index=codes.index, name=codes.name)
+    return cat
+
+def encode(descriptions, table):
+    """Reverse lookup: map descriptions to their code in a reference table (4, 7 or 12)
+
+        Unknown descriptions are mapped to None, or NaN in arrays.
+    """
+    if np.ndim(descriptions) == 0:
+        return REVERSE[table].get(descriptions)
+    import pandas as pd
+    cat = _map(descriptions, lambda d: REVERSE[table].get(d))
+    if isinstance(descriptions, pd.Series):
+        return pd.Series(cat, index=descriptions.index, name=descriptions.name)
+    return cat
+
+def table4(code):
+    """Reference table 4: history action codes"""
+    return _describe(4, _strip(code))
+
+def table7(code):
+    """Reference table 7: history action codes"""
+    return _describe(7, _strip(code))
 
 def table12(code):
     """Reference table 12: history steps codes"""
-    try:
-        code = code.astype(str).tostring().strip()
-    except:
-        code = code.astype(str).values.tostring().strip()
-
-    if code == "ARFM":
-        return "Convert raw data from telecommunications system to a processing format"
-    elif code == "ARGQ":
-        return "Automatic QC of data reported in real-time has been performed"
-    elif code == "IGO3":
-        return "Checking for duplicates has been performed"
-    elif code == "ARSQ":
-        return "Delayed mode QC has been performed"
-    elif code == "ARCA":
-        return "Calibration has been performed"
-    elif code == "ARUP":
-        return "Real-time data have been archived locally and sent to GDACs"
-    elif code == "ARDU":
-        return "Delayed data have been archived locally and sent to GDACs"
-    elif code == "RFMT":
-        return "Reformat software to convert hexadecimal format reported by the buoy to our standard format"
-    elif code == "COOA":
-        return "Coriolis objective analysis performed"
-    elif len(code) == 0:
-        return "Empty string!"
-    else:
-        return "Unknown code for table 12!"
\ No newline at end of file
+    return _describe(12, _strip(code))
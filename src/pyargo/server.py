@@ -0,0 +1,205 @@
+# -*coding: UTF-8 -*-
+#
+# Serve queries on an Argo index held in memory
+#
+# The index is loaded once (compact, see index.to_compact) with its spatio-temporal index, and
+# queries are answered over a local HTTP API:
+#   GET /select?box=lon_min,lon_max,lat_min,lat_max&dates=start,end&dac=a,b&profiler_type=..&qc=col:A,B&columns=..
+#   GET /radius?lon=..&lat=..&radius=..(km)&dates=..&columns=..
+#   GET /nearest?lon=..&lat=..&k=..&dates=..&columns=..
+#   GET /history?wmo=.. or ?file=..
+#   GET /info
+# Tables are returned as Arrow IPC streams, /info as JSON. See client for the Python API.
+#
+__author__ = 'guillaumemaze'
+
+import os
+import sys
+import json
+import traceback
+import numpy as np
+import pandas as pd
+from . import index as detailedindex
+from . import spatial
+from . import extract
+from . import history
+from . import cache as hcache
+from .client import DEFAULT_HOST, DEFAULT_PORT
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlsplit, parse_qs
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlsplit, parse_qs
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+ARROW_STREAM = 'application/vnd.apache.arrow.stream'
+
+def to_arrow(df):
+    """Serialize a Dataframe as an Arrow IPC stream"""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    writer = pa.ipc.new_stream(sink, table.schema)
+    writer.write_table(table)
+    writer.close()
+    return sink.getvalue().to_pybytes()
+
+def _list(params, name):
+    """Comma separated list of a query parameter, or None"""
+    if name not in params:
+        return None
+    return [v for p in params[name] for v in p.split(',') if v]
+
+def _float(params, name, default=None):
+    if name not in params:
+        if default is None:
+            raise ValueError("Missing parameter '%s'" % name)
+        return default
+    return float(params[name][0])
+
+def _predicates(params):
+    """Index predicates (see index.iter_read) of query parameters"""
+    kwargs = {}
+    if 'box' in params:
+        kwargs['box'] = [float(x) for x in _list(params, 'box')]
+        if len(kwargs['box']) != 4:
+            raise ValueError("box must be lon_min,lon_max,lat_min,lat_max")
+    for name in ['dates', 'dac', 'profiler_type']:
+        if name in params:
+            kwargs[name] = _list(params, name)
+    if 'qc' in params:
+        kwargs['qc'] = {}
+        for p in params['qc']:
+            col, flags = p.split(':', 1)
+            kwargs['qc'][col] = flags.split(',')
+    return kwargs
+
+class Service(object):
+    """Index, spatio-temporal index and history sources answering the queries"""
+
+    def __init__(self, ai, droot='', si=None, store=None, cache=hcache.DEFAULT_STORE):
+        if 'file' in ai:
+            # Usual index, or compact index of paths not following the profile file pattern (kept as is)
+            self.ai = detailedindex.to_compact(ai)
+        elif all(col in ai for col in detailedindex.FILE_COLUMNS):
+            self.ai = ai
+        else:
+            raise ValueError("Index Dataframe without 'file' column nor compact %s columns (see index.to_compact)"
+                             % ', '.join(detailedindex.FILE_COLUMNS))
+        self.si = si if si is not None else spatial.build(self.ai)
+        self.droot = droot
+        self.store = store
+        self.cache = cache
+
+    def rows(self, rows, params, extra=None):
+        """Usual index Dataframe of compact index rows, with the requested columns"""
+        df = detailedindex.from_compact(self.ai.iloc[rows]).reset_index(drop=True)
+        if extra is not None:
+            for k in extra:
+                df[k] = extra[k]
+        columns = _list(params, 'columns')
+        return df if columns is None else df[columns]
+
+    def select(self, params):
+        keep = detailedindex._mask(self.ai, **_predicates(params))
+        return self.rows(np.nonzero(keep)[0], params)
+
+    def radius(self, params):
+        rows, d = spatial.radius(self.si, _float(params, 'lon'), _float(params, 'lat'), _float(params, 'radius'),
+                                 dates=_list(params, 'dates'))
+        return self.rows(rows, params, {'distance': d})
+
+    def nearest(self, params):
+        rows, d = spatial.nearest(self.si, _float(params, 'lon'), _float(params, 'lat'),
+                                  k=int(_float(params, 'k', 1)), dates=_list(params, 'dates'))
+        return self.rows(rows, params, {'distance': d})
+
+    def history(self, params):
+        wmo = params['wmo'][0] if 'wmo' in params else None
+        fname = params['file'][0] if 'file' in params else None
+        if wmo is None and fname is None:
+            raise ValueError("Missing parameter 'wmo' or 'file'")
+        if self.store is not None:
+            return history.read_ragged(self.store, wmo=wmo, file=fname)
+        if fname is not None:
+            files = [fname]
+        else:
+            wmos = self.ai['wmo'] if 'wmo' in self.ai else \
+                pd.to_numeric(detailedindex.split_file(self.ai['file'])['wmo'], errors='coerce').values
+            files = detailedindex.file_path(self.ai[np.asarray(wmos == int(wmo))])
+        frames = [extract.file_history(f, self.droot, cache=self.cache) for f in files]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=extract.COLUMNS)
+
+    def info(self, params):
+        return {'nrows': len(self.ai), 'columns': list(detailedindex.from_compact(self.ai.iloc[:0]).columns),
+                'droot': self.droot, 'store': self.store}
+
+QUERIES = ['select', 'radius', 'nearest', 'history', 'info']
+
+class Handler(BaseHTTPRequestHandler):
+    """HTTP handler of queries, the service is the 'service' attribute of the server"""
+
+    def _reply(self, code, body, content_type):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        query = parts.path.strip('/')
+        if query not in QUERIES:
+            return self._reply(404, ("Unknown query '%s'" % query).encode('utf-8'), 'text/plain')
+        try:
+            result = getattr(self.server.service, query)(parse_qs(parts.query))
+        except (ValueError, KeyError, TypeError) as error:
+            return self._reply(400, ("%s: %s" % (type(error).__name__, error)).encode('utf-8'), 'text/plain')
+        except Exception:
+            sys.stderr.write(traceback.format_exc())
+            return self._reply(500, traceback.format_exc().encode('utf-8'), 'text/plain')
+        if isinstance(result, dict):
+            return self._reply(200, json.dumps(result).encode('utf-8'), 'application/json')
+        return self._reply(200, to_arrow(result), ARROW_STREAM)
+
+    def log_message(self, format, *args):
+        if self.server.verb:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+def make_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT, verb=False):
+    """HTTP server answering the queries of a Service, in one thread per request"""
+    if pa is None:
+        raise ImportError("pyarrow is required to serve index queries")
+    httpd = Server((host, port), Handler)
+    httpd.service = service
+    httpd.verb = verb
+    return httpd
+
+def serve(droot, ifile="argo_profile_detailled_index.txt", cachedir='.', store=None, host=DEFAULT_HOST,
+          port=DEFAULT_PORT, res=1., verb=False, cache=hcache.DEFAULT_STORE):
+    """
+        Load an Argo index and serve queries until interrupted
+
+        The index is loaded with index.load (from its cache in cachedir), and the spatio-temporal index
+        of res degrees is saved in the same cache. History queries are answered from a ragged store
+        (see ragged.build) if provided, by decoding the profile files under droot otherwise, through the
+        decoded history cache (see cache.file_history, None to decode files on each query).
+    """
+    ai = detailedindex.load(droot, ifile, verb=verb, cachedir=cachedir, compact=True)
+    si = spatial.load_or_build(ai, os.path.join(detailedindex.cache_path(droot, ifile, cachedir), 'spatial.npz'),
+                               res=res)
+    httpd = make_server(Service(ai, droot=droot, si=si, store=store, cache=cache), host=host, port=port, verb=verb)
+    if verb:
+        print("Serving %i profiles on http://%s:%i" % (len(ai), host, httpd.server_address[1]))
+    try:
+        httpd.serve_forever()
+    finally:
+        httpd.server_close()
@@ -0,0 +1,169 @@
+# -*coding: UTF-8 -*-
+#
+# Provide a spatio-temporal index of Argo profiles for fast box, radius and nearest queries
+#
+# Profiles of an index Dataframe are binned on a regular lon/lat grid and sorted by a
+# (grid cell, time) key. A query only looks up the sorted key ranges of the grid cells
+# it intersects, and filters these candidates exactly. Queries return row positions
+# into the indexed Dataframe, to be used with ai.iloc[rows].
+#
+__author__ = 'guillaumemaze'
+
+import os
+import numpy as np
+import pandas as pd
+
+EARTH_RADIUS = 6371.0  # km
+_EPOCH = np.datetime64('1950-01-01T00:00:00', 's')
+_T = np.int64(1) << 32  # Time slots per grid cell in the sort key, in seconds since _EPOCH
+
+def _wrap(lon):
+    """Wrap longitudes to [-180, 180["""
+    return (np.asarray(lon, dtype=np.float64) + 180.) % 360. - 180.
+
+def _seconds(dates):
+    """Seconds since 1950-01-01 of datetime64 values, NaT and values out of the key range are clipped"""
+    d = np.asarray(dates).astype('datetime64[s]')
+    t = (d - _EPOCH).astype(np.int64)
+    t[np.isnat(d)] = 0
+    return np.clip(t, 0, _T - 1)
+
+def _window(dates):
+    """Key time range of a [start, end[ dates window"""
+    if dates is None:
+        return np.int64(0), _T
+    t = _seconds(pd.to_datetime(list(dates)).values)
+    return t[0], t[1]
+
+def _ncells(res):
+    return int(round(360. / res)), int(round(180. / res))
+
+def distance(lon1, lat1, lon2, lat2):
+    """Great circle distance in km between points, with the haversine formula"""
+    lon1, lat1, lon2, lat2 = [np.radians(x) for x in [lon1, lat1, lon2, lat2]]
+    a = np.sin((lat2 - lat1) / 2.) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2.) ** 2
+    return 2. * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0., 1.)))
+
+def build(ai, res=1.):
+    """Build the spatio-temporal index of an index Dataframe with a grid resolution of res degrees"""
+    nlon, nlat = _ncells(res)
+    lon = _wrap(ai['longitude'].values)
+    lat = np.asarray(ai['latitude'].values, dtype=np.float64)
+    if 'date' in ai.columns:
+        t = _seconds(ai['date'].values)
+    else:
+        t = np.zeros(len(ai), dtype=np.int64)
+
+    # Profiles without a position go into an extra cell never queried:
+    valid = np.isfinite(lon) & np.isfinite(lat)
+    ilon = np.clip(np.floor((np.where(valid, lon, 0.) + 180.) / res), 0, nlon - 1).astype(np.int64)
+    ilat = np.clip(np.floor((np.where(valid, lat, 0.) + 90.) / res), 0, nlat - 1).astype(np.int64)
+    cell = np.where(valid, ilat * nlon + ilon, nlon * nlat)
+
+    key = cell * _T + t
+    order = np.argsort(key, kind='mergesort')
+    return {'res': np.float64(res), 'key': key[order], 'order': order, 'lon': lon[order], 'lat': lat[order]}
+
+def save(si, fname):
+    """Save a spatio-temporal index into a numpy .npz file"""
+    np.savez(fname, **si)
+
+def load(fname):
+    """Load a spatio-temporal index from a numpy .npz file"""
+    with np.load(fname) as f:
+        si = dict((k, f[k]) for k in f.files)
+    si['res'] = np.float64(si['res'])
+    return si
+
+def load_or_build(ai, fname, res=1.):
+    """
+        Load a spatio-temporal index from fname, or build it from ai and save it
+
+        Put fname in the index cache directory (see index.cache_path), so that the
+        spatio-temporal index is removed with the cache when the index file changes.
+    """
+    if os.path.isfile(fname):
+        si = load(fname)
+        if len(si['order']) == len(ai) and si['res'] == res:
+            return si
+    si = build(ai, res=res)
+    save(si, fname)
+    return si
+
+def _candidates(si, lon_min, lon_max, lat_min, lat_max, dates=None):
+    """Positions in the sorted arrays of the profiles in the grid cells intersecting a box"""
+    res = si['res']
+    nlon, nlat = _ncells(res)
+    i0, i1 = [int(np.clip(np.floor((x + 180.) / res), 0, nlon - 1)) for x in _wrap([lon_min, lon_max])]
+    if lon_max - lon_min >= 360.:
+        ilon = np.arange(nlon)
+    elif i0 <= i1 and lon_min <= lon_max:
+        ilon = np.arange(i0, i1 + 1)
+    elif i1 >= i0:
+        # Box crossing the dateline with both ends in the same column: all columns, each once
+        ilon = np.arange(nlon)
+    else:
+        ilon = np.r_[np.arange(i0, nlon), np.arange(0, i1 + 1)]
+    j0, j1 = [int(np.clip(np.floor((x + 90.) / res), 0, nlat - 1)) for x in [lat_min, lat_max]]
+    cells = (np.arange(j0, j1 + 1)[:, np.newaxis] * nlon + ilon[np.newaxis, :]).ravel()
+
+    t0, t1 = _window(dates)
+    lo = np.searchsorted(si['key'], cells * _T + t0, side='left')
+    hi = np.searchsorted(si['key'], cells * _T + t1, side='left')
+    lens = hi - lo
+    return np.repeat(lo - np.r_[0, np.cumsum(lens)[:-1]], lens) + np.arange(lens.sum())
+
+def box(si, box, dates=None):
+    """
+        Row positions of profiles in a box and dates window
+
+        box: [lon_min, lon_max, lat_min, lat_max], with lon_min > lon_max for a box crossing the dateline
+        dates: [start, end] window on the profile date (end excluded)
+    """
+    idx = _candidates(si, box[0], box[1], box[2], box[3], dates)
+    lon, lat = si['lon'][idx], si['lat'][idx]
+    lon_min, lon_max = _wrap([box[0], box[1]])
+    if box[1] - box[0] >= 360.:
+        keep = np.ones(len(idx), dtype=bool)
+    elif lon_min <= lon_max and box[0] <= box[1]:
+        keep = (lon >= lon_min) & (lon <= lon_max)
+    else:
+        keep = (lon >= lon_min) | (lon <= lon_max)
+    keep &= (lat >= box[2]) & (lat <= box[3])
+    return np.sort(si['order'][idx[keep]])
+
+def radius(si, lon, lat, radius, dates=None):
+    """
+        Row positions and distances (km) of profiles within radius km of a point, sorted by distance
+
+        dates: [start, end] window on the profile date (end excluded)
+    """
+    a = radius / EARTH_RADIUS
+    dlat = np.degrees(a)
+    lat_min, lat_max = lat - dlat, lat + dlat
+    if lat_min <= -90. or lat_max >= 90. or np.sin(a) >= np.cos(np.radians(lat)):
+        lon_min, lon_max = -180., 180.
+        lat_min, lat_max = max(lat_min, -90.), min(lat_max, 90.)
+    else:
+        dlon = np.degrees(np.arcsin(np.sin(a) / np.cos(np.radians(lat))))
+        lon_min, lon_max = lon - dlon, lon + dlon
+    idx = _candidates(si, lon_min, lon_max, lat_min, lat_max, dates)
+    d = distance(lon, lat, si['lon'][idx], si['lat'][idx])
+    keep = d <= radius
+    idx, d = idx[keep], d[keep]
+    s = np.argsort(d, kind='mergesort')
+    return si['order'][idx[s]], d[s]
+
+def nearest(si, lon, lat, k=1, dates=None, start=100.):
+    """
+        Row positions and distances (km) of the k profiles nearest to a point
+
+        The search radius starts at start km and is doubled until k profiles are found.
+        dates: [start, end] window on the profile date (end excluded)
+    """
+    r = start
+    while True:
+        rows, d = radius(si, lon, lat, r, dates)
+        if len(rows) >= k or r >= np.pi * EARTH_RADIUS:
+            return rows[:k], d[:k]
+        r *= 2.
@@ -0,0 +1,145 @@
+# -*coding: UTF-8 -*-
+#
+# Provide timers and counters of the processing stages of pyargo
+#
+# Instrumentation is off by default and costs nothing then. Turn it on with the PYARGO_STATS
+# environment variable, with enable(), or for a block of code with:
+#     with stats.collect() as s:
+#         ...
+#     print(s['timers'], s['counters'])
+# Timers give the number of calls and the wall time (seconds) of each stage, nested stages being
+# included in their parent. Counters give files opened, bytes read, cache hits and misses, ...
+# Statistics of process workers of index.iter_traverse are merged into the parent process.
+#
+__author__ = 'guillaumemaze'
+
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+_lock = threading.Lock()
+_timers = {}
+_counters = {}
+_enabled = os.environ.get('PYARGO_STATS', '') not in ('', '0')
+
+def enabled():
+    """True if statistics are collected"""
+    return _enabled
+
+def enable():
+    """Start collecting statistics, also in processes started afterwards"""
+    global _enabled
+    _enabled = True
+    os.environ['PYARGO_STATS'] = '1'
+
+def disable():
+    """Stop collecting statistics"""
+    global _enabled
+    _enabled = False
+    os.environ.pop('PYARGO_STATS', None)
+
+def reset():
+    """Clear all timers and counters"""
+    with _lock:
+        _timers.clear()
+        _counters.clear()
+
+def count(name, n=1):
+    """Add n to a counter"""
+    if _enabled:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + n
+
+class _Stage(object):
+    """Timer of a stage, used as a context manager"""
+    __slots__ = ['name', 't0']
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        dt = time.time() - self.t0
+        with _lock:
+            t = _timers.setdefault(self.name, [0, 0.])
+            t[0] += 1
+            t[1] += dt
+        return False
+
+class _NoStage(object):
+    __slots__ = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NOSTAGE = _NoStage()
+
+def stage(name):
+    """Context manager timing a stage of processing"""
+    return _Stage(name) if _enabled else _NOSTAGE
+
+def report():
+    """Statistics as a dictionary: {'timers': {stage: {'calls': n, 'seconds': s}}, 'counters': {name: n}}"""
+    with _lock:
+        return {'timers': dict((k, {'calls': v[0], 'seconds': v[1]}) for k, v in _timers.items()),
+                'counters': dict(_counters)}
+
+def merge(other):
+    """Add the statistics of a report (eg: from another process) to the current ones"""
+    with _lock:
+        for k, v in other['timers'].items():
+            t = _timers.setdefault(k, [0, 0.])
+            t[0] += v['calls']
+            t[1] += v['seconds']
+        for k, v in other['counters'].items():
+            _counters[k] = _counters.get(k, 0) + v
+
+@contextmanager
+def collect():
+    """Collect statistics of a block of code into the yielded dictionary (see report)"""
+    was_enabled = _enabled
+    reset()
+    enable()
+    result = {}
+    try:
+        yield result
+    finally:
+        result.update(report())
+        if not was_enabled:
+            disable()
+
+def to_json(fname=None):
+    """Statistics as a JSON string, saved into fname if provided"""
+    s = json.dumps(report(), indent=1, sort_keys=True)
+    if fname is not None:
+        with open(fname, 'w') as f:
+            f.write(s)
+    return s
+
+def format_report(stats=None):
+    """Readable table of statistics"""
+    stats = stats if stats is not None else report()
+    lines = ["%-32s %10s %12s %12s" % ("STAGE", "CALLS", "SECONDS", "MS/CALL")]
+    for k in sorted(stats['timers']):
+        v = stats['timers'][k]
+        lines.append("%-32s %10i %12.3f %12.3f" % (k, v['calls'], v['seconds'], 1e3 * v['seconds'] / max(v['calls'], 1)))
+    lines.append("%-32s %10s" % ("COUNTER", "VALUE"))
+    for k in sorted(stats['counters']):
+        lines.append("%-32s %10i" % (k, stats['counters'][k]))
+    return "\n".join(lines)
+
+def write(dest='-'):
+    """Write the statistics to stderr as a table (dest='-'), or into a JSON file"""
+    if dest == '-':
+        sys.stderr.write(format_report() + "\n")
+    else:
+        to_json(dest)
@@ -0,0 +1,219 @@
+# -*coding: UTF-8 -*-
+#
+# Generate synthetic Argo files, for benchmarks and tests
+#
+# Detailed index files and mono/multi-profile NetCDF files follow the layout of the GDAC files,
+# with random but realistic contents: floats of several DACs, profile dates, positions and QC
+# flags, history sequences (ARFM, ARGQ, ARUP, ARSQ, ...) with QCTEST values, some of which can be
+# corrupted on purpose.
+#
+__author__ = 'guillaumemaze'
+
+import os
+import numpy as np
+import pandas as pd
+from . import index as detailedindex
+try:
+    import netCDF4
+except ImportError:
+    netCDF4 = None
+
+DACS = ['aoml', 'coriolis', 'csiro', 'jma', 'bodc', 'meds', 'incois', 'kma', 'kordi', 'nmdis', 'csio']
+INSTITUTIONS = ['AO', 'IF', 'CS', 'JA', 'BO', 'ME', 'IN', 'KM', 'KO', 'NM', 'HZ']
+PROFILER_TYPES = ['845', '846', '851', '853', '854', '863', '869']
+HEADER = ["# Title : Profile directory file of the Argo Global Data Assembly Center",
+          "# Description : The directory file describes all individual profile files of the argo GDAC ftp site.",
+          "# Project : ARGO",
+          "# Format version : 2.0",
+          "# Date of update : %s",
+          "# FTP root number 1 : ftp://ftp.ifremer.fr/ifremer/argo/dac",
+          "# FTP root number 2 : ftp://usgodae.org/pub/outgoing/argo/dac",
+          "# GDAC node : CORIOLIS"]
+FILLVALUE = 99999.
+
+def _strftime(dates):
+    """Format datetime64 values as YYYYMMDDHHMISS, NaT as empty strings"""
+    dates = np.asarray(dates, dtype='datetime64[s]')
+    iso = np.datetime_as_string(dates, unit='s').astype('U19')
+    digits = iso.view('U1').reshape(-1, 19)[:, [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18]]
+    out = np.ascontiguousarray(digits).view('U14').ravel().astype(object)
+    out[np.isnat(dates.ravel())] = ''
+    return out.reshape(dates.shape)
+
+def index_frame(n=100000, seed=0, profiles_per_float=150):
+    """
+        Dataframe of n synthetic detailed index rows, with the columns and string formats of the index file
+
+        Rows are sorted by float and cycle, floats have about profiles_per_float profiles.
+    """
+    rng = np.random.RandomState(seed)
+    n_floats = max(1, n // profiles_per_float)
+    k = np.sort(rng.randint(0, n_floats, n))
+    cycle = np.arange(n) - np.searchsorted(k, k) + 1
+    idac = rng.randint(0, len(DACS), n_floats)[k]
+    wmo = 1900000 + 37 * k
+    prefix = np.where(rng.rand(n) < 0.6, 'D', 'R')
+    direction = np.where(rng.rand(n) < 0.02, 'D', '')
+    dacs, wmos = np.array(DACS, dtype=object)[idac], wmo.astype('U').astype(object)
+    cycles = np.array(['%03i' % c for c in cycle], dtype=object)
+    files = dacs + '/' + wmos + '/profiles/' + prefix.astype(object) + wmos + '_' + cycles + direction + '.nc'
+
+    launch = np.datetime64('2000-01-01', 's') + (rng.randint(0, 20 * 365, n_floats)[k] * 86400).astype('timedelta64[s]')
+    date = launch + (cycle * 10 * 86400 + rng.randint(0, 86400, n)).astype('timedelta64[s]')
+    date_update = date + rng.randint(3600, 3000 * 86400, n).astype('timedelta64[s]')
+    gdac_creation = date + rng.randint(3600, 30 * 86400, n).astype('timedelta64[s]')
+    date = np.where(rng.rand(n) < 0.001, np.datetime64('NaT'), date)
+
+    lat = np.round(rng.uniform(-70., 80., n), 3)
+    lon = np.round(rng.uniform(-180., 180., n), 3)
+    nopos = rng.rand(n) < 0.001
+    qcs = np.array(['A', 'A', 'A', 'B', 'C', 'D', 'E', 'F', ''])
+    adjusted = prefix == 'D'
+    return pd.DataFrame({'file': files,
+                         'date': _strftime(date),
+                         'latitude': np.where(nopos, np.nan, lat),
+                         'longitude': np.where(nopos, np.nan, lon),
+                         'ocean': np.array(['A', 'I', 'P'])[rng.randint(0, 3, n)],
+                         'profiler_type': np.array(PROFILER_TYPES)[rng.randint(0, len(PROFILER_TYPES), n)],
+                         'institution': np.array(INSTITUTIONS)[idac],
+                         'date_update': _strftime(date_update),
+                         'profile_temp_qc': qcs[rng.randint(0, len(qcs), n)],
+                         'profile_psal_qc': qcs[rng.randint(0, len(qcs), n)],
+                         'profile_doxy_qc': np.where(rng.rand(n) < 0.1, qcs[rng.randint(0, len(qcs), n)], ''),
+                         'ad_psal_adjustment_mean': np.where(adjusted, np.round(rng.normal(0, 0.01, n), 4), np.nan),
+                         'ad_psal_adjustment_deviation': np.where(adjusted, np.round(rng.rand(n) * 0.01, 4), np.nan),
+                         'gdac_date_creation': _strftime(gdac_creation),
+                         'gdac_date_update': _strftime(date_update),
+                         'n_levels': rng.randint(10, 1000, n)}, columns=detailedindex.COLUMNS)
+
+def index_file(fname, n=100000, seed=0, profiles_per_float=150):
+    """Write a synthetic detailed index file of n profiles, return its Dataframe (see index_frame)"""
+    df = index_frame(n, seed=seed, profiles_per_float=profiles_per_float)
+    _write_index(fname, df)
+    return df
+
+def _write_index(fname, df):
+    with open(fname, 'w') as f:
+        f.write("\n".join(HEADER) % _strftime(np.array([np.datetime64('now', 's')]))[0] + "\n")
+        df.to_csv(f, index=False)
+
+def _chars(values, width):
+    """Netcdf character array of strings"""
+    a = np.asarray(values, dtype='S%i' % width)
+    return a.view('S1').reshape(a.shape + (width,))
+
+def _hexa(masks):
+    return np.array(['%X' % m if m else '' for m in masks], dtype=object)
+
+def history_entries(n_prof=1, n_history=10, corrupt=0., dac='IF', creation=None, rng=None):
+    """
+        Dictionary of (N_HISTORY, N_PROF) arrays of synthetic HISTORY_* values
+
+        Each profile history starts with ARFM, ARGQ QCP$ and QCF$ (with random QCTEST values), followed by
+        ARUP, ARSQ and ARCA changes of flags, and random padding (empty entries) at the end.
+        A fraction corrupt of the QCTEST values is replaced by non hexadecimal strings.
+    """
+    rng = rng if rng is not None else np.random.RandomState(0)
+    creation = creation if creation is not None else np.datetime64('2015-01-02T03:04:05', 's')
+    shape = (n_history, n_prof)
+    template = np.array([
+        # STEP, ACTION, SOFTWARE, RELEASE, REFERENCE, PARAMETER
+        ['ARFM', '', 'COOA', '1.0', '', ''],
+        ['ARGQ', 'QCP$', 'COQC', '2.6', '', ''],
+        ['ARGQ', 'QCF$', 'COQC', '2.6', '', ''],
+        ['ARUP', '', 'COOA', '1.0', '', ''],
+        ['ARSQ', 'IP', 'OW', '1.1', 'WOD2013', 'PSAL'],
+        ['ARCA', 'CF', 'SCOO', '0.9', '', 'TEMP'],
+    ], dtype=object)
+    k = np.arange(n_history)[:, np.newaxis] % len(template) + np.zeros(shape, dtype=int)
+    filled = np.arange(n_history)[:, np.newaxis] < rng.randint(n_history // 2, n_history + 1, n_prof)[np.newaxis, :]
+
+    def pick(col):
+        return np.where(filled, template[k, col], '')
+    qctest = np.full(shape, '', dtype=object)
+    passed = rng.randint(1, 2 ** 26, shape) << 1
+    failed = passed & rng.randint(0, 2 ** 26, shape) & rng.randint(0, 2 ** 26, shape)
+    qctest[k == 1] = _hexa(passed[k == 1])
+    qctest[k == 2] = _hexa(failed[k == 2])
+    bad = (rng.rand(*shape) < corrupt) & ((k == 1) | (k == 2))
+    qctest[bad] = np.array(['ZZ', '1G2', '0xG1', '12 4'], dtype=object)[rng.randint(0, 4, bad.sum())]
+    qctest[~filled] = ''
+
+    days = (np.cumsum(rng.randint(0, 200 * 86400, shape), axis=0) * (k > 0)).astype('timedelta64[s]')
+    dates = np.where(filled, _strftime((creation + days).ravel()).reshape(shape), '')
+    changed = filled & (k == 5)
+    pres = rng.uniform(0, 2000, shape).astype(np.float32)
+    return {'HISTORY_INSTITUTION': np.where(filled, dac, ''),
+            'HISTORY_STEP': pick(0), 'HISTORY_SOFTWARE': pick(2), 'HISTORY_SOFTWARE_RELEASE': pick(3),
+            'HISTORY_REFERENCE': pick(4), 'HISTORY_DATE': dates, 'HISTORY_ACTION': pick(1),
+            'HISTORY_PARAMETER': pick(5), 'HISTORY_QCTEST': np.where(filled, qctest, ''),
+            'HISTORY_START_PRES': np.where(changed, pres, FILLVALUE).astype(np.float32),
+            'HISTORY_STOP_PRES': np.where(changed, pres + 10, FILLVALUE).astype(np.float32),
+            'HISTORY_PREVIOUS_VALUE': np.where(changed, rng.randint(1, 5, shape), FILLVALUE).astype(np.float32)}
+
+HISTORY_WIDTHS = {'HISTORY_INSTITUTION': 'STRING4', 'HISTORY_STEP': 'STRING4', 'HISTORY_SOFTWARE': 'STRING4',
+                  'HISTORY_SOFTWARE_RELEASE': 'STRING4', 'HISTORY_REFERENCE': 'STRING64', 'HISTORY_DATE': 'DATE_TIME',
+                  'HISTORY_ACTION': 'STRING4', 'HISTORY_PARAMETER': 'STRING16', 'HISTORY_QCTEST': 'STRING16'}
+
+def profile_file(fname, n_prof=1, n_history=10, n_levels=50, corrupt=0., wmo=6901234, cycle=1, seed=0):
+    """
+        Write a synthetic Argo profile NetCDF file
+
+        Multi-profile files have n_prof profiles, history variables have n_history entries per profile
+        (see history_entries for the contents and the corrupt rate of QCTEST values).
+    """
+    if netCDF4 is None:
+        raise ImportError("netCDF4 is required to write synthetic profile files")
+    rng = np.random.RandomState(seed)
+    nc = netCDF4.Dataset(fname, 'w', format='NETCDF3_CLASSIC')
+    try:
+        nc.data_type = 'Argo profile'
+        nc.format_version = '3.1'
+        for dim, n in [('DATE_TIME', 14), ('STRING2', 2), ('STRING4', 4), ('STRING8', 8), ('STRING16', 16),
+                       ('STRING64', 64), ('N_PROF', n_prof), ('N_LEVELS', n_levels), ('N_HISTORY', None)]:
+            nc.createDimension(dim, n)
+        creation = np.datetime64('2015-01-02T03:04:05', 's') + np.timedelta64(int(rng.randint(0, 3000)), 'D')
+        update = creation + np.timedelta64(int(rng.randint(0, 1000)), 'D')
+        for name, value in [('DATE_CREATION', creation), ('DATE_UPDATE', update)]:
+            nc.createVariable(name, 'S1', ('DATE_TIME',))[:] = _chars(_strftime(np.array([value])), 14)[0]
+
+        v = nc.createVariable('PLATFORM_NUMBER', 'S1', ('N_PROF', 'STRING8'))
+        v[:] = _chars(['%-8i' % wmo] * n_prof, 8)
+        nc.createVariable('CYCLE_NUMBER', 'i4', ('N_PROF',), fill_value=99999)[:] = cycle
+        nc.createVariable('DIRECTION', 'S1', ('N_PROF',))[:] = _chars(['A'] * n_prof, 1)[:, 0]
+        nc.createVariable('DATA_MODE', 'S1', ('N_PROF',))[:] = _chars(['D'] * n_prof, 1)[:, 0]
+        v = nc.createVariable('JULD', 'f8', ('N_PROF',), fill_value=999999.)
+        v.units = 'days since 1950-01-01 00:00:00 UTC'
+        v.reference_date_time = '19500101000000'
+        julian = (creation - np.datetime64('1950-01-01', 's')).astype(np.float64) / 86400.
+        v[:] = julian - 1. - rng.rand(n_prof)
+        pres = np.sort(rng.uniform(0, 2000, (n_prof, n_levels)), axis=1)
+        for name, values in [('PRES', pres), ('TEMP', 20. - pres / 100.), ('PSAL', 35. + rng.rand(n_prof, n_levels))]:
+            nc.createVariable(name, 'f4', ('N_PROF', 'N_LEVELS'), fill_value=np.float32(FILLVALUE))[:] = values
+
+        entries = history_entries(n_prof, n_history, corrupt=corrupt, creation=creation, rng=rng)
+        for name in HISTORY_WIDTHS:
+            dim = HISTORY_WIDTHS[name]
+            width = len(nc.dimensions[dim])
+            nc.createVariable(name, 'S1', ('N_HISTORY', 'N_PROF', dim))[:] = _chars(entries[name], width)
+        for name in ['HISTORY_START_PRES', 'HISTORY_STOP_PRES', 'HISTORY_PREVIOUS_VALUE']:
+            nc.createVariable(name, 'f4', ('N_HISTORY', 'N_PROF'), fill_value=np.float32(FILLVALUE))[:] = entries[name]
+    finally:
+        nc.close()
+
+def gdac(droot, n_files=100, n_prof=1, n_history=10, corrupt=0., seed=0, ifile="argo_profile_detailled_index.txt"):
+    """
+        Write a synthetic GDAC tree: n_files profile files under droot and their detailed index file
+
+        Return the index Dataframe (see index_frame), to be read with index.load(droot, ifile).
+    """
+    df = index_frame(n_files, seed=seed, profiles_per_float=20)
+    parts = detailedindex.split_file(df['file'])
+    for i, fname in enumerate(df['file']):
+        path = os.path.join(droot, fname)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        profile_file(path, n_prof=n_prof, n_history=n_history, corrupt=corrupt, wmo=int(parts['wmo'][i]),
+                     cycle=int(parts['cycle'][i]), seed=seed + i)
+    _write_index(os.path.join(droot, ifile), df)
+    return df
@@ -0,0 +1,27 @@
+# -*coding: UTF-8 -*-
+#
+# Shared fixtures of the pyargo tests: a small synthetic GDAC tree (see pyargo.synthetic)
+#
+__author__ = 'guillaumemaze'
+
+import os
+import pytest
+from pyargo import synthetic
+
+IFILE = "argo_profile_detailled_index.txt"
+
+@pytest.fixture(scope='session')
+def gdac(tmp_path_factory):
+    """Root directory of a synthetic GDAC of 12 mono-profile files, and its index Dataframe"""
+    pytest.importorskip('netCDF4')
+    droot = str(tmp_path_factory.mktemp('gdac'))
+    df = synthetic.gdac(droot, n_files=12, n_history=8, corrupt=0.05, ifile=IFILE)
+    return droot, df
+
+@pytest.fixture(scope='session')
+def prof_file(tmp_path_factory):
+    """Path of a synthetic multi-profile file"""
+    pytest.importorskip('netCDF4')
+    fname = os.path.join(str(tmp_path_factory.mktemp('prof')), '6901234_prof.nc')
+    synthetic.profile_file(fname, n_prof=30, n_history=6, corrupt=0.05)
+    return fname
@@ -0,0 +1,60 @@
+# -*coding: UTF-8 -*-
+__author__ = 'guillaumemaze'
+
+import os
+import shutil
+import pytest
+from pyargo import cache, history, extract
+
+@pytest.fixture
+def fname(tmp_path, prof_file):
+    f = str(tmp_path / 'prof.nc')
+    shutil.copy(prof_file, f)
+    return f
+
+def _no_decoding(*args, **kwargs):
+    raise AssertionError("The file should not be decoded")
+
+def test_second_call_from_cache(tmp_path, fname, monkeypatch):
+    store = str(tmp_path / 'history.sqlite')
+    df = cache.file_history(fname, store=store)
+    expected = history.to_frame(history.open_history(fname))
+    assert df.drop(columns='HISTORY_QCTEST_IDS').equals(expected.drop(columns='HISTORY_QCTEST_IDS'))
+    monkeypatch.setattr(history, 'open_history', _no_decoding)
+    cached = cache.file_history(fname, store=store)
+    assert cached.drop(columns='HISTORY_QCTEST_IDS').equals(df.drop(columns='HISTORY_QCTEST_IDS'))
+    assert list(cached['HISTORY_QCTEST_IDS'].astype(str)) == list(df['HISTORY_QCTEST_IDS'].astype(str))
+
+def test_mtime_invalidates(tmp_path, fname):
+    store = str(tmp_path / 'history.sqlite')
+    cache.file_history(fname, store=store)
+    assert cache.get(fname, store=store) is not None
+    st = os.stat(fname)
+    os.utime(fname, (st.st_atime, st.st_mtime + 10))
+    assert cache.get(fname, store=store) is None
+    cache.file_history(fname, store=store)
+    assert cache.get(fname, store=store) is not None
+
+def test_profiles_and_eviction(tmp_path, fname):
+    store = str(tmp_path / 'history.sqlite')
+    pf, df = cache.profiles_history(fname, store=store, profiles=slice(10, 20))
+    assert list(pf['N_PROF']) == list(range(10, 20))
+    assert cache.get(fname, store=store) is None
+    assert cache.get(fname, store=store, profiles=slice(10, 20)) is not None
+    cache.file_history(fname, store=store, max_size=1)
+    assert cache.get(fname, store=store, profiles=slice(10, 20)) is None
+    cache.clear(store)
+    assert cache.get(fname, store=store) is None
+
+def test_extract_through_cache(tmp_path, fname):
+    store = str(tmp_path / 'history.sqlite')
+    expected = extract.file_history(fname)
+    assert extract.file_history(fname, cache=store).equals(expected)
+    assert extract.file_history(fname, cache=store).equals(expected)
+
+def test_format_profiles_from_cache(tmp_path, fname):
+    store = str(tmp_path / 'history.sqlite')
+    ds = history.open_history(fname)
+    expected = list(history.format_profiles(ds, verb=1))
+    pf, df = cache.profiles_history(fname, store=store)
+    assert list(history.format_profiles(pf, verb=1, df=df)) == expected
@@ -0,0 +1,35 @@
+# -*coding: UTF-8 -*-
+__author__ = 'guillaumemaze'
+
+import os
+import pandas as pd
+from pyargo import cli, history
+
+def test_iter_tasks(gdac, prof_file, monkeypatch):
+    droot, ai = gdac
+    files = [os.path.join(droot, f) for f in ai['file']]
+    tasks = list(cli.iter_tasks(files + [prof_file], 'text', 0, False, 12))
+    assert [t[0] for t in tasks[:len(files)]] == files
+    assert [t[4] for t in tasks[:len(files)]] == [None] * len(files)
+    assert [t[4] for t in tasks[len(files):]] == [slice(0, 12), slice(12, 24), slice(24, 36)]
+
+    # Mono-profile files are not opened to count their profiles:
+    opened = []
+    monkeypatch.setattr(history, 'count_profiles', lambda fname: opened.append(fname) or 1)
+    assert len(list(cli.iter_tasks(files + [prof_file], 'text', 0, False, 12))) == len(files) + 1
+    assert opened == [prof_file]
+
+def test_show_history(prof_file, tmp_path):
+    whole, chunked = str(tmp_path / 'whole.txt'), str(tmp_path / 'chunked.txt')
+    assert cli.show_history([prof_file, '-v', '--chunk', '0', '-o', whole]) == 0
+    assert cli.show_history([prof_file, '-v', '--chunk', '7', '-o', chunked]) == 0
+    with open(whole) as f:
+        text = f.read()
+    with open(chunked) as f:
+        assert f.read() == text
+    assert text.count('PROFILE NUMBER:') == 30
+    assert ' since creation, ' in text
+    csv = str(tmp_path / 'history.csv')
+    assert cli.show_history([prof_file, '-f', 'csv', '--chunk', '7', '-o', csv]) == 0
+    assert sorted(pd.read_csv(csv)['N_PROF'].unique()) == list(range(30))
+    assert cli.show_history([str(tmp_path / 'missing.nc'), '-o', str(tmp_path / 'out.txt')]) == 1
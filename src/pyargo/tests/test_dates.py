@@ -0,0 +1,25 @@
+# -*coding: UTF-8 -*-
+__author__ = 'guillaumemaze'
+
+import numpy as np
+import pandas as pd
+from pyargo import dates
+
+def test_parse():
+    values = ['20230115123456', '19991231235959', '', '2023011512345', '20231315000000', '2023011512345x',
+              '20230115123456 ', None]
+    expected = pd.to_datetime(['2023-01-15 12:34:56', '1999-12-31 23:59:59'] + [None] * 4 +
+                              ['2023-01-15 12:34:56', None]).values
+    out = dates.parse(np.array(values, dtype=object))
+    assert out.dtype == np.dtype('datetime64[s]')
+    np.testing.assert_array_equal(out.astype('datetime64[ns]'), expected)
+    np.testing.assert_array_equal(dates.parse(np.array(values[:2], dtype='S14')), out[:2])
+    np.testing.assert_array_equal(dates.parse(np.array([u'20230115123456\xe9'], dtype=object)),
+                                  np.array(['NaT'], dtype='datetime64[s]'))
+
+def test_parse_character_array():
+    chars = np.array([list('20230115123456'), list('20240229000000'), list(' ' * 14)], dtype='S1')
+    out = dates.parse(chars)
+    assert out.shape == (3,)
+    assert list(out.astype(str)) == ['2023-01-15T12:34:56', '2024-02-29T00:00:00', 'NaT']
+    assert np.isnat(dates.parse(['20230229000000'])[0])
@@ -0,0 +1,53 @@
+# -*coding: UTF-8 -*-
+__author__ = 'guillaumemaze'
+
+import os
+import glob
+import shutil
+from pyargo import extract
+
+def _extract(gdac, store, **kwargs):
+    droot, ai = gdac
+    return extract.extract(ai[['file']], droot, store, num_cores=2, **kwargs)
+
+def test_extract(gdac, tmp_path):
+    droot, ai = gdac
+    store = str(tmp_path / 'store')
+    errors = _extract(gdac, store, batch=30)
+    assert len(errors) == 0
+    df = extract.read(store)
+    assert list(df.columns) == extract.COLUMNS
+    assert sorted(df['file'].unique()) == sorted(ai['file'])
+    assert extract.done_files(store) == set(ai['file'])
+    assert len(glob.glob(os.path.join(store, 'part-*.parquet'))) > 1
+    first = extract.file_history(ai['file'].iloc[0], droot)
+    assert len(df[df['file'] == ai['file'].iloc[0]]) == len(first)
+
+def test_restart_after_interruption(gdac, tmp_path):
+    droot, ai = gdac
+    store = str(tmp_path / 'store')
+    _extract(gdac, store, batch=30)
+    n = len(extract.read(store))
+    parts = sorted(glob.glob(os.path.join(store, 'part-*.parquet')))
+    # Interrupted between the part and its listing:
+    orphan = os.path.join(store, 'part-%05i.parquet' % len(parts))
+    shutil.copy(parts[0], orphan)
+    open(os.path.join(store, '_part-99999.files.tmp'), 'w').close()
+    assert len(extract.read(store)) == n
+    assert len(_extract(gdac, store)) == 0
+    assert not os.path.exists(orphan)
+    assert not glob.glob(os.path.join(store, '*.tmp'))
+    df = extract.read(store)
+    assert len(df) == n
+    assert not df.duplicated(['file', 'N_PROF', 'N_HISTORY']).any()
+
+def test_remove_and_update(gdac, tmp_path):
+    droot, ai = gdac
+    store = str(tmp_path / 'store')
+    _extract(gdac, store)
+    removed = list(ai['file'][:3])
+    extract.remove(store, removed)
+    assert not extract.done_files(store).intersection(removed)
+    assert not extract.read(store)['file'].isin(removed).any()
+    assert len(_extract(gdac, store)) == 0
+    assert sorted(extract.read(store, columns=['file'])['file'].unique()) == sorted(ai['file'])
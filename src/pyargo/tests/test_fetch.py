@@ -0,0 +1,65 @@
+# -*coding: UTF-8 -*-
+__author__ = 'guillaumemaze'
+
+import os
+import threading
+import pandas as pd
+import pytest
+from pyargo import fetch
+
+http_server = pytest.importorskip('http.server')
+
+@pytest.fixture
+def host(tmp_path):
+    """URL of a local HTTP server standing in for a GDAC, serving 6 files of 1000 bytes"""
+    files = ['aoml/%i/profiles/R%i_001.nc' % (wmo, wmo) for wmo in range(1900001, 1900007)]
+    for k, f in enumerate(files):
+        fname = os.path.join(str(tmp_path), 'gdac', 'dac', f)
+        os.makedirs(os.path.dirname(fname))
+        with open(fname, 'wb') as fid:
+            fid.write(bytes([k]) * 1000)
+
+    class Handler(http_server.SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            kwargs['directory'] = os.path.join(str(tmp_path), 'gdac')
+            http_server.SimpleHTTPRequestHandler.__init__(self, *args, **kwargs)
+
+        def log_message(self, *args):
+            pass
+    server = http_server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield 'http://127.0.0.1:%i' % server.server_address[1], pd.DataFrame({'file': files})
+    server.shutdown()
+    server.server_close()
+
+def test_fetch(host, tmp_path):
+    link, ai = host
+    cachedir = str(tmp_path / 'cache')
+    paths, errors = fetch.fetch(ai.iloc[:2], host=link, cachedir=cachedir, num_workers=2)
+    assert len(errors) == 0 and list(paths.index) == [0, 1]
+    with open(paths[1], 'rb') as f:
+        assert f.read() == b'\x01' * 1000
+    missing = pd.DataFrame({'file': ['aoml/1/profiles/R1_001.nc']})
+    paths, errors = fetch.fetch(missing, host=link, cachedir=cachedir, retries=0)
+    assert len(paths) == 0 and 'HTTP error 404' in errors[0]
+
+def test_fetch_over_budget(host, tmp_path):
+    link, ai = host
+    cachedir, droot = str(tmp_path / 'cache'), str(tmp_path / 'local')
+    fetch.fetch(ai.iloc[:2], host=link, cachedir=cachedir, max_size=2500)
+    # A subset larger than the cache is kept whole, older files are evicted:
+    subset = ai.iloc[2:]
+    errors = fetch.sync(subset, droot, host=link, cachedir=cachedir, max_size=2500)
+    assert len(errors) == 0
+    for f in subset['file']:
+        assert os.path.getsize(os.path.join(droot, f)) == 1000
+    paths, errors = fetch.fetch(ai, host=link, cachedir=cachedir, max_size=2500)
+    assert all(os.path.exists(p) for p in paths)
+    objects = [f for d, s, fs in os.walk(os.path.join(cachedir, 'objects')) for f in fs]
+    assert len(objects) == len(ai)
+    # Once a smaller subset is fetched, the cache is back under max_size:
+    fetch.fetch(ai.iloc[:1], host=link, cachedir=cachedir, max_size=2500)
+    objects = [f for d, s, fs in os.walk(os.path.join(cachedir, 'objects')) for f in fs]
+    assert len(objects) == 2
@@ -0,0 +1,93 @@
+# -*coding: UTF-8 -*-
+__author__ = 'guillaumemaze'
+
+import numpy as np
+import pytest
+from pyargo import history
+
+netCDF4 = pytest.importorskip('netCDF4')
+
+@pytest.fixture
+def hdf5_file(tmp_path, prof_file):
+    """Copy of the multi-profile file in the netCDF4/HDF5 format"""
+    fname = str(tmp_path / 'hdf5_prof.nc')
+    with netCDF4.Dataset(prof_file) as src, netCDF4.Dataset(fname, 'w', format='NETCDF4') as dst:
+        for name, dim in src.dimensions.items():
+            dst.createDimension(name, None if dim.isunlimited() else len(dim))
+        for name, v in src.variables.items():
+            attrs = dict((k, v.getncattr(k)) for k in v.ncattrs())
+            out = dst.createVariable(name, v.dtype, v.dimensions, fill_value=attrs.pop('_FillValue', None))
+            out.setncatts(attrs)
+            out[...] = v[...]
+    return fname
+
+def test_engine(monkeypatch, prof_file, hdf5_file):
+    assert history._engine(None, prof_file) == 'netcdf4'
+    assert history._engine('xarray', prof_file) == 'xarray'
+    monkeypatch.setattr(history, 'netCDF4', None)
+    assert history._engine(None, prof_file) == 'xarray'
+    if history.h5netcdf is not None:
+        assert history._engine(None, hdf5_file) == 'h5netcdf'
+
+@pytest.mark.parametrize('engine', ['netcdf4', 'h5netcdf', 'xarray'])
+def test_open_history_engines(prof_file, hdf5_file, engine):
+    if engine == 'h5netcdf':
+        pytest.importorskip('h5netcdf')
+        fname = hdf5_file
+    else:
+        fname = prof_file
+    expected = history.to_frame(history.open_history(prof_file, engine='netcdf4'))
+    df = history.to_frame(history.open_history(fname, engine=engine))
+    assert df.drop(columns='HISTORY_QCTEST_IDS').equals(expected.drop(columns='HISTORY_QCTEST_IDS'))
+    assert history.count_profiles(fname, engine=engine) == 30
+
+def test_to_frame(prof_file):
+    ds = history.open_history(prof_file)
+    df = history.to_frame(ds)
+    assert len(df) == 30 * len(ds['N_HISTORY'])
+    assert df['HISTORY_DATE'].dtype.kind == 'M'
+    kept = history.to_frame(ds, drop_empty=True)
+    assert len(kept) == len(history.drop_empty_entries(df)) <= len(df)
+    assert ((kept[history.HISTORY_STRINGS] != '').any(axis=1) | kept['HISTORY_DATE'].notnull()).all()
+    # A slice of profiles decodes like the same rows of the whole file:
+    part = history.to_frame(history.open_history(prof_file, profiles=slice(10, 20)))
+    assert list(part['N_PROF'].unique()) == list(range(10, 20))
+    expected = df[(df['N_PROF'] >= 10) & (df['N_PROF'] < 20)].reset_index(drop=True)
+    assert part.drop(columns='HISTORY_QCTEST_IDS').equals(expected.drop(columns='HISTORY_QCTEST_IDS'))
+    ds.close()
+
+def test_format_profiles(prof_file):
+    ds = history.open_history(prof_file)
+    texts = list(history.format_profiles(ds, verb=1))
+    assert [i for i, text in texts] == list(range(30))
+    assert texts[4][1] == history.format_profile(ds, 4, verb=1)
+    df = history.to_frame(ds)
+    pf = history.profile_frame(ds)
+    assert list(history.format_profiles(pf, verb=1, df=df)) == texts
+    assert texts[0][1].startswith("    PROFILE NUMBER: 0\n")
+    ds.close()
+
+def test_format_qctest(prof_file):
+    ds = history.open_history(prof_file)
+    df = history.to_frame(ds)
+    ds.close()
+    entry = df[df['N_PROF'] == 0].iloc[:1].copy()
+    for qctest, shown in [('1B2', "QCTEST: '1B2' > 1, 4, 5, 7, 8"), ('0000', None), ('', None),
+                          ('zz', "Unexpected error when decoding QCTEST='zz'")]:
+        entry['HISTORY_QCTEST'] = qctest
+        entry['HISTORY_QCTEST_IDS'] = [history._decode_qctests(np.array([qctest], dtype=object))[0]]
+        text = history.format_history(entry, 0, verb=1)
+        missing = [line for line in text.splitlines() if 'Missing:' in line]
+        if shown is None:
+            assert 'QCTEST:' not in text and 'QCTEST' in missing[0]
+        else:
+            assert shown in text and not any('QCTEST' in line for line in missing)
+
+def test_delta_format():
+    td = np.timedelta64
+    assert history.delta_format(td(1, 'D') + td(17, 'h') + td(9, 'm')) == '+1 Days 17H 9'
+    assert history.delta_format(-td(3, 'h')) == '-3H00'
+    assert history.delta_format(td(5, 'm')) == '+5 Mins'
+    assert history.delta_format(td('NaT')) == 'NaT'
+    out = history.delta_format(np.array([td(5, 'm'), td('NaT')], dtype='timedelta64[ns]'))
+    assert list(out) == ['+5 Mins', 'NaT']
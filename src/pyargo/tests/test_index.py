@@ -0,0 +1,201 @@
+# -*coding: UTF-8 -*-
+__author__ = 'guillaumemaze'
+
+import os
+import time
+import numpy as np
+import pandas as pd
+import pytest
+from pyargo import index, synthetic
+
+IFILE = "argo_profile_detailled_index.txt"
+
+@pytest.fixture
+def droot(tmp_path):
+    synthetic.index_file(str(tmp_path / IFILE), 500)
+    return str(tmp_path)
+
+def _mapped(a):
+    while a is not None:
+        if isinstance(a, np.memmap):
+            return True
+        a = getattr(a, 'base', None)
+    return False
+
+def test_read(droot):
+    ai = index.read(os.path.join(droot, IFILE))
+    assert list(ai.columns) == index.COLUMNS
+    assert len(ai) == 500
+    assert ai['date'].dtype.kind == 'M'
+    sub = index.read(os.path.join(droot, IFILE), columns=['file', 'date'], box=[-60., 0., 0., 60.], chunksize=77)
+    assert list(sub.columns) == ['file', 'date']
+    expected = ai[(ai.longitude >= -60) & (ai.longitude <= 0) & (ai.latitude >= 0) & (ai.latitude <= 60)]
+    assert list(sub['file']) == list(expected['file'])
+
+def test_cache(droot, tmp_path):
+    cachedir = str(tmp_path / 'cache')
+    os.makedirs(cachedir)
+    ai = index.load(droot, IFILE, cachedir=cachedir)
+    store = index.cache_path(droot, IFILE, cachedir)
+    assert os.path.isfile(os.path.join(store, 'file.categories.txt'))
+    assert not os.path.exists(os.path.join(store, 'file.categories.npy'))
+    cached = index.load(droot, IFILE, cachedir=cachedir)
+    pd.testing.assert_frame_equal(cached, ai)
+    assert _mapped(cached['latitude'].values)
+    assert _mapped(cached['date'].values)
+    assert not _mapped(index.load(droot, IFILE, cachedir=cachedir, mmap=False)['latitude'].values)
+    columns = index.load(droot, IFILE, cachedir=cachedir, columns=['file', 'latitude'], categorical=True)
+    assert list(columns.columns) == ['file', 'latitude']
+    assert isinstance(columns['file'].dtype, pd.CategoricalDtype)
+
+def test_cache_categories_roundtrip(tmp_path):
+    ai = pd.DataFrame({'s': np.array([u'a', u'', None, u'\xe9t\xe9', u'a'], dtype=object),
+                       'x': np.arange(5, dtype=np.float32)})
+    store = str(tmp_path / 'store')
+    index.to_cache(ai, store)
+    out = index.from_cache(store)
+    assert list(out['s'].fillna('NaN')) == [u'a', u'', u'NaN', u'\xe9t\xe9', u'a']
+    assert out['x'].dtype == np.float32
+
+def test_split_file():
+    files = ['aoml/1900001/profiles/R1900001_001.nc', 'coriolis/6901234/profiles/BD6901234_123D.nc',
+             'x/12/profiles/R12_001.nc.gz', 'x/12/profile/R12_001.nc', 'nofile']
+    expected = pd.Series(files).str.extract(index.FILE_PATTERN)
+    pd.testing.assert_frame_equal(index.split_file(files), expected)
+    pd.testing.assert_frame_equal(index.split_file(pd.Categorical(files)), expected)
+    assert list(index.split_file(files).iloc[1]) == ['coriolis', '6901234', 'BD', '123', 'D']
+
+def test_compact(droot):
+    ai = index.read(os.path.join(droot, IFILE))
+    ci = index.to_compact(ai)
+    assert list(ci.columns[:5]) == index.FILE_COLUMNS
+    assert ci['wmo'].dtype == np.int32
+    assert isinstance(ci['dac'].dtype, pd.CategoricalDtype)
+    back = index.from_compact(ci)
+    assert list(back['file']) == list(ai['file'])
+    pd.testing.assert_frame_equal(back[['date', 'latitude']], ai[['date', 'latitude']])
+    # Paths that file_path would not rebuild identically (leading zeros, other wmo) are kept:
+    for f in ['aoml/01900001/profiles/R01900001_001.nc', 'aoml/1900001/profiles/R1900002_001.nc',
+              'aoml/1900001/profiles/R1900001_01.nc']:
+        odd = pd.DataFrame({'file': [ai['file'][0], f]})
+        assert list(index.to_compact(odd).columns) == ['file']
+        assert list(index.from_compact(index.to_compact(odd))['file']) == [ai['file'][0], f]
+
+def test_load_compact(droot, tmp_path):
+    cachedir = str(tmp_path / 'cache')
+    os.makedirs(cachedir)
+    ci = index.load(droot, IFILE, cachedir=cachedir, compact=True)
+    store = os.path.join(index.cache_path(droot, IFILE, cachedir), 'compact')
+    assert index.cache_meta(store) is not None
+    cached = index.load(droot, IFILE, cachedir=cachedir, compact=True)
+    assert _mapped(cached['wmo'].values)
+    pd.testing.assert_frame_equal(index.from_compact(cached), index.from_compact(ci))
+    columns = index.load(droot, IFILE, cachedir=cachedir, compact=True, columns=['file', 'date'])
+    assert list(columns.columns) == index.FILE_COLUMNS + ['date']
+    # The compact cache is rebuilt with the index cache:
+    with open(os.path.join(droot, IFILE), 'a') as f:
+        f.write(" ")
+    assert index.cache_meta(store) is not None
+    index.load(droot, IFILE, cachedir=cachedir, compact=True)
+    assert index.cache_meta(store)['source'] == index.cache_meta(os.path.dirname(store))['source']
+
+def _row_wmo(row):
+    return row['wmo']
+
+def _row_fail(row):
+    if row['wmo'] % 3 == 0:
+        raise ValueError("bad row")
+    return row['wmo']
+
+def _row_slow(row):
+    # Later rows are done first, so that chunks come back out of order
+    time.sleep(0.002 * (20 - row['wmo']))
+    return row['wmo']
+
+def _row_frame(row):
+    return pd.DataFrame({'wmo': [row['wmo']] * 2, 'n': [0, 1]})
+
+def _rows(n=20):
+    return pd.DataFrame({'wmo': np.arange(n)}, index=np.arange(n)[::-1] * 10)
+
+@pytest.mark.parametrize('backend', ['thread', 'process'])
+def test_par_traverse(backend):
+    ai = _rows()
+    results, errors = index.par_traverse(ai, _row_wmo, num_cores=2, chunksize=3, backend=backend)
+    assert list(results.index) == list(ai.index)
+    assert list(results) == list(ai['wmo'])
+    assert len(errors) == 0
+
+@pytest.mark.parametrize('backend', ['thread', 'process'])
+def test_par_traverse_errors(backend):
+    ai = _rows()
+    results, errors = index.par_traverse(ai, _row_fail, num_cores=2, chunksize=4, backend=backend)
+    failed = ai['wmo'] % 3 == 0
+    assert list(results.index) == list(ai.index[~failed])
+    assert list(results) == list(ai['wmo'][~failed])
+    assert list(errors.index) == list(ai.index[failed])
+    assert all('ValueError: bad row' in e for e in errors)
+
+def test_par_traverse_order():
+    ai = _rows()
+    order = [i for i, _, _ in index.iter_traverse(ai, _row_slow, num_cores=4, chunksize=1, backend='thread')]
+    assert sorted(order) == sorted(ai.index) and order != list(ai.index)
+    results, errors = index.par_traverse(ai, _row_slow, num_cores=4, chunksize=1, backend='thread')
+    assert list(results.index) == list(ai.index)
+    assert list(results) == list(ai['wmo'])
+
+def test_par_traverse_frames():
+    ai = _rows(5)
+    results, errors = index.par_traverse(ai, _row_frame, num_cores=2, chunksize=2, backend='thread')
+    assert list(results.index) == list(ai.index)
+    assert all(isinstance(r, pd.DataFrame) for r in results)
+    out = pd.concat(list(results), ignore_index=True)
+    assert list(out['wmo']) == list(np.repeat(ai['wmo'], 2))
+    assert len(errors) == 0
+
+def test_diff():
+    old = pd.DataFrame({'file': ['a', 'b', 'c', 'd'], 'date_update': pd.to_datetime(
+        ['2020-01-01', '2020-01-02', 'NaT', '2020-01-04'])})
+    new = pd.DataFrame({'file': ['b', 'c', 'd', 'e'], 'date_update': pd.to_datetime(
+        ['2020-01-02', 'NaT', '2021-06-01', '2021-06-02'])})
+    added, modified, removed = index.diff(old, new)
+    assert list(added['file']) == ['e']
+    assert list(modified['file']) == ['d']
+    assert modified['date_update'].iloc[0] == pd.Timestamp('2021-06-01')
+    assert list(removed['file']) == ['a']
+
+def test_refresh(tmp_path):
+    droot, cachedir = str(tmp_path), str(tmp_path)
+    fname = os.path.join(droot, IFILE)
+    df = synthetic.index_frame(600)
+    synthetic._write_index(fname, df.iloc[:500])
+    ai, added, modified, removed = index.refresh(droot, IFILE, cachedir=cachedir, check='hash')
+    assert len(ai) == 500 and len(added) == 500 and len(modified) == 0 and len(removed) == 0
+
+    # Unchanged source: read from the cache, nothing changed
+    ai, added, modified, removed = index.refresh(droot, IFILE, cachedir=cachedir, check='hash')
+    assert len(ai) == 500 and len(added) == 0 and len(modified) == 0 and len(removed) == 0
+    assert _mapped(ai['latitude'].values)
+
+    new = df.iloc[100:].copy()
+    new.loc[200:209, 'date_update'] = '20200101000000'
+    synthetic._write_index(fname, new)
+    ai, added, modified, removed = index.refresh(droot, IFILE, cachedir=cachedir, check='hash')
+    assert len(ai) == 500
+    assert list(added['file']) == list(df['file'].iloc[500:])
+    assert list(modified['file']) == list(df['file'].iloc[200:210])
+    assert list(removed['file']) == list(df['file'].iloc[:100])
+    pd.testing.assert_frame_equal(index.load(droot, IFILE, cachedir=cachedir), ai)
+
+def test_read_empty(droot, monkeypatch):
+    fname = os.path.join(droot, IFILE)
+    ai = index.read(fname)
+    empty = index.read(fname, compact=True, box=[0., 1., 89.99, 90.])
+    assert len(empty) == 0
+    pd.testing.assert_series_equal(empty.dtypes, index.to_compact(ai.iloc[:0]).dtypes)
+    assert isinstance(empty['dac'].dtype, pd.CategoricalDtype)
+    # No chunk at all:
+    monkeypatch.setattr(index, 'iter_read', lambda *args, **kwargs: iter([]))
+    pd.testing.assert_series_equal(index.read(fname).dtypes, ai.dtypes)
+    pd.testing.assert_series_equal(index.read(fname, compact=True).dtypes, empty.dtypes)
+    assert list(index.read(fname, columns=['file', 'date']).columns) == ['file', 'date']
@@ -0,0 +1,50 @@
+# -*coding: UTF-8 -*-
+__author__ = 'guillaumemaze'
+
+import pandas as pd
+from pyargo import latency
+
+def _history():
+    """History table of two profiles of two floats (see extract.read)"""
+    t = pd.Timestamp('2020-01-01')
+    day = pd.Timedelta('1D')
+    return pd.DataFrame({'file': ['aoml/1900001/profiles/R1900001_001.nc'] * 3 +
+                                 ['coriolis/6901234/profiles/D6901234_010.nc'] * 2,
+                         'N_PROF': [0] * 5,
+                         'N_HISTORY': [0, 1, 2, 0, 1],
+                         'JULD': [t] * 3 + [t + day] * 2,
+                         'DATE_CREATION': [t + day] * 3 + [t + 2 * day] * 2,
+                         'DATE_UPDATE': [t + 30 * day] * 3 + [t + 400 * day] * 2,
+                         'HISTORY_INSTITUTION': ['', 'AO', 'AO', 'IF', 'IF'],
+                         'HISTORY_STEP': ['ARFM', 'ARGQ', 'ARUP', 'ARFM', 'ARSQ'],
+                         'HISTORY_DATE': [t + day, t + 2 * day, t + 3 * day, t + 2 * day, t + 300 * day]})
+
+def test_humanize():
+    td = pd.to_timedelta(['3 days 04:05:59', '-04:05:00', '00:05:00', '00:00:00', None]).values
+    assert list(latency.humanize(td)) == ['+3 days 04h05', '-04h05', '+5 mins', '+0 mins', 'NaT']
+
+def test_profile_lags():
+    df = _history()
+    lags = latency.profile_lags(df)
+    assert len(lags) == 2
+    assert list(lags['dac']) == ['aoml', 'coriolis']
+    assert list(lags['institution']) == ['AO', 'IF']
+    day = pd.Timedelta('1D')
+    assert list(lags['measurement_to_creation']) == [day, day]
+    assert lags['ARGQ_to_ARUP'][0] == day and pd.isnull(lags['ARGQ_to_ARUP'][1])
+    assert lags['measurement_to_ARSQ'][1] == 299 * day and pd.isnull(lags['ARSQ'][0])
+    summary = latency.summarize(lags, by='dac', columns=['measurement_to_ARSQ'])
+    assert list(summary[('measurement_to_ARSQ', 'count')]) == [0, 1]
+    entries = latency.entry_lags(df)
+    assert list(entries['creation_to_history']) == list(df['HISTORY_DATE'] - df['DATE_CREATION'])
+
+def test_index_lags():
+    t = pd.Timestamp('2020-01-01')
+    ai = pd.DataFrame({'file': ['aoml/1900001/profiles/R1900001_001.nc',
+                                'coriolis/6901234/profiles/D6901234_010.nc'],
+                       'date': [t, t], 'date_update': [t + pd.Timedelta('2D'), t + pd.Timedelta('3h')],
+                       'institution': ['AO', 'IF']})
+    lags = latency.index_lags(ai)
+    assert list(lags['wmo'].astype(int)) == [1900001, 6901234]
+    assert list(lags['measurement_to_update']) == [pd.Timedelta('2D'), pd.Timedelta('3h')]
+    assert 'measurement_to_gdac' not in lags
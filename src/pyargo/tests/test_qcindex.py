@@ -0,0 +1,73 @@
+# -*coding: UTF-8 -*-
+__author__ = 'guillaumemaze'
+
+import numpy as np
+import pandas as pd
+import pytest
+from pyargo import history, qcindex, synthetic
+
+VALUES = ['1B2', 'A0', '0x1F', '0X1f', '+1F', '+0x1f', ' 1b2 ', 'ffffffffffffffff', '0', 'zz', '1F 2', '0x', '+']
+
+def _scalar(value):
+    try:
+        return history.decodeqctest(value, hexa=True)
+    except ValueError:
+        return None
+
+def test_decodeqctests_agrees_with_decodeqctest():
+    bits = history.decodeqctests(VALUES)
+    for value, row in zip(VALUES, bits):
+        expected = _scalar(value)
+        if expected is None:
+            assert np.ma.getmaskarray(row).all(), value
+        else:
+            assert list(np.nonzero(row.filled(False))[0]) == expected, value
+
+def test_decodeqctests_packed():
+    values = history.decodeqctests(['1B2', 'A0', 'zz', ''], packed=True)
+    assert list(values.filled(0)) == [434, 160, 0, 0]
+    assert list(np.ma.getmaskarray(values)) == [False, False, True, False]
+    assert history.decodeqctests(np.array([['0x1', 'x']]), packed=True).shape == (1, 2)
+
+def test_build_and_select():
+    df = pd.DataFrame({'file': ['a', 'a', 'b', 'b'], 'N_PROF': [0, 0, 0, 0],
+                       'HISTORY_ACTION': ['QCP$', 'QCF$', 'QCP$', 'QCF$'],
+                       'HISTORY_QCTEST': ['1B2', 'A0', '0x6', 'zz']})
+    qi = qcindex.build(df)
+    assert list(qi['file']) == ['a', 'b']
+    assert list(qi['QCP']) == [434, 6]
+    assert list(qi['QCF']) == [160, 0]
+    assert list(qi['QCERR']) == [0, 1]
+    assert list(qcindex.failed(qi, [5, 7], how='all')['file']) == ['a']
+    assert list(qcindex.performed(qi, 1)['file']) == ['a', 'b']
+    with pytest.raises(ValueError):
+        qcindex.failed(qi, 5, how='some')
+
+def test_build_from_files(gdac):
+    droot, df = gdac
+    qi = qcindex.build_from_files(df['file'], droot, num_cores=2)
+    assert sorted(qi['file']) == sorted(df['file'])
+    with pytest.raises(IOError):
+        qcindex.build_from_files(list(df['file'][:2]) + ['missing/1/profiles/R1_001.nc'], droot, num_cores=2)
+
+def test_select_out_of_range():
+    qi = qcindex.build(pd.DataFrame({'file': ['a'], 'N_PROF': [0], 'HISTORY_ACTION': ['QCF$'],
+                                     'HISTORY_QCTEST': ['8000000000000000']}))
+    assert list(qcindex.failed(qi, 63)['file']) == ['a']
+    for t in [64, -1]:
+        with pytest.raises(ValueError):
+            qcindex.failed(qi, [1, t])
+
+def test_save_load(tmp_path):
+    pytest.importorskip('pyarrow')
+    df = pd.DataFrame({'file': ['a', 'b'], 'N_PROF': [0, 1], 'HISTORY_ACTION': ['QCP$', 'QCF$'],
+                       'HISTORY_QCTEST': ['ffffffffffffffff', 'zz']})
+    qi = qcindex.build(df)
+    store = str(tmp_path / 'qcindex.parquet')
+    qcindex.save(qi, store)
+    pd.testing.assert_frame_equal(qcindex.load(store), qi)
+
+def test_synthetic_corrupt_qctests():
+    entries = synthetic.history_entries(n_prof=200, corrupt=1., rng=np.random.RandomState(1))
+    qctest = entries['HISTORY_QCTEST'][1:3].ravel()
+    assert np.ma.getmaskarray(history.decodeqctests(qctest, packed=True)).all()
@@ -0,0 +1,31 @@
+# -*coding: UTF-8 -*-
+__author__ = 'guillaumemaze'
+
+import numpy as np
+import pandas as pd
+from pyargo import extract, history, ragged
+
+def test_build(gdac, tmp_path):
+    droot, ai = gdac
+    store = str(tmp_path / 'history.nc')
+    errors = ragged.build(ai[['file']], droot, store, batch=5, num_cores=1)
+    assert len(errors) == 0
+    df = history.read_ragged(store)
+    assert sorted(df['file'].unique()) == sorted(ai['file'])
+    f = ai['file'].iloc[3]
+    expected = extract.file_history(f, droot)
+    got = history.read_ragged(store, file=f)
+    assert len(got) == len(expected)
+    # Dates of one second resolution come back exactly (not off by a few hundreds of nanoseconds):
+    columns = ['N_PROF', 'N_HISTORY', 'HISTORY_DATE', 'DATE_CREATION', 'DATE_UPDATE']
+    pd.testing.assert_frame_equal(got[columns].reset_index(drop=True), expected[columns].reset_index(drop=True),
+                                  check_dtype=False)
+    assert len(history.read_ragged(store, wmo=f.split('/')[1])) >= len(got)
+
+def test_julian_dates():
+    dates = np.arange(np.datetime64('1990-01-01T00:00:00', 's'), np.datetime64('2030-01-01', 's'),
+                      3607 * 13).astype('datetime64[ns]')
+    days = ragged._to_julian(np.concatenate([dates, [np.datetime64('NaT')]]))
+    back = history._from_julian(days, unit='s')
+    assert (back[:-1] == dates).all() and np.isnat(back[-1])
+    assert np.isnat(history._from_julian(np.array([np.nan]))[0])
@@ -0,0 +1,23 @@
+# -*coding: UTF-8 -*-
+__author__ = 'guillaumemaze'
+
+import numpy as np
+import pandas as pd
+from pyargo import reftable
+
+def test_decode():
+    assert reftable.decode('ARSQ', 12) == reftable.TABLE12['ARSQ']
+    assert reftable.decode(np.array(b'ARGQ'), 12) == reftable.table12(b'ARGQ  ')
+    assert reftable.decode('', 12) == "Empty string!"
+    assert reftable.decode('ZZZZ', 7) == "Unknown code for table 7!"
+    codes = pd.Series([b'ARSQ', b'ARGQ', b'ARSQ', None], index=[3, 4, 5, 6], name='HISTORY_STEP')
+    out = reftable.decode(codes, 12)
+    assert list(out.index) == [3, 4, 5, 6] and out.name == 'HISTORY_STEP'
+    assert list(out[:3]) == [reftable.TABLE12['ARSQ'], reftable.TABLE12['ARGQ'], reftable.TABLE12['ARSQ']]
+    assert pd.isnull(out[6])
+
+def test_encode():
+    for table in [4, 7, 12]:
+        codes = sorted(reftable.TABLES[table])
+        assert list(reftable.encode(reftable.decode(np.array(codes, dtype=object), table), table)) == codes
+    assert reftable.encode('unknown description', 12) is None
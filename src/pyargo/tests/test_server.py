@@ -0,0 +1,55 @@
+# -*coding: UTF-8 -*-
+__author__ = 'guillaumemaze'
+
+import os
+import sys
+import subprocess
+import threading
+import pytest
+from pyargo import client, index
+
+server = pytest.importorskip('pyargo.server')
+pytest.importorskip('pyarrow')
+
+@pytest.fixture(scope='module')
+def url(gdac):
+    droot, ai = gdac
+    httpd = server.make_server(server.Service(index.to_compact(ai), droot=droot, cache=None), port=0)
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield 'http://127.0.0.1:%i' % httpd.server_address[1]
+    httpd.shutdown()
+    httpd.server_close()
+
+def test_queries(gdac, url):
+    droot, ai = gdac
+    assert client.info(url=url)['nrows'] == len(ai)
+    rows = client.select(url=url, box=[-180, 180, -90, 90], columns=['file', 'date'])
+    assert list(rows.columns) == ['file', 'date']
+    assert sorted(rows['file']) == sorted(ai['file'])
+    f = ai['file'].iloc[0]
+    assert set(client.history(file=f, url=url)['file']) == set([f])
+    assert set(client.history(wmo=f.split('/')[1], url=url)['file']) == set(ai['file'][ai['file'].str.contains(
+        '/%s/' % f.split('/')[1])])
+    with pytest.raises(client.QueryError):
+        client.query('radius', url=url, lon=0.)
+
+def test_client_without_pyarrow(url, monkeypatch):
+    monkeypatch.setattr(client, 'pa', None)
+    assert client.info(url=url)['nrows'] > 0
+    with pytest.raises(ImportError):
+        client.select(url=url)
+
+def test_service_layout(gdac):
+    droot, ai = gdac
+    ci = index.to_compact(ai)
+    assert server.Service(ci, droot=droot).ai is ci
+    assert list(server.Service(ai, droot=droot).ai.columns) == list(ci.columns)
+    with pytest.raises(ValueError):
+        server.Service(ci.drop(columns=['wmo']), droot=droot)
+
+def test_client_import():
+    code = "import sys; from pyargo import client; sys.exit('pandas' in sys.modules)"
+    src = os.path.dirname(os.path.dirname(client.__file__))
+    assert subprocess.call([sys.executable, '-c', code], env={'PYTHONPATH': src}) == 0
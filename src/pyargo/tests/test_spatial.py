@@ -0,0 +1,46 @@
+# -*coding: UTF-8 -*-
+__author__ = 'guillaumemaze'
+
+import os
+import numpy as np
+import pandas as pd
+from pyargo import spatial
+
+def _index(n=3000, seed=1):
+    rng = np.random.RandomState(seed)
+    return pd.DataFrame({'longitude': rng.uniform(-180, 180, n).astype(np.float32),
+                         'latitude': rng.uniform(-80, 80, n).astype(np.float32),
+                         'date': np.datetime64('2010-01-01') + rng.randint(0, 12 * 365, n).astype('timedelta64[D]')})
+
+def test_box():
+    ai = _index()
+    si = spatial.build(ai, res=2.)
+    lon, lat = ai['longitude'].values, ai['latitude'].values
+    expected = np.nonzero((lon >= -60) & (lon <= -10) & (lat >= 0) & (lat <= 40))[0]
+    np.testing.assert_array_equal(spatial.box(si, [-60, -10, 0, 40]), expected)
+    # Box crossing the dateline:
+    expected = np.nonzero(((lon >= 170) | (lon <= -170)) & (lat >= -50) & (lat <= 50))[0]
+    np.testing.assert_array_equal(spatial.box(si, [170, -170, -50, 50]), expected)
+    # Box crossing the dateline with both ends in the same grid column, each row once:
+    expected = np.nonzero(((lon >= -86.5) | (lon <= -87.46)) & (lat >= 17.5) & (lat <= 27.9))[0]
+    np.testing.assert_array_equal(spatial.box(si, [-86.5, -87.46, 17.5, 27.9]), expected)
+    dates = ['2015-01-01', '2018-01-01']
+    d = ai['date'].values
+    expected = np.nonzero((lon >= -60) & (lon <= -10) & (lat >= 0) & (lat <= 40) &
+                          (d >= np.datetime64(dates[0])) & (d < np.datetime64(dates[1])))[0]
+    np.testing.assert_array_equal(spatial.box(si, [-60, -10, 0, 40], dates=dates), expected)
+
+def test_radius_and_nearest(tmp_path):
+    ai = _index()
+    fname = str(tmp_path / 'spatial.npz')
+    si = spatial.load_or_build(ai, fname, res=1.)
+    assert os.path.isfile(fname)
+    si = spatial.load_or_build(ai, fname, res=1.)
+    lon, lat = ai['longitude'].values.astype(np.float64), ai['latitude'].values.astype(np.float64)
+    d = spatial.distance(-30., 20., lon, lat)
+    rows, dist = spatial.radius(si, -30., 20., 1500.)
+    np.testing.assert_array_equal(np.sort(rows), np.nonzero(d <= 1500.)[0])
+    assert (np.diff(dist) >= 0).all()
+    rows, dist = spatial.nearest(si, -30., 20., k=5)
+    np.testing.assert_array_equal(rows, np.argsort(d, kind='mergesort')[:5])
+    np.testing.assert_allclose(dist, np.sort(d)[:5])
@@ -0,0 +1,32 @@
+# -*coding: UTF-8 -*-
+__author__ = 'guillaumemaze'
+
+import json
+from pyargo import stats
+
+def test_collect():
+    with stats.collect() as s:
+        stats.count('files_opened')
+        stats.count('bytes_read', 10)
+        with stats.stage('decode'):
+            with stats.stage('decode'):
+                pass
+    assert s['counters'] == {'files_opened': 1, 'bytes_read': 10}
+    assert s['timers']['decode']['calls'] == 2
+    if not stats.enabled():
+        # Off again after collect:
+        stats.reset()
+        stats.count('files_opened')
+        assert stats.report()['counters'] == {}
+
+def test_merge_and_write(tmp_path):
+    with stats.collect() as s:
+        stats.count('rows', 2)
+        stats.merge({'timers': {'read': {'calls': 3, 'seconds': 1.5}}, 'counters': {'rows': 5}})
+        fname = str(tmp_path / 'stats.json')
+        stats.write(fname)
+    assert s['counters']['rows'] == 7
+    with open(fname) as f:
+        saved = json.load(f)
+    assert saved['counters']['rows'] == 7 and saved['timers']['read']['calls'] == 3
+    assert 'rows' in stats.format_report(saved)
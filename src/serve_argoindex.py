@@ -0,0 +1,14 @@
+#!/usr/bin/env python
+# -*coding: UTF-8 -*-
+#
+# Run from a source tree, or install pyargo (pip install .) to get the serve_argoindex command
+#
+__author__ = 'guillaumemaze'
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from pyargo.cli import serve_index
+
+if __name__ == '__main__':
+    sys.exit(serve_index())